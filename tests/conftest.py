@@ -0,0 +1,30 @@
+"""Shared fixtures; the repository root is made importable, as the notebooks do."""
+import os
+import sys
+import pytest
+
+if os.path.dirname(os.path.dirname(os.path.abspath(__file__))) not in sys.path:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.synthetic import write_synthetic_universe
+
+
+@pytest.fixture
+def universe(tmp_path, monkeypatch):
+    """
+    Write a small synthetic universe and point stock_data_path at it.
+    
+    8 tickers of 300 daily bars with two planted pairs whose half-lives of
+    5-10 bars make them reliably detectable. The working directory is
+    tmp_path, so files the code under test saves there (e.g.
+    cointegrated_pairs.pkl) do not leak into the repository.
+    
+    Returns:
+        dict: 'file_path', 'tickers' and 'planted' pair table
+    """
+    file_path = str(tmp_path / 'stock_data.parquet')
+    tickers, planted = write_synthetic_universe(file_path, n_tickers=8, n_bars=300, n_pairs=2,
+                                                half_lives=(5.0, 10.0), seed=1)
+    monkeypatch.setenv('stock_data_path', file_path)
+    monkeypatch.chdir(tmp_path)
+    return {'file_path': file_path, 'tickers': tickers, 'planted': planted}
@@ -0,0 +1,33 @@
+"""batch_adfuller against statsmodels.tsa.stattools.adfuller."""
+import numpy as np
+import pytest
+from statsmodels.tsa.stattools import adfuller
+from utils.adf import batch_adfuller
+
+
+def _series(n_bars, seed):
+    """Random walks and stationary AR(1) series side by side, one per column."""
+    rng = np.random.default_rng(seed)
+    walks = np.cumsum(rng.normal(size=(n_bars, 4)), axis=0)
+    shocks = rng.normal(size=(n_bars, 4))
+    ar = np.zeros((n_bars, 4))
+    for t in range(1, n_bars):
+        ar[t] = 0.7 * ar[t - 1] + shocks[t]
+    return np.hstack([walks, ar])
+
+
+# statsmodels 0.15 warns that adfuller will return a result object
+@pytest.mark.filterwarnings('ignore::FutureWarning')
+@pytest.mark.parametrize('n_bars', [60, 250, 1000])
+@pytest.mark.parametrize('autolag', ['AIC', 'BIC', None])
+def test_batch_adfuller_matches_statsmodels(n_bars, autolag):
+    x = _series(n_bars, seed=n_bars)
+    options = {'autolag': autolag} if autolag else {'autolag': None, 'maxlag': 3}
+    got = batch_adfuller(x, **options)
+    expected = [adfuller(x[:, k], **options) for k in range(x.shape[1])]
+
+    # the tolerance stated in the batch_adfuller docstring
+    np.testing.assert_allclose(got['adf_statistic'], [e[0] for e in expected], rtol=1e-10)
+    np.testing.assert_allclose(got['pvalue'], [e[1] for e in expected], rtol=1e-10, atol=1e-14)
+    np.testing.assert_array_equal(got['usedlag'], [e[2] for e in expected])
+    np.testing.assert_array_equal(got['nobs'], [e[3] for e in expected])
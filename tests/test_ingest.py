@@ -0,0 +1,91 @@
+"""Incremental ingestion with the file-backed FileFetcher stand-in."""
+import numpy as np
+import pandas as pd
+import pytest
+from utils.ingest import FileFetcher, Fetcher, ingest, load_manifest
+from utils.io import load_data
+
+
+@pytest.fixture
+def source(universe):
+    """The synthetic universe with a Date index, as the fetcher serves it."""
+    df = pd.read_parquet(universe['file_path'], engine='fastparquet')
+    return df.assign(Date=pd.to_datetime(df['Date'])).set_index('Date')
+
+
+def _dataset(root):
+    """The ingested dataset with a Date index and the source's column order."""
+    df = load_data(root)
+    return df.assign(Date=pd.to_datetime(df['Date'])).set_index('Date').sort_index()
+
+
+def _ingest(universe, end):
+    """Refresh the 'dataset' directory from the universe file up to end (exclusive)."""
+    return ingest(universe['tickers'], root='dataset', fetcher=FileFetcher(universe['file_path']),
+                  start='2000-01-01', end=end, backoff=0.0)
+
+
+def test_ingest_moves_only_missing_bars(universe, source):
+    dates = source.index
+    first = _ingest(universe, dates[200])
+    assert first['rows'] == 200 and first['readjusted'] == []
+    second = _ingest(universe, dates[-1] + pd.Timedelta(days=1))
+    assert second['rows'] == len(dates) - 200
+    # nothing new to fetch: no files written
+    third = _ingest(universe, dates[-1] + pd.Timedelta(days=1))
+    assert third['rows'] == 0 and third['files'] == []
+
+    got = _dataset('dataset')[source.columns]
+    pd.testing.assert_frame_equal(got, source, check_freq=False, check_names=False)
+    manifest = load_manifest('dataset')
+    assert manifest['last_date'] == {ticker: dates[-1] for ticker in universe['tickers']}
+
+
+def test_ingest_rewrites_readjusted_history(universe, source):
+    tickers, dates = universe['tickers'], source.index
+    _ingest(universe, dates[200])
+    # a 2:1 split of one ticker and a dividend of another: the source back-adjusts earlier bars
+    adjusted = source.copy()
+    adjusted[f'Close__{tickers[0]}'] /= 2.0
+    adjusted.loc[dates < dates[250], f'Close__{tickers[1]}'] *= 0.99
+    adjusted.reset_index().to_parquet(universe['file_path'], engine='fastparquet', index=False)
+
+    result = _ingest(universe, dates[-1] + pd.Timedelta(days=1))
+    assert sorted(result['readjusted']) == sorted(tickers[:2])
+    assert result['rows'] == len(dates) - 200
+    got = _dataset('dataset')[adjusted.columns]
+    np.testing.assert_allclose(got.to_numpy(), adjusted.to_numpy(), rtol=1e-12)
+
+
+class _FlakyFetcher(FileFetcher):
+    """Fails the first attempts for every ticker, then serves the file."""
+
+    def __init__(self, file_path, failures):
+        super().__init__(file_path)
+        self.failures = failures
+        self.calls = {}
+
+    def fetch(self, ticker, start, end):
+        self.calls[ticker] = self.calls.get(ticker, 0) + 1
+        if self.calls[ticker] <= self.failures:
+            raise ConnectionError(f'{ticker} unavailable')
+        return super().fetch(ticker, start, end)
+
+
+def test_ingest_retries_and_reports_failures(universe, source):
+    end = source.index[-1] + pd.Timedelta(days=1)
+    flaky = _FlakyFetcher(universe['file_path'], failures=2)
+    result = ingest(universe['tickers'], root='retried', fetcher=flaky, start='2000-01-01', end=end,
+                    retries=2, backoff=0.0)
+    assert result['failed'] == {} and result['rows'] == len(source)
+
+    down = _FlakyFetcher(universe['file_path'], failures=10)
+    result = ingest(universe['tickers'], root='failed', fetcher=down, start='2000-01-01', end=end,
+                    retries=1, backoff=0.0)
+    assert sorted(result['failed']) == sorted(universe['tickers']) and result['rows'] == 0
+    assert all(calls == 2 for calls in down.calls.values())
+
+
+def test_fetcher_is_abstract():
+    with pytest.raises(TypeError):
+        Fetcher()
@@ -0,0 +1,54 @@
+"""Sharded scans run as local processes and merged back into the full scan."""
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytest
+from utils.cointegration import find_cointegrated_pairs, merge_shards
+from utils.io import load_pairs, shard_filename
+
+
+def _run_shard(shard, num_shards, tickers, shard_dir):
+    """Scan one shard in a worker process; stock_data_path is inherited from the test."""
+    find_cointegrated_pairs(tickers=tickers, shard=shard, num_shards=num_shards, shard_dir=shard_dir)
+    return shard
+
+
+def test_merged_shards_match_batch_scan(universe):
+    tickers = universe['tickers']
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        list(executor.map(_run_shard, range(3), [3] * 3, [tickers] * 3, ['shards'] * 3))
+    merged = merge_shards('shards', num_shards=3, save_top_n=5)
+    full = find_cointegrated_pairs(batch=True, tickers=tickers, pairs_file=None)
+
+    assert [pair['tickers'] for pair in merged] == [pair['tickers'] for pair in full]
+    np.testing.assert_allclose([pair['pvalue'] for pair in merged], [pair['pvalue'] for pair in full],
+                               rtol=1e-12)
+    np.testing.assert_allclose([pair['hedge_ratio'] for pair in merged],
+                               [pair['hedge_ratio'] for pair in full], rtol=1e-12)
+    found = {pair['tickers'] for pair in merged}
+    assert set(zip(universe['planted']['t1'], universe['planted']['t2'])) <= found
+    assert [pair['tickers'] for pair in load_pairs('cointegrated_pairs.pkl')] == \
+        [pair['tickers'] for pair in merged[:5]]
+
+
+def test_merge_detects_missing_and_duplicate_shards(universe):
+    tickers = universe['tickers']
+    for shard in (0, 1):
+        _run_shard(shard, 3, tickers, 'shards')
+    with pytest.raises(ValueError, match=r'Missing shards \[2\]'):
+        merge_shards('shards', num_shards=3)
+
+    _run_shard(2, 3, tickers, 'shards')
+    # a second copy of shard 0, e.g. left behind by a rerun
+    shutil.copy(shard_filename(0, 3, 'shards'), os.path.join('shards', 'shard_00000_of_00003.copy.pkl'))
+    with pytest.raises(ValueError, match='Duplicate shard 0'):
+        merge_shards('shards', num_shards=3)
+
+
+def test_merge_rejects_shards_from_different_runs(universe):
+    tickers = universe['tickers']
+    _run_shard(0, 2, tickers, 'shards')
+    _run_shard(1, 3, tickers, 'shards')
+    with pytest.raises(ValueError, match='-shard run'):
+        merge_shards('shards', num_shards=2)
@@ -1,54 +1,125 @@
 """Analysis utilities for pair statistics and selection."""
+import warnings
+import numpy as np
 import pandas as pd
-from utils.io import load_data, load_pairs
-from utils.preprocess import get_close_cols
-from utils.spread import calculate_spread
-from utils.stats import calculate_half_life, calculate_rolling_correlation
+from utils.backtest import pair_table
+from utils.cache import column_digest, get_default_cache, make_key
+from utils.io import load_pairs
+from utils.preprocess import get_close_matrix
+from utils.profiling import logger
+from utils.store import load_close_frame, source_fingerprint
+from utils.spread import batch_calculate_spread
+from utils.stats import batch_half_life, batch_rolling_correlation
 from utils.config import get_stock_data_path, get_default_criteria
 
 
-def run_analysis(pairs_file='cointegrated_pairs.pkl'):
+def pair_statistics(close, tickers, pairs, window=30, cache=None, source=None):
     """
-    Analyze all cointegrated pairs and print summary statistics.
+    Spread, half-life and rolling correlation of every pair, memoized per pair.
+    
+    Each pair's entry is keyed on a hash of its two price columns plus its
+    hedge ratio, intercept, the correlation window and the source
+    fingerprint, so any caller that passes the same prices, parameters and
+    source (run_analysis, plot_pair_analysis) shares it. Pairs missing from the cache are computed together with the
+    batched utils.spread and utils.stats functions.
+    
+    Args:
+        close (np.ndarray): (T, N) close price matrix
+        tickers (list): Ticker symbols matching the columns of close
+        pairs (list or pd.DataFrame): Pair table, see utils.backtest.pair_table
+        window (int): Rolling correlation window in days (default: 30)
+        cache (MemoCache, optional): Cache to use. If None, nothing is cached.
+        source (dict, optional): utils.store.source_fingerprint of the data the prices
+            came from, so entries from a rewritten source are not reused
+        
+    Returns:
+        dict: 'spread' (T, P), 'half_life' (P,) and 'rolling_correlation' (T, P) arrays
+    """
+    close = np.asarray(close, dtype=np.float64)
+    legs = pair_table(pairs, tickers)
+    digests = {}
+    keys, entries = [], []
+    for k in range(len(legs['names'])):
+        i, j = legs['leg1'][k], legs['leg2'][k]
+        for col in (i, j):
+            if col not in digests:
+                digests[col] = column_digest(close[:, col])
+        key = make_key('pair_statistics', [digests[i], digests[j]],
+                       hedge_ratio=float(legs['hedge_ratio'][k]), intercept=float(legs['intercept'][k]),
+                       window=window, source=sorted((source or {}).items()))
+        keys.append(key)
+        entries.append(cache.get(key) if cache is not None else None)
+
+    missing = np.array([k for k, entry in enumerate(entries) if entry is None], dtype=np.intp)
+    if len(missing):
+        leg1, leg2 = legs['leg1'][missing], legs['leg2'][missing]
+        spread = batch_calculate_spread(np.log(close), leg1, leg2, legs['hedge_ratio'][missing],
+                                        legs['intercept'][missing])
+        half_life = batch_half_life(spread)
+        correlation = batch_rolling_correlation(close, leg1, leg2, window=window)
+        for col, k in enumerate(missing):
+            entries[k] = {'spread': spread[:, col], 'half_life': half_life[col],
+                          'rolling_correlation': correlation[:, col]}
+            if cache is not None:
+                cache.put(keys[k], entries[k])
+
+    out = {'spread': np.empty((close.shape[0], len(entries))), 'half_life': np.empty(len(entries)),
+           'rolling_correlation': np.empty((close.shape[0], len(entries)))}
+    for k, entry in enumerate(entries):
+        for name, values in out.items():
+            values[..., k] = entry[name]
+    return out
+
+
+def run_analysis(pairs_file='cointegrated_pairs.pkl', use_store=False, max_pvalue=None, top_n=None,
+                 use_cache=True):
+    """
+    Analyze all cointegrated pairs and log summary statistics.
     
     Args:
-        pairs_file (str): Path to pickle file containing cointegrated pairs
+        pairs_file (str): Path to pickle file or '.parquet' pair store of cointegrated pairs
+        use_store (bool): Read prices from the memory-mapped price store (default: False)
+        max_pvalue (float, optional): Only analyze pairs with p-value below this
+        top_n (int, optional): Only analyze the top_n lowest p-values
+        use_cache (bool): Memoize per-pair statistics in the utils.cache default cache,
+            in memory unless its disk tier is configured (default: True)
         
     Returns:
         list: List of pair analysis result dictionaries
     """
     file_path = get_stock_data_path()
-    df = load_data(file_path)
-    df = get_close_cols(df)
+    # fingerprint before reading, so a rewrite during the read is not cached under it
+    source = source_fingerprint(file_path)
+    df = load_close_frame(file_path, use_store=use_store)
     # calculate statistics for pairs:
-    copairs = load_pairs(pairs_file)
+    copairs = load_pairs(pairs_file, max_pvalue=max_pvalue, top_n=top_n)
     # =
     pair_results = []
     
-    for pair in copairs:
-        ticker1, ticker2 = pair['tickers']
-        hedge_ratio = pair['hedge_ratio']
-        intercept = pair['intercept']
-
-        close_col1 = f"Close__{ticker1}"
-        close_col2 = f"Close__{ticker2}"
-
-        spread, _, _ = calculate_spread(
-            df[close_col1],
-            df[close_col2],
-            hedge_ratio=hedge_ratio,
-            intercept=intercept
-        )
-        half_life = calculate_half_life(spread)
-        rolling_correlation = calculate_rolling_correlation(df[close_col1], df[close_col2])
+    # every pair's spread, half-life and correlation in one vectorized, memoized pass
+    tickers = sorted({ticker for pair in copairs for ticker in pair['tickers']})
+    stats = pair_statistics(get_close_matrix(df, tickers), tickers, copairs,
+                            cache=get_default_cache() if use_cache else None, source=source)
+    legs = pair_table(copairs, tickers)
+    spread = stats['spread']
+    half_life = stats['half_life']
+    rolling_correlation = stats['rolling_correlation']
+    with warnings.catch_warnings():
+        # all-NaN columns yield NaN, as the pandas reductions did
+        warnings.simplefilter('ignore', RuntimeWarning)
+        spread_mean = np.nanmean(spread, axis=0)
+        spread_std = np.nanstd(spread, axis=0, ddof=1)
+        mean_correlation = np.nanmean(rolling_correlation, axis=0)
+
+    for k, pair in enumerate(copairs):
         pair_results.append({
-            'Pair': f'{ticker1}-{ticker2}',
-            'Hedge Ratio': hedge_ratio,
-            'Intercept': intercept,  # Store for reference
-            'Half Life': half_life,
-            'Spread Mean': spread.mean(),  # Should now be ≈ 0
-            'Spread Std': spread.std(), 
-            'Rolling Correlation': rolling_correlation.mean(),
+            'Pair': legs['names'][k],
+            'Hedge Ratio': pair['hedge_ratio'],
+            'Intercept': pair['intercept'],  # Store for reference
+            'Half Life': half_life[k],
+            'Spread Mean': spread_mean[k],  # Should now be ≈ 0
+            'Spread Std': spread_std[k],
+            'Rolling Correlation': mean_correlation[k],
             'Cointegration P-value': pair['pvalue'],
             'ADF Statistic': pair['adf_statistic'],  # For ranking
             'R Squared': pair['r_squared']  # Regression quality
@@ -56,19 +127,25 @@ def run_analysis(pairs_file='cointegrated_pairs.pkl'):
 
     pair_results.sort(key=lambda x: x['Rolling Correlation'], reverse=True)
     summary_df = pd.DataFrame(pair_results)
-    print("\nSummary Statistics:")
-    print(summary_df.to_string(index=False))
+    logger.info("\nSummary Statistics:")
+    logger.info(summary_df.to_string(index=False))
 
     return pair_results
 
 
-def select_good_pairs(criteria=None, pairs_file='cointegrated_pairs.pkl'):
+def select_good_pairs(criteria=None, pairs_file='cointegrated_pairs.pkl', use_store=False, max_pvalue=None,
+                      top_n=None, use_cache=True):
     """
     Select pairs that meet trading criteria for statistical arbitrage.
     
     Args:
         criteria (dict, optional): Custom criteria thresholds. If None, uses defaults.
-        pairs_file (str): Path to pickle file containing cointegrated pairs
+        pairs_file (str): Path to pickle file or '.parquet' pair store of cointegrated pairs
+        use_store (bool): Read prices from the memory-mapped price store (default: False)
+        max_pvalue (float, optional): Only analyze pairs with p-value below this
+        top_n (int, optional): Only analyze the top_n lowest p-values
+        use_cache (bool): Memoize per-pair statistics in the utils.cache default cache,
+            in memory unless its disk tier is configured (default: True)
         
     Returns:
         tuple: (good_pairs, all_pair_results) - filtered and all results
@@ -76,16 +153,17 @@ def select_good_pairs(criteria=None, pairs_file='cointegrated_pairs.pkl'):
     if criteria is None:
         criteria = get_default_criteria()
 
-    pair_results = run_analysis(pairs_file)
+    pair_results = run_analysis(pairs_file, use_store=use_store, max_pvalue=max_pvalue, top_n=top_n,
+                                use_cache=use_cache)
     good_pairs = []
 
     if not pair_results or not isinstance(pair_results, list):
-        print(f"ERROR: pair_results is {type(pair_results)}, expected list")
+        logger.error(f"ERROR: pair_results is {type(pair_results)}, expected list")
         return [], []
 
     for pair_result in pair_results:
         if not isinstance(pair_result, dict):
-            print(f"SKIPPING: Invalid data type {type(pair_result)}")
+            logger.warning(f"SKIPPING: Invalid data type {type(pair_result)}")
             continue
 
         # Check all criteria
@@ -110,19 +188,19 @@ def select_good_pairs(criteria=None, pairs_file='cointegrated_pairs.pkl'):
 
         if meets_criteria:
             good_pairs.append(pair_result)
-            print(f"✓ {pair_result['Pair']}")
-            print(f"  P-value: {pair_result['Cointegration P-value']:.6f}, ADF: {pair_result['ADF Statistic']:.2f}")
-            print(f"  Half-life: {pair_result['Half Life']:.1f}d, R²: {pair_result['R Squared']:.3f}")
-            print(f"  Spread: μ={pair_result['Spread Mean']:.4f}, σ={pair_result['Spread Std']:.3f}")
-            print(f"  Correlation: {pair_result['Rolling Correlation']:.3f}")
-            print()
-
-    print("\nCriteria used:")
-    print(f"- Rolling correlation > {criteria['min_correlation']}")
-    print(f"- Cointegration p-value < {criteria['max_pvalue']}")
-    print(f"- Spread mean is close to 0 (< {criteria['max_spread_mean_abs']})")
-    print(f"- Spread std is relatively low (< {criteria['max_spread_std']})")
-    print(f"- Half life is reasonable ({criteria['min_half_life']}-{criteria['max_half_life']} days)")
+            logger.info(f"✓ {pair_result['Pair']}")
+            logger.info(f"  P-value: {pair_result['Cointegration P-value']:.6f}, ADF: {pair_result['ADF Statistic']:.2f}")
+            logger.info(f"  Half-life: {pair_result['Half Life']:.1f}d, R²: {pair_result['R Squared']:.3f}")
+            logger.info(f"  Spread: μ={pair_result['Spread Mean']:.4f}, σ={pair_result['Spread Std']:.3f}")
+            logger.info(f"  Correlation: {pair_result['Rolling Correlation']:.3f}")
+            logger.info('')
+
+    logger.info("\nCriteria used:")
+    logger.info(f"- Rolling correlation > {criteria['min_correlation']}")
+    logger.info(f"- Cointegration p-value < {criteria['max_pvalue']}")
+    logger.info(f"- Spread mean is close to 0 (< {criteria['max_spread_mean_abs']})")
+    logger.info(f"- Spread std is relatively low (< {criteria['max_spread_std']})")
+    logger.info(f"- Half life is reasonable ({criteria['min_half_life']}-{criteria['max_half_life']} days)")
 
     return good_pairs, pair_results
 
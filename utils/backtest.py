@@ -0,0 +1,407 @@
+"""Vectorized weight-based backtest for many pairs at once."""
+import numpy as np
+import pandas as pd
+from utils.profiling import add_count, timed
+
+
+TRADING_DAYS = 252
+
+
+def pair_table(pairs, tickers):
+    """
+    Map a pair table onto column indices of a price matrix.
+    
+    Args:
+        pairs (list or pd.DataFrame): Pair dictionaries as saved by find_cointegrated_pairs
+            ('tickers', 'hedge_ratio', 'intercept'), or a DataFrame with
+            't1', 't2', 'hedge_ratio' and 'intercept' columns
+        tickers (list): Ticker symbols matching the columns of the price matrix
+        
+    Returns:
+        dict: 'leg1', 'leg2' (P,) int column indices, 'hedge_ratio', 'intercept'
+              (P,) float arrays and 'names' list of 'T1-T2' labels
+    """
+    if isinstance(pairs, pd.DataFrame):
+        t1, t2 = pairs['t1'].tolist(), pairs['t2'].tolist()
+        hedge_ratio = pairs['hedge_ratio'].to_numpy(dtype=np.float64)
+        intercept = pairs['intercept'].to_numpy(dtype=np.float64)
+    else:
+        t1 = [pair['tickers'][0] for pair in pairs]
+        t2 = [pair['tickers'][1] for pair in pairs]
+        hedge_ratio = np.array([pair['hedge_ratio'] for pair in pairs], dtype=np.float64)
+        intercept = np.array([pair.get('intercept', 0.0) for pair in pairs], dtype=np.float64)
+    column = {ticker: k for k, ticker in enumerate(tickers)}
+    return {
+        'leg1': np.array([column[t] for t in t1], dtype=np.intp),
+        'leg2': np.array([column[t] for t in t2], dtype=np.intp),
+        'hedge_ratio': hedge_ratio,
+        'intercept': intercept,
+        'names': [f'{a}-{b}' for a, b in zip(t1, t2)],
+    }
+
+
+def _shift_down(arr):
+    """Shift rows down by one bar, filling the first row with 0."""
+    out = np.zeros_like(arr)
+    out[1:] = arr[:-1]
+    return out
+
+
+def _masked_sharpe(returns, mask):
+    """Annualized Sharpe of returns over mask per column; 0 where std is 0 or undefined."""
+    count = mask.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(mask, returns, 0.0).sum(axis=0) / count
+        var = np.where(mask, (returns - mean) ** 2, 0.0).sum(axis=0) / (count - 1)
+        std = np.sqrt(var)
+        sharpe = mean / std * np.sqrt(TRADING_DAYS)
+    return np.where(std > 0, sharpe, 0.0)
+
+
+def performance_metrics(daily, valid, active, positions, turnover):
+    """
+    Headline metrics of (T, P) daily return columns over their valid bars.
+    
+    Args:
+        daily (np.ndarray): (T, P) daily returns, 0 on invalid bars
+        valid (np.ndarray): (T, P) bool, bars where both legs have a return
+        active (np.ndarray): (T, P) bool, valid bars with a position on
+        positions (np.ndarray): (T, P) spread positions
+        turnover (np.ndarray): (T, P) weight turnover charged per bar
+        
+    Returns:
+        tuple: (cumulative, drawdown, metrics) - (T, P) arrays and a dict of (P,) arrays
+    """
+    # invalid bars carry a zero return, so the running product skips them
+    cumulative = np.cumprod(1.0 + daily, axis=0)
+    peak = np.maximum.accumulate(np.where(valid, cumulative, -np.inf), axis=0)
+    with np.errstate(invalid='ignore'):
+        drawdown = (cumulative - peak) / peak
+    has_valid = valid.any(axis=0)
+    metrics = {
+        'Sharpe': _masked_sharpe(daily, valid),
+        'SharpeActive': _masked_sharpe(daily, active),
+        'TotalReturn': np.where(has_valid, cumulative[-1] - 1.0, 0.0),
+        'MaxDrawdown': np.where(has_valid, np.where(valid, drawdown, np.inf).min(axis=0), 0.0),
+        'NumTrades': (np.abs(np.diff(positions, axis=0)) > 0).sum(axis=0),
+        'Turnover': np.where(valid, turnover, 0.0).sum(axis=0),
+    }
+    return cumulative, drawdown, metrics
+
+
+TRADE_DTYPE = np.dtype([('pair', np.int32), ('entry', np.int64), ('exit', np.int64), ('side', np.int8),
+                        ('return', np.float64), ('hold', np.int64)])
+
+
+@timed('trades')
+def trade_ledger(positions, daily, valid=None):
+    """
+    Extract every trade of many pairs as one structured array.
+    
+    Each pair's series is its valid bars in order. The executed position of
+    a bar is the signal position of the previous valid bar (flat on the
+    first), and a trade is a run of bars with the same nonzero executed
+    position, so a flip from long to short closes one trade and opens the
+    next. Trade returns are compounded as expm1 of the log1p-sum of the
+    daily returns over the run.
+    
+    Args:
+        positions (np.ndarray): (T, P) signal positions, one pair per column (1-D is one pair)
+        daily (np.ndarray): (T, P) daily strategy returns, e.g. BatchBacktest.daily
+        valid (np.ndarray, optional): (T, P) bool, bars that belong to each series.
+            If None, every bar is valid.
+            
+    Returns:
+        np.ndarray: Trades with TRADE_DTYPE fields 'pair' (column), 'entry' and
+                    'exit' (first and last held bar), 'side' (1 long spread,
+                    -1 short spread), 'return' (compounded) and 'hold' (bars held),
+                    ordered by pair then entry
+    """
+    positions = np.nan_to_num(np.asarray(positions, dtype=np.float64), nan=0.0)
+    daily = np.asarray(daily, dtype=np.float64)
+    if positions.ndim == 1:
+        positions, daily = positions[:, None], daily[:, None]
+        valid = None if valid is None else np.asarray(valid)[:, None]
+    if valid is None:
+        valid = np.ones(positions.shape, dtype=bool)
+
+    # concatenate the valid bars of every pair, pair after pair
+    pair, bar = np.nonzero(valid.T)
+    pos = positions.T[valid.T]
+    ret = daily.T[valid.T]
+    n = len(pos)
+    if n == 0:
+        return np.empty(0, dtype=TRADE_DTYPE)
+
+    first = np.ones(n, dtype=bool)
+    first[1:] = pair[1:] != pair[:-1]
+    held = np.zeros(n)
+    held[1:] = pos[:-1]
+    held[first] = 0.0
+
+    # runs start at every new pair and every change of the executed position
+    new_run = first.copy()
+    new_run[1:] |= held[1:] != held[:-1]
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, n))
+    active = held[starts] != 0.0
+    with np.errstate(divide='ignore'):
+        log_growth = np.add.reduceat(np.log1p(ret), starts)
+
+    starts, lengths = starts[active], lengths[active]
+    trades = np.empty(len(starts), dtype=TRADE_DTYPE)
+    trades['pair'] = pair[starts]
+    trades['entry'] = bar[starts]
+    trades['exit'] = bar[starts + lengths - 1]
+    trades['side'] = np.sign(held[starts])
+    trades['return'] = np.expm1(log_growth[active])
+    trades['hold'] = lengths
+    return trades
+
+
+def trade_metrics(trades, n_pairs):
+    """
+    Per-pair trade statistics from a trade ledger.
+    
+    Args:
+        trades (np.ndarray): Output of trade_ledger
+        n_pairs (int): Number of pairs (columns) the ledger was built from
+        
+    Returns:
+        dict: (P,) arrays 'NumTrades', 'WinRate', 'AvgTradeReturn',
+              'MedianTradeReturn' and 'AvgHoldDays' (0 for pairs without trades)
+    """
+    count = np.bincount(trades['pair'], minlength=n_pairs)
+    wins = np.bincount(trades['pair'], weights=trades['return'] > 0.0, minlength=n_pairs)
+    total = np.bincount(trades['pair'], weights=trades['return'], minlength=n_pairs)
+    hold = np.bincount(trades['pair'], weights=trades['hold'], minlength=n_pairs)
+
+    # median: sort returns within each pair and average the middle one or two
+    order = np.lexsort((trades['return'], trades['pair']))
+    ranked = trades['return'][order]
+    offset = np.cumsum(count) - count
+    has_trades = count > 0
+    lo = np.where(has_trades, offset + (count - 1) // 2, 0)
+    hi = np.where(has_trades, offset + count // 2, 0)
+    median = (ranked[lo] + ranked[hi]) / 2.0 if len(ranked) else np.zeros(n_pairs)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'NumTrades': count,
+            'WinRate': np.where(has_trades, wins / count, 0.0),
+            'AvgTradeReturn': np.where(has_trades, total / count, 0.0),
+            'MedianTradeReturn': np.where(has_trades, median, 0.0),
+            'AvgHoldDays': np.where(has_trades, hold / count, 0.0),
+        }
+
+
+class BatchBacktest:
+    """
+    Results of batch_backtest: (T, P) arrays plus per-pair metrics.
+    
+    Per-pair Series in the backtest_pairs_weights layout are only built when
+    requested through pair(k), and reuse the underlying arrays where possible.
+    """
+
+    def __init__(self, names, hedge_ratio, dates, positions, w1, w2, daily, valid, cumulative,
+                 drawdown, turnover, metrics):
+        self.names = names
+        self.hedge_ratio = hedge_ratio
+        self.dates = dates
+        self.positions = positions
+        self.w1 = w1
+        self.w2 = w2
+        self.daily = daily
+        self.valid = valid
+        self.cumulative = cumulative
+        self.drawdown = drawdown
+        self.turnover = turnover
+        self.metrics = metrics
+
+    def __len__(self):
+        return len(self.names)
+
+    def _valid_rows(self, k):
+        """Index valid rows of pair k: a slice (view) when they form one run, else a mask."""
+        rows = np.flatnonzero(self.valid[:, k])
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            return slice(rows[0], rows[-1] + 1)
+        return rows
+
+    def pair(self, k):
+        """
+        Build the per-pair result dictionary for pair k.
+        
+        Args:
+            k (int): Pair position in the pair table
+            
+        Returns:
+            dict: Same keys as backtest_pairs_weights
+        """
+        rows = self._valid_rows(k)
+        index = self.dates[rows]
+        cum = pd.Series(self.cumulative[rows, k], index=index, copy=False)
+        return {
+            "Sharpe": float(self.metrics['Sharpe'][k]),
+            "SharpeActive": float(self.metrics['SharpeActive'][k]),
+            "TotalReturn": float(self.metrics['TotalReturn'][k]),
+            "MaxDrawdown": float(self.metrics['MaxDrawdown'][k]),
+            "NumTrades": int(self.metrics['NumTrades'][k]),
+            "WinRate": 0.0,  # trade-level win rate computed separately
+            "Capital": float(self.metrics['Capital'][k]),
+            "Turnover": float(self.metrics['Turnover'][k]),
+            "Cumulative": cum,
+            "DailyReturn": pd.Series(self.daily[rows, k], index=index, copy=False),
+            "Drawdown": pd.Series(self.drawdown[rows, k], index=index, copy=False),
+            "Weights": {"w1": pd.Series(self.w1[:, k], index=self.dates, copy=False),
+                        "w2": pd.Series(self.w2[:, k], index=self.dates, copy=False)},
+        }
+
+    def segment_metrics(self, rows):
+        """
+        Recompute the headline metrics over a slice of bars, e.g. an out-of-sample window.
+        
+        Args:
+            rows (slice): Bars to evaluate
+            
+        Returns:
+            dict: (P,) metric arrays as in self.metrics, without Capital
+        """
+        w_exec = np.abs(_shift_down(self.w1)) + np.abs(_shift_down(self.w2))
+        valid = self.valid[rows]
+        _, _, metrics = performance_metrics(self.daily[rows], valid, valid & (w_exec[rows] > 0.0),
+                                            self.positions[rows], self.turnover[rows])
+        return metrics
+
+    def trades(self):
+        """
+        Return the trade ledger of every pair over its valid bars.
+        
+        Returns:
+            np.ndarray: Structured array of trades, see trade_ledger
+        """
+        return trade_ledger(self.positions, self.daily, self.valid)
+
+    def trade_summary(self):
+        """
+        Return summary() with the trade statistics of trade_metrics.
+        
+        NumTrades becomes the number of ledger trades (a trade still open
+        on the last bar counts), and WinRate, AvgTradeReturn,
+        MedianTradeReturn and AvgHoldDays are added.
+        
+        Returns:
+            pd.DataFrame: One row per pair
+        """
+        summary = self.summary()
+        for key, values in trade_metrics(self.trades(), len(self)).items():
+            summary[key] = values
+        return summary
+
+    def significance(self, **kwargs):
+        """
+        Bootstrap the pairs' daily returns, see utils.bootstrap.bootstrap_significance.
+        
+        Args:
+            **kwargs: Arguments of bootstrap_significance (n_resamples, mean_block, seed, workers, ...)
+            
+        Returns:
+            dict: Sharpe confidence intervals and Reality Check / SPA p-values
+        """
+        from utils.bootstrap import bootstrap_significance
+        return bootstrap_significance(self.daily, self.valid, **kwargs)
+
+    def summary(self):
+        """
+        Return one row of headline metrics per pair.
+        
+        Returns:
+            pd.DataFrame: Pair, HedgeRatio and the metrics arrays
+        """
+        summary = pd.DataFrame({'Pair': self.names, 'HedgeRatio': self.hedge_ratio})
+        for key, values in self.metrics.items():
+            summary[key] = values
+        return summary
+
+
+@timed('backtest')
+def batch_backtest(close, tickers, pairs, positions, cost=0.0005, dates=None, gate=None):
+    """
+    Weight-based two-leg backtest of every pair in one pass over the price matrix.
+    
+    Same accounting as backtest_pairs_weights: weights w1 = pos/(1+|hr|),
+    w2 = -hr*pos/(1+|hr|) executed at t+1, costs proportional to turnover
+    |dw1| + |dw2| also charged at t+1, and statistics over the bars where
+    both legs have a return. Returns are computed once per ticker and
+    gathered into pair legs with an index array.
+    
+    Args:
+        close (np.ndarray): (T, N) close price matrix
+        tickers (list): Ticker symbols matching the columns of close
+        pairs (list or pd.DataFrame): Pair table, see pair_table
+        positions (np.ndarray): (T, P) spread positions, one column per pair
+        cost (float): Cost per unit of weight turnover (default: 0.0005)
+        dates (array-like, optional): (T,) bar labels. If None, uses 0..T-1.
+        gate (np.ndarray, optional): (T, P) bool, e.g. from utils.stats.cointegration_gate;
+            positions are forced flat on bars where it is False
+            
+    Returns:
+        BatchBacktest: Arrays and per-pair metrics for all pairs
+    """
+    close = np.asarray(close, dtype=np.float64)
+    legs = pair_table(pairs, tickers)
+    hr = legs['hedge_ratio']
+    add_count('pairs_backtested', len(hr))
+    positions = np.nan_to_num(np.asarray(positions, dtype=np.float64), nan=0.0)
+    if gate is not None:
+        positions = np.where(gate, positions, 0.0)
+    dates = pd.RangeIndex(close.shape[0]) if dates is None else pd.Index(dates)
+
+    returns = np.full(close.shape, np.nan)
+    returns[1:] = close[1:] / close[:-1] - 1.0
+    r1 = returns[:, legs['leg1']]
+    r2 = returns[:, legs['leg2']]
+
+    denom = 1.0 + np.abs(hr)
+    w1 = positions / denom
+    w2 = -hr * positions / denom
+    w1_exec = _shift_down(w1)
+    w2_exec = _shift_down(w2)
+    turnover = _shift_down(np.abs(np.diff(w1, axis=0, prepend=w1[:1]))
+                           + np.abs(np.diff(w2, axis=0, prepend=w2[:1])))
+    daily = np.nan_to_num(w1_exec * r1 + w2_exec * r2 - cost * turnover, nan=0.0)
+    valid = ~np.isnan(r1) & ~np.isnan(r2)
+
+    active = valid & ((np.abs(w1_exec) + np.abs(w2_exec)) > 0.0)
+
+    cumulative, drawdown, metrics = performance_metrics(daily, valid, active, positions, turnover)
+    metrics = {'Capital': denom, **metrics}
+    return BatchBacktest(legs['names'], hr, dates, positions, w1, w2, daily, valid, cumulative,
+                         drawdown, turnover, metrics)
+
+
+@timed('backtest')
+def backtest_pairs_weights(df: pd.DataFrame, s1: str, s2: str, hr: float, pos: pd.Series, cost: float = 0.0005):
+    """
+    Weight-based two-leg backtest with proper cost alignment and capital normalization.
+    - Weights per $1 capital: w1 = pos/(1+|hr|), w2 = -hr*pos/(1+|hr|)
+    - Execution at t+1: use shifted weights and costs
+    - Costs proportional to turnover: |Δw1| + |Δw2|
+    
+    Single-pair wrapper around batch_backtest.
+    
+    Args:
+        df (pd.DataFrame): Prices with Close__{TICKER} columns, indexed by date
+        s1 (str): First leg ticker
+        s2 (str): Second leg ticker
+        hr (float): Hedge ratio
+        pos (pd.Series): Spread positions
+        cost (float): Cost per unit of weight turnover (default: 0.0005)
+        
+    Returns:
+        dict: Metrics plus Cumulative, DailyReturn, Drawdown and Weights Series
+    """
+    close = df[[f"Close__{s1}", f"Close__{s2}"]].to_numpy(dtype=np.float64)
+    pos = pos.reindex(df.index).fillna(0.0).to_numpy(dtype=np.float64)[:, None]
+    pairs = [{'tickers': (s1, s2), 'hedge_ratio': hr}]
+    return batch_backtest(close, [s1, s2], pairs, pos, cost=cost, dates=df.index).pair(0)
@@ -0,0 +1,264 @@
+"""Benchmark suite: throughput, memory and correctness of the pipeline on synthetic universes."""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.analysis import run_analysis
+from utils.backtest import batch_backtest, pair_table
+from utils.cointegration import find_cointegrated_pairs, merge_shards
+from utils.io import load_data, load_shards
+from utils.preprocess import get_close_matrix
+from utils.profiling import logger, peak_memory_mb, set_quiet
+from utils.signals import batch_generate_positions, batch_rolling_zscore
+from utils.spread import batch_calculate_spread
+from utils.synthetic import planted_pair_recall, write_synthetic_universe
+
+
+# Minute scales hold 50 sessions of 390 one-minute bars; their scans use smaller
+# chunks because batch_adfuller's lag design grows with the number of bars
+SCALES = {
+    'small': {'n_tickers': 20, 'n_bars': 1260, 'freq': 'B', 'chunk_size': 1000},
+    'medium': {'n_tickers': 200, 'n_bars': 1260, 'freq': 'B', 'chunk_size': 1000},
+    'large': {'n_tickers': 1000, 'n_bars': 1260, 'freq': 'B', 'chunk_size': 1000},
+    'small-minute': {'n_tickers': 20, 'n_bars': 19_500, 'freq': 'min', 'chunk_size': 50},
+    'medium-minute': {'n_tickers': 200, 'n_bars': 19_500, 'freq': 'min', 'chunk_size': 50},
+    'large-minute': {'n_tickers': 1000, 'n_bars': 19_500, 'freq': 'min', 'chunk_size': 50},
+}
+DEFAULT_SCALES = ['small', 'medium', 'small-minute']
+
+
+def _best_of(repeat, func):
+    """Run func repeat times and return (fastest seconds, last result)."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _sharded_scan_matches(copairs, tickers, significance, chunk_size, n_tested, num_shards=3):
+    """Scan the universe in num_shards shards, merge them and compare with the unsharded scan."""
+    for shard in range(num_shards):
+        find_cointegrated_pairs(significance, batch=True, chunk_size=chunk_size, shard=shard,
+                                num_shards=num_shards, shard_dir='shards', tickers=tickers)
+    merged = merge_shards('shards', num_shards, save_top_n=len(copairs))
+    sharded_tested = sum(payload['n_tested'] for payload in load_shards('shards'))
+    return sharded_tested == n_tested and \
+        {pair['tickers'] for pair in merged} == {pair['tickers'] for pair in copairs}
+
+
+def run_scale(scale, repeat=3, significance=0.05, max_signal_pairs=2000, seed=0):
+    """
+    Benchmark the pipeline stages on one synthetic universe.
+    
+    The universe is written to a temporary directory that also serves as the
+    working directory, so saved pair files never touch the caller's. Timings
+    are the fastest of repeat runs. Peak RSS is that of the whole process
+    after each benchmark, so run each scale in a fresh process (see
+    run_benchmarks) for comparable numbers.
+    
+    Args:
+        scale (str): Key of SCALES
+        repeat (int): Timed runs per benchmark (default: 3)
+        significance (float): Scan significance level (default: 0.05)
+        max_signal_pairs (int): Most significant pairs used by the analysis,
+            signal and backtest benchmarks (default: 2000)
+        seed (int): Synthetic universe seed (default: 0)
+        
+    Returns:
+        list: One result dictionary per benchmark with 'scale', 'benchmark',
+              'items', 'seconds', 'throughput', 'unit' and 'peak_rss_mb'; the
+              scan row adds the planted pair checks and 'shard_match', whether a
+              3-shard scan and merge tests and finds the same pairs
+    """
+    spec = SCALES[scale]
+    n_tickers, n_bars = spec['n_tickers'], spec['n_bars']
+    cwd, env_path = os.getcwd(), os.environ.get('stock_data_path')
+    rows = []
+
+    def record(benchmark, items, seconds, unit, **checks):
+        rows.append({'scale': scale, 'benchmark': benchmark, 'n_tickers': n_tickers, 'n_bars': n_bars,
+                     'items': items, 'seconds': seconds,
+                     'throughput': items / seconds if seconds > 0 else float('nan'),
+                     'unit': unit, 'peak_rss_mb': peak_memory_mb(), **checks})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, 'stock_data.parquet')
+        tickers, planted = write_synthetic_universe(file_path, n_tickers=n_tickers, n_bars=n_bars,
+                                                    freq=spec['freq'], n_pairs=max(2, n_tickers // 10),
+                                                    seed=seed)
+        os.environ['stock_data_path'] = file_path
+        os.chdir(tmp)
+        try:
+            n_tested = n_tickers * (n_tickers - 1) // 2
+            seconds, copairs = _best_of(repeat, lambda: find_cointegrated_pairs(
+                significance, save_top_n=max_signal_pairs, batch=True, chunk_size=spec['chunk_size'],
+                tickers=tickers))
+            check = planted_pair_recall(copairs, planted)
+            shard_match = _sharded_scan_matches(copairs, tickers, significance, spec['chunk_size'], n_tested)
+            record('scan', n_tested, seconds, 'pairs/s', planted_recall=check['recall'],
+                   hedge_ratio_error=check['hedge_ratio_error'], shard_match=shard_match)
+
+            seconds, analysis = _best_of(repeat, lambda: run_analysis(use_cache=False))
+            half_life = {row['Pair']: row['Half Life'] for row in analysis}
+            errors = [abs(half_life[f'{t1}-{t2}'] / hl - 1.0)
+                      for t1, t2, hl in zip(planted['t1'], planted['t2'], planted['half_life'])
+                      if f'{t1}-{t2}' in half_life]
+            record('analysis', len(analysis), seconds, 'pairs/s',
+                   half_life_error=float(np.median(errors)) if errors else float('nan'))
+
+            pairs = copairs[:max_signal_pairs]
+            close = get_close_matrix(load_data(file_path), tickers)
+            legs = pair_table(pairs, tickers)
+            spread = batch_calculate_spread(np.log(close), legs['leg1'], legs['leg2'],
+                                            legs['hedge_ratio'], legs['intercept'])
+            seconds, positions = _best_of(repeat, lambda: batch_generate_positions(
+                batch_rolling_zscore(spread, 60)))
+            record('signals', len(pairs) * n_bars, seconds, 'pair-bars/s')
+
+            seconds, _ = _best_of(repeat, lambda: batch_backtest(close, tickers, pairs, positions))
+            record('backtest', len(pairs) * n_bars, seconds, 'pair-bars/s')
+        finally:
+            os.chdir(cwd)
+            if env_path is None:
+                os.environ.pop('stock_data_path', None)
+            else:
+                os.environ['stock_data_path'] = env_path
+    return rows
+
+
+def _run_scale_quietly(scale, repeat, seed):
+    """Worker entry point: benchmark one scale with the pipeline's summaries silenced."""
+    set_quiet()
+    return run_scale(scale, repeat=repeat, seed=seed)
+
+
+def run_benchmarks(scales=None, repeat=3, seed=0):
+    """
+    Benchmark every scale, each in a fresh process so peak memory is per scale.
+    
+    Args:
+        scales (list, optional): Keys of SCALES. If None, uses DEFAULT_SCALES.
+        repeat (int): Timed runs per benchmark (default: 3)
+        seed (int): Synthetic universe seed (default: 0)
+        
+    Returns:
+        pd.DataFrame: One row per (scale, benchmark), see run_scale
+    """
+    rows = []
+    for scale in scales or DEFAULT_SCALES:
+        logger.info(f'Benchmarking {scale}: {SCALES[scale]}')
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            rows.extend(executor.submit(_run_scale_quietly, scale, repeat, seed).result())
+    return pd.DataFrame(rows)
+
+
+def save_baseline(results, filename='benchmark_baseline.json'):
+    """
+    Save benchmark results as the baseline later runs are compared to.
+    
+    Args:
+        results (pd.DataFrame): Output of run_benchmarks
+        filename (str): Output JSON file (default: 'benchmark_baseline.json')
+    """
+    baseline = {
+        'created': pd.Timestamp.now().isoformat(),
+        'platform': platform.platform(),
+        'results': {f"{row['scale']}/{row['benchmark']}": {'throughput': row['throughput'],
+                                                            'peak_rss_mb': row['peak_rss_mb']}
+                    for row in results.to_dict('records')},
+    }
+    with open(filename, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    logger.info(f'Saved benchmark baseline to {filename}')
+
+
+def compare_to_baseline(results, filename='benchmark_baseline.json', tolerance=0.2):
+    """
+    Compare benchmark results to a saved baseline.
+    
+    Args:
+        results (pd.DataFrame): Output of run_benchmarks
+        filename (str): Baseline JSON file written by save_baseline
+        tolerance (float): Relative change treated as noise (default: 0.2)
+        
+    Returns:
+        pd.DataFrame: results with 'speedup' (throughput / baseline throughput),
+                      'memory_ratio' and 'status': 'ok', 'faster', 'slower',
+                      'more_memory' or 'new'
+    """
+    with open(filename) as f:
+        baseline = json.load(f)['results']
+    compared = results.copy()
+    speedup, memory_ratio, status = [], [], []
+    for row in results.to_dict('records'):
+        base = baseline.get(f"{row['scale']}/{row['benchmark']}")
+        if base is None:
+            speedup.append(float('nan'))
+            memory_ratio.append(float('nan'))
+            status.append('new')
+            continue
+        speedup.append(row['throughput'] / base['throughput'])
+        memory_ratio.append(row['peak_rss_mb'] / base['peak_rss_mb'])
+        if speedup[-1] < 1.0 - tolerance:
+            status.append('slower')
+        elif memory_ratio[-1] > 1.0 + tolerance:
+            status.append('more_memory')
+        elif speedup[-1] > 1.0 + tolerance:
+            status.append('faster')
+        else:
+            status.append('ok')
+    compared['speedup'] = speedup
+    compared['memory_ratio'] = memory_ratio
+    compared['status'] = status
+    return compared
+
+
+def main(argv=None):
+    """
+    Command line entry point: run the suite, compare to the baseline and check the planted pairs.
+    
+    Returns:
+        int: 0 if every benchmark is within tolerance and every scan recovered
+             at least min_recall of the planted pairs and matched its sharded run, 1 otherwise
+    """
+    parser = argparse.ArgumentParser(prog='python -m utils.benchmark',
+                                     description='Pipeline benchmarks on synthetic universes')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.csv')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-recall', type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, repeat=args.repeat, seed=args.seed)
+    failed = False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        results = compare_to_baseline(results, args.baseline, args.tolerance)
+        failed |= results['status'].isin(['slower', 'more_memory']).any()
+    scans = results[results['benchmark'] == 'scan']
+    failed |= (scans['planted_recall'] < args.min_recall).any()
+    failed |= not scans['shard_match'].all()
+
+    columns = [col for col in ['scale', 'benchmark', 'throughput', 'unit', 'peak_rss_mb', 'planted_recall',
+                               'shard_match', 'hedge_ratio_error', 'half_life_error', 'speedup', 'status']
+               if col in results]
+    logger.info(results[columns].to_string(index=False))
+    results.to_csv(args.output, index=False)
+    logger.info(f'Saved benchmark results to {args.output}')
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+    return int(failed)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,241 @@
+"""Block-bootstrap significance for many pairs at once: Sharpe intervals, Reality Check / SPA and FDR."""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.backtest import TRADING_DAYS
+from utils.profiling import timed
+
+
+# Per-process state for bootstrap workers, set once by _init_bootstrap_worker
+_BOOT_STATE = {}
+
+
+def bootstrap_indices(n_bars, n_resamples, mean_block=10, method='stationary', rng=None):
+    """
+    Draw circular block-bootstrap index matrices.
+    
+    'stationary' (Politis-Romano) starts a new block at each bar with
+    probability 1 / mean_block, so block lengths are geometric; 'block' uses
+    fixed blocks of mean_block bars. Blocks wrap around the end of the sample.
+    
+    Args:
+        n_bars (int): Bars per series (T)
+        n_resamples (int): Number of resamples (B)
+        mean_block (float): Mean (stationary) or fixed (block) block length in bars (default: 10)
+        method (str): 'stationary' or 'block' (default: 'stationary')
+        rng (np.random.Generator, optional): Random generator. If None, uses a fresh default_rng().
+        
+    Returns:
+        np.ndarray: (B, T) bar indices, one resample per row
+        
+    Raises:
+        ValueError: If method is not 'stationary' or 'block'
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    bars = np.arange(n_bars)
+    if method == 'stationary':
+        new_block = rng.random((n_resamples, n_bars)) < 1.0 / mean_block
+    elif method == 'block':
+        new_block = np.broadcast_to(bars % int(mean_block) == 0, (n_resamples, n_bars)).copy()
+    else:
+        raise ValueError(f"Unknown bootstrap method: {method}")
+    new_block[:, 0] = True
+    starts = rng.integers(0, n_bars, (n_resamples, n_bars))
+    # each bar continues the block opened at the latest new-block bar
+    opened = np.maximum.accumulate(np.where(new_block, bars, 0), axis=1)
+    return (np.take_along_axis(starts, opened, axis=1) + bars - opened) % n_bars
+
+
+def _init_bootstrap_worker(state):
+    """Store the shared bootstrap inputs in a worker process."""
+    _BOOT_STATE.update(state)
+
+
+def _bootstrap_chunk(seed, n_resamples):
+    """
+    Resampled mean and standard deviation of every column for one chunk of resamples.
+    
+    A resample's moments only depend on how often each bar is drawn, so the
+    (b, T) draw counts are multiplied into the (T, P) returns with three
+    matrix products instead of gathering a (b, T, P) array.
+    """
+    s = _BOOT_STATE
+    n_bars = s['returns'].shape[0]
+    idx = bootstrap_indices(n_bars, n_resamples, s['mean_block'], s['method'], np.random.default_rng(seed))
+    flat = (idx + np.arange(n_resamples)[:, None] * n_bars).ravel()
+    counts = np.bincount(flat, minlength=n_resamples * n_bars).reshape(n_resamples, n_bars).astype(np.float64)
+    n = counts @ s['valid']
+    total = counts @ s['returns']
+    total_sq = counts @ s['returns_sq']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n
+        std = np.sqrt(np.maximum(total_sq - total * mean, 0.0) / (n - 1))
+    return mean, std
+
+
+def _moments(returns, valid):
+    """Mean and sample standard deviation of each column over its valid bars."""
+    n = valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = returns.sum(axis=0) / n
+        std = np.sqrt(((returns - mean) ** 2 * valid).sum(axis=0) / (n - 1))
+    return mean, std, n
+
+
+def _sharpe(mean, std):
+    """Annualized Sharpe ratio; 0 where the standard deviation is 0 or undefined."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = mean / std * np.sqrt(TRADING_DAYS)
+    return np.where(std > 0, sharpe, 0.0)
+
+
+@timed('bootstrap')
+def bootstrap_significance(returns, valid=None, n_resamples=10_000, mean_block=10, method='stationary',
+                           level=0.95, seed=0, chunk_size=250, workers=1):
+    """
+    Bootstrap Sharpe confidence intervals and data-snooping p-values for many strategies.
+    
+    Every pair is resampled with the same block-bootstrap index rows, which
+    keeps the cross-sectional dependence the Reality Check needs. Resamples
+    are drawn in chunks of chunk_size, each from its own child of
+    SeedSequence(seed), so results are the same for any number of workers
+    and memory is bounded by chunk_size x (T + P) plus the (B, P) outputs.
+    
+    White's Reality Check tests whether the best mean daily return beats
+    zero once the search over all P strategies is accounted for; Hansen's
+    SPA p-value studentizes each strategy and recenters clearly poor ones,
+    so irrelevant losers do not inflate it. Both use the bootstrap standard
+    error of each mean.
+    
+    Args:
+        returns (np.ndarray): (T, P) daily returns, e.g. BatchBacktest.daily (1-D is one strategy)
+        valid (np.ndarray, optional): (T, P) bool bars to use, e.g. BatchBacktest.valid.
+            If None, every non-NaN bar.
+        n_resamples (int): Bootstrap resamples (default: 10000)
+        mean_block (float): Mean block length in bars, see bootstrap_indices (default: 10)
+        method (str): 'stationary' or 'block' (default: 'stationary')
+        level (float): Confidence level of the Sharpe intervals (default: 0.95)
+        seed (int): Seed of the resampling (default: 0)
+        chunk_size (int): Resamples drawn per chunk (default: 250)
+        workers (int): Worker processes; chunks are spread over the pool (default: 1)
+        
+    Returns:
+        dict: (P,) arrays 'sharpe', 'sharpe_lower', 'sharpe_upper' (percentile
+              interval) and 'sharpe_pvalue' (share of centered resampled Sharpes at
+              or above the observed one), plus 'best' (column of the highest mean
+              return), 'rc_pvalue' and 'spa_pvalue'
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.ndim == 1:
+        returns = returns[:, None]
+        valid = None if valid is None else np.asarray(valid)[:, None]
+    valid = ~np.isnan(returns) if valid is None else np.asarray(valid, dtype=bool) & ~np.isnan(returns)
+    returns = np.where(valid, returns, 0.0)
+    mean, std, n = _moments(returns, valid)
+    sharpe = _sharpe(mean, std)
+
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    state = {'returns': returns, 'returns_sq': returns ** 2, 'valid': valid.astype(np.float64),
+             'mean_block': mean_block, 'method': method}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_bootstrap_worker,
+                                 initargs=(state,)) as executor:
+            parts = list(executor.map(_bootstrap_chunk, seeds, sizes))
+    else:
+        _init_bootstrap_worker(state)
+        try:
+            parts = [_bootstrap_chunk(child, size) for child, size in zip(seeds, sizes)]
+        finally:
+            _BOOT_STATE.clear()
+    boot_mean = np.concatenate([part[0] for part in parts])
+    boot_sharpe = _sharpe(boot_mean, np.concatenate([part[1] for part in parts]))
+
+    tail = (1.0 - level) / 2.0
+    with np.errstate(invalid='ignore'):
+        lower, upper = np.nanquantile(boot_sharpe, [tail, 1.0 - tail], axis=0)
+        sharpe_pvalue = np.mean(boot_sharpe - sharpe >= sharpe, axis=0)
+
+    # Reality Check and SPA on mean daily returns against a zero benchmark
+    root_n = np.sqrt(n)
+    centered = root_n * (boot_mean - mean)
+    with np.errstate(invalid='ignore'):
+        omega = np.nanstd(centered, axis=0)
+    finite = np.isfinite(mean)
+    rc_stat = np.max(np.where(finite, root_n * mean, -np.inf))
+    rc_pvalue = np.mean(np.max(np.where(finite, centered, -np.inf), axis=1) >= rc_stat)
+
+    usable = finite & (omega > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_stat = np.where(usable, root_n * mean / omega, -np.inf)
+        # recenter at zero unless the strategy is clearly worse than the benchmark
+        poor = t_stat <= -np.sqrt(2.0 * np.log(np.log(np.maximum(n, 16))))
+        shifted = (centered + np.where(poor, root_n * mean, 0.0)) / omega
+    spa_stat = max(np.max(t_stat), 0.0)
+    spa_boot = np.maximum(np.max(np.where(usable, shifted, -np.inf), axis=1), 0.0)
+    spa_pvalue = np.mean(spa_boot >= spa_stat)
+
+    return {
+        'sharpe': sharpe,
+        'sharpe_lower': lower,
+        'sharpe_upper': upper,
+        'sharpe_pvalue': sharpe_pvalue,
+        'best': int(np.argmax(np.where(finite, mean, -np.inf))),
+        'rc_pvalue': float(rc_pvalue),
+        'spa_pvalue': float(spa_pvalue),
+    }
+
+
+def fdr_adjust(pvalues, method='bh', n_tests=None):
+    """
+    Adjust p-values for the false discovery rate.
+    
+    Args:
+        pvalues (array-like): (M,) p-values
+        method (str): 'bh' (Benjamini-Hochberg, independent or positively
+            dependent tests) or 'by' (Benjamini-Yekutieli, any dependence) (default: 'bh')
+        n_tests (int, optional): Number of tests run, if pvalues only holds the
+            smallest of them (e.g. significant pairs only). The untested tail is
+            left out, so the adjusted values are then conservative.
+            
+    Returns:
+        np.ndarray: (M,) adjusted p-values (q-values) in the input order
+        
+    Raises:
+        ValueError: If method is not 'bh' or 'by'
+    """
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    m = len(pvalues) if n_tests is None else n_tests
+    if method == 'bh':
+        scale = m
+    elif method == 'by':
+        scale = m * np.sum(1.0 / np.arange(1, m + 1))
+    else:
+        raise ValueError(f"Unknown FDR method: {method}")
+    order = np.argsort(pvalues, kind='stable')
+    ranked = pvalues[order] * scale / np.arange(1, len(pvalues) + 1)
+    # q-values are the running minimum from the largest p-value down
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted = np.empty_like(ranked)
+    adjusted[order] = np.minimum(ranked, 1.0)
+    return adjusted
+
+
+def fdr_pairs(copairs, alpha=0.05, method='bh', n_tests=None):
+    """
+    Add FDR-adjusted q-values to scanned pairs and keep those below alpha.
+    
+    Args:
+        copairs (list): Pair dictionaries as returned by find_cointegrated_pairs, or
+            frame_to_pairs(read_pair_results(...)) for every tested pair
+        alpha (float): False discovery rate to control (default: 0.05)
+        method (str): 'bh' or 'by', see fdr_adjust (default: 'bh')
+        n_tests (int, optional): Number of pairs tested if copairs is only the
+            significant subset, e.g. N * (N - 1) / 2
+            
+    Returns:
+        list: Copies of the pairs with q-value below alpha, each with a 'qvalue' key,
+              in ascending p-value order
+    """
+    qvalues = fdr_adjust([pair['pvalue'] for pair in copairs], method, n_tests)
+    kept = [{**pair, 'qvalue': float(q)} for pair, q in zip(copairs, qvalues) if q < alpha]
+    return sorted(kept, key=lambda pair: pair['pvalue'])
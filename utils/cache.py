@@ -0,0 +1,191 @@
+"""Content-addressed memoization cache with an in-process LRU tier and an on-disk tier."""
+import glob
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+from utils.config import get_cache_settings
+
+
+def column_digest(values):
+    """
+    Hash the contents of one price column.
+    
+    Args:
+        values (array-like): Column values
+        
+    Returns:
+        bytes: 16-byte BLAKE2b digest of the float64 values
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return hashlib.blake2b(values.tobytes(), digest_size=16).digest()
+
+
+def make_key(namespace, digests, **params):
+    """
+    Build a cache key from input column digests and parameters.
+    
+    Args:
+        namespace (str): Name of the cached computation
+        digests (list): column_digest of every input column, in order
+        **params: Scalar parameters of the computation (hedge ratio, window, ...)
+        
+    Returns:
+        str: Hex key
+    """
+    h = hashlib.blake2b(namespace.encode(), digest_size=20)
+    for digest in digests:
+        h.update(digest)
+    for name in sorted(params):
+        h.update(f'|{name}={params[name]!r}'.encode())
+    return h.hexdigest()
+
+
+class MemoCache:
+    """
+    Two-tier cache of dicts of NumPy arrays, keyed by make_key.
+    
+    Lookups check an in-process LRU of max_items entries, then the cache
+    directory, where entries are .npz files evicted least recently used
+    first once they exceed max_disk_mb. Returned arrays are read-only, since
+    they are shared with the cache.
+    """
+
+    def __init__(self, cache_dir=None, max_items=None, max_disk_mb=None):
+        """
+        Args:
+            cache_dir (str, optional): Directory of the disk tier; None disables it.
+            max_items (int, optional): Entries kept in memory. If None, uses get_cache_settings().
+            max_disk_mb (float, optional): Disk tier size limit. If None, uses get_cache_settings().
+        """
+        settings = get_cache_settings()
+        self.cache_dir = cache_dir
+        self.max_items = settings['max_items'] if max_items is None else max_items
+        self.max_disk_bytes = (settings['max_disk_mb'] if max_disk_mb is None else max_disk_mb) * 2 ** 20
+        self.memory = OrderedDict()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def _remember(self, key, value):
+        """Insert into the memory tier, evicting the least recently used entry."""
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Look a key up in memory, then on disk.
+        
+        Args:
+            key (str): Key from make_key
+            
+        Returns:
+            dict or None: Cached arrays, or None on a miss
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.counters['memory_hits'] += 1
+            return self.memory[key]
+        if self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                with np.load(self._path(key), allow_pickle=False) as data:
+                    value = {name: data[name] for name in data.files}
+            except (OSError, ValueError):
+                # evicted or half-written by another process: treat as a miss
+                value = None
+            if value is not None:
+                os.utime(self._path(key))
+                for arr in value.values():
+                    arr.setflags(write=False)
+                self._remember(key, value)
+                self.counters['disk_hits'] += 1
+                return value
+        self.counters['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store a dict of arrays in both tiers.
+        
+        Args:
+            key (str): Key from make_key
+            value (dict): Name -> array or scalar
+        """
+        value = {name: np.array(arr) for name, arr in value.items()}
+        for arr in value.values():
+            arr.setflags(write=False)
+        self._remember(key, value)
+        if self.cache_dir:
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **value)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Delete the least recently used files until the disk tier fits max_disk_mb."""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+        
+        Args:
+            key (str): Key from make_key
+            compute (callable): Zero-argument function returning a dict of arrays
+            
+        Returns:
+            dict: Cached or freshly computed arrays
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+            value = self.memory[key]
+        return value
+
+    def stats(self):
+        """
+        Return hit/miss counters since creation.
+        
+        Returns:
+            dict: 'memory_hits', 'disk_hits', 'misses' and 'hit_rate'
+        """
+        lookups = sum(self.counters.values())
+        hits = self.counters['memory_hits'] + self.counters['disk_hits']
+        return {**self.counters, 'hit_rate': hits / lookups if lookups else 0.0}
+
+
+_DEFAULT_CACHE = []
+
+
+def get_default_cache():
+    """
+    Return the process-wide cache configured by get_cache_settings().
+    
+    Returns:
+        MemoCache: Shared cache instance
+    """
+    if not _DEFAULT_CACHE:
+        _DEFAULT_CACHE.append(MemoCache(cache_dir=get_cache_settings()['cache_dir']))
+    return _DEFAULT_CACHE[0]
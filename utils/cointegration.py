@@ -1,11 +1,21 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 import numpy as np
-import statsmodels.api as sm
-from statsmodels.tsa.stattools import adfuller
-from utils.io import load_data, save_top_pairs
-from utils.preprocess import get_close_cols
-from utils.config import get_default_tickers, get_stock_data_path
+import pandas as pd
+from utils.adf import batch_adfuller
+from utils.io import load_data, save_top_pairs, save_shard, load_shards, iter_close_chunks
+from utils.preprocess import get_close_cols, get_close_matrix
+from utils.pairstore import save_pair_results
+from utils.profiling import (add_count, enable_profiling, logger, reset_profile, save_profile_report,
+                             set_quiet, stage, timed)
+from utils.store import open_price_store, source_fingerprint, store_close_matrix, store_to_frame
+from utils.config import get_default_tickers, get_stock_data_path, get_default_pruning
 
 
+@timed('ols')
 def engle_granger_test(series1, series2):
     """
     Perform Engle-Granger cointegration test on two price series.
@@ -20,6 +30,7 @@ def engle_granger_test(series1, series2):
     Returns:
         statsmodels.regression.linear_model.RegressionResults: OLS regression results
     """
+    import statsmodels.api as sm
     # Log transform FIRST, then add constant
     log_series1 = np.log(series1)
     log_series2 = np.log(series2)
@@ -34,24 +45,647 @@ def engle_granger_test(series1, series2):
     return results
 
 
-def find_cointegrated_pairs(significance=0.05, save_top_n=10):
+def pair_index(n_tickers):
+    """
+    Return the column indices of every unique pair (i < j).
+    
+    Pairs are ordered row-major over the upper triangle, which is the same
+    order as the nested i < j loop in find_cointegrated_pairs.
+    
+    Args:
+        n_tickers (int): Number of tickers in the universe
+        
+    Returns:
+        np.ndarray: (P, 2) integer array of (i, j) column indices
+    """
+    i, j = np.triu_indices(n_tickers, k=1)
+    return np.column_stack((i, j))
+
+
+@timed('ols')
+def log_price_moments(log_prices):
+    """
+    Compute the sufficient statistics shared by every pairwise OLS fit.
+    
+    The log price matrix is centered once and a single matrix product gives
+    the centered cross-products of all columns, so the slope, intercept and
+    R² of any pair can be read off without refitting.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        
+    Returns:
+        dict: 'mean' (N,) column means, 'centered' (T, N) demeaned log prices
+              and 'cross' (N, N) centered cross-product matrix
+        
+    Raises:
+        ValueError: If log_prices contains NaN or inf
+    """
+    if not np.all(np.isfinite(log_prices)):
+        raise ValueError('Log prices contain NaN or inf; drop or fill missing rows first')
+    mean = log_prices.mean(axis=0)
+    centered = log_prices - mean
+    cross = centered.T @ centered
+    return {'mean': mean, 'centered': centered, 'cross': cross}
+
+
+@timed('ols')
+def batch_engle_granger(log_prices, pairs, moments=None):
+    """
+    Run the Engle-Granger regression for many pairs at once.
+    
+    Regression per row (i, j) of pairs: log(p_i) = alpha + beta * log(p_j) + error.
+    Gives the same alpha, beta, R² and residuals as engle_granger_test, but
+    from shared NumPy sufficient statistics instead of one OLS model per pair.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices (unused if moments is given)
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        moments (dict, optional): Output of log_price_moments. If None, will be calculated.
+        
+    Returns:
+        dict: 'alpha', 'beta', 'r_squared' (P,) arrays and 'resid' (T, P) residuals
+    """
+    if moments is None:
+        moments = log_price_moments(log_prices)
+    i, j = pairs[:, 0], pairs[:, 1]
+    cross = moments['cross']
+    sxy = cross[i, j]
+    sxx = cross[j, j]
+    syy = cross[i, i]
+
+    beta = sxy / sxx
+    alpha = moments['mean'][i] - beta * moments['mean'][j]
+    r_squared = sxy ** 2 / (sxx * syy)
+    # resid = y - alpha - beta*x, written in centered form
+    centered = moments['centered']
+    resid = centered[:, i] - beta * centered[:, j]
+    return {'alpha': alpha, 'beta': beta, 'r_squared': r_squared, 'resid': resid}
+
+
+def batch_test_pairs(log_prices, pairs, chunk_size=1000, moments=None):
+    """
+    Engle-Granger fit and residual ADF test for every pair, significant or not.
+    
+    Pairs are processed in chunks so the residual matrix stays bounded at
+    (T, chunk_size) regardless of universe size. Each chunk's residuals are
+    tested together with batch_adfuller.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices (unused if moments is given)
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        chunk_size (int): Number of pairs fitted per chunk (default: 1000)
+        moments (dict, optional): Output of log_price_moments. If None, will be calculated.
+        
+    Returns:
+        dict: (P,) arrays 'alpha', 'beta', 'r_squared', 'adf_statistic' and 'pvalue'
+    """
+    if moments is None:
+        moments = log_price_moments(log_prices)
+
+    add_count('pairs_tested', len(pairs))
+    keys = ('alpha', 'beta', 'r_squared', 'adf_statistic', 'pvalue')
+    results = {key: np.empty(len(pairs)) for key in keys}
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        ols = batch_engle_granger(log_prices, chunk, moments)
+        adf = batch_adfuller(ols['resid'])
+        for key in keys:
+            results[key][start:start + len(chunk)] = ols[key] if key in ols else adf[key]
+    return results
+
+
+def significant_pairs(tickers, pairs, results, significance=0.05):
+    """
+    Turn batch test results into the cointegrated pair dictionaries.
+    
+    Args:
+        tickers (list): Ticker symbols matching the pair column indices
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        results (dict): Output of batch_test_pairs for these pairs
+        significance (float): Significance level for ADF test (default: 0.05)
+        
+    Returns:
+        list: Cointegrated pair dictionaries, in the order of pairs
+    """
+    copairs = []
+    for k in np.flatnonzero(results['pvalue'] < significance):
+        i, j = pairs[k]
+        copairs.append({
+            'pvalue': results['pvalue'][k],
+            'adf_statistic': results['adf_statistic'][k],
+            'tickers': (tickers[i], tickers[j]),
+            'intercept': results['alpha'][k],
+            'hedge_ratio': results['beta'][k],
+            'r_squared': results['r_squared'][k]
+        })
+    return copairs
+
+
+def batch_scan_pairs(log_prices, tickers, pairs, significance=0.05, chunk_size=1000, moments=None):
+    """
+    Test many pairs for cointegration using the batched Engle-Granger fits.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices (unused if moments is given)
+        tickers (list): Ticker symbols matching the columns of log_prices
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        significance (float): Significance level for ADF test (default: 0.05)
+        chunk_size (int): Number of pairs fitted per chunk (default: 1000)
+        moments (dict, optional): Output of log_price_moments. If None, will be calculated.
+        
+    Returns:
+        list: Cointegrated pair dictionaries, in the order of pairs
+    """
+    results = batch_test_pairs(log_prices, pairs, chunk_size=chunk_size, moments=moments)
+    return significant_pairs(tickers, pairs, results, significance)
+
+
+def fold_log_price_moments(chunks, tickers):
+    """
+    Accumulate log_price_moments' mean and cross-products over chunks of rows.
+    
+    Sums are kept around the first chunk's column means to limit cancellation,
+    so memory stays at one chunk plus the (N, N) cross-product matrix.
+    
+    Args:
+        chunks (iterable): DataFrames with Close__{TICKER} columns, e.g. from iter_close_chunks
+        tickers (list): Ticker symbols, in column order
+        
+    Returns:
+        dict: 'mean' (N,) column means, 'cross' (N, N) centered cross-product
+              matrix and 'n' number of rows (no 'centered' matrix)
+        
+    Raises:
+        ValueError: If any chunk contains NaN or inf log prices
+    """
+    n, shift, total, cross = 0, None, None, None
+    for chunk in chunks:
+        log_prices = np.log(get_close_matrix(chunk, tickers))
+        if not np.all(np.isfinite(log_prices)):
+            raise ValueError('Log prices contain NaN or inf; drop or fill missing rows first')
+        if shift is None:
+            shift = log_prices.mean(axis=0)
+            total = np.zeros(len(tickers))
+            cross = np.zeros((len(tickers), len(tickers)))
+        shifted = log_prices - shift
+        n += len(shifted)
+        total += shifted.sum(axis=0)
+        cross += shifted.T @ shifted
+    mean = total / n
+    return {'mean': shift + mean, 'cross': cross - n * np.outer(mean, mean), 'n': n}
+
+
+def chunked_test_pairs(file_path, tickers, pairs, chunk_size=1000, start=None, end=None,
+                       chunk_rows=100_000):
+    """
+    batch_test_pairs for files too large to load, folding over chunks of rows.
+    
+    A first pass over the file accumulates the cross-products that give every
+    pair's regression. The ADF test needs each residual's full history, so
+    each chunk of pairs then takes one more pass that reads only the columns
+    of its own legs. Peak memory is one file chunk plus the (T, chunk_size)
+    residual matrix, whatever the width of the file or the universe.
+    
+    Args:
+        file_path (str): Path to the parquet or CSV data file
+        tickers (list): Ticker symbols matching the pair column indices
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        chunk_size (int): Number of pairs tested per pass (default: 1000)
+        start (str or pd.Timestamp, optional): First date to use (inclusive)
+        end (str or pd.Timestamp, optional): Last date to use (inclusive)
+        chunk_rows (int): Rows per chunk for CSV files (default: 100000)
+        
+    Returns:
+        dict: (P,) arrays 'alpha', 'beta', 'r_squared', 'adf_statistic' and 'pvalue'
+    """
+    def chunks(columns):
+        return iter_close_chunks(file_path, columns, start=start, end=end, chunk_rows=chunk_rows)
+
+    moments = fold_log_price_moments(chunks(tickers), tickers)
+    i, j = pairs[:, 0], pairs[:, 1]
+    cross = moments['cross']
+    beta = cross[i, j] / cross[j, j]
+    results = {
+        'alpha': moments['mean'][i] - beta * moments['mean'][j],
+        'beta': beta,
+        'r_squared': cross[i, j] ** 2 / (cross[j, j] * cross[i, i]),
+        'adf_statistic': np.empty(len(pairs)),
+        'pvalue': np.empty(len(pairs)),
+    }
+    for first in range(0, len(pairs), chunk_size):
+        rows = slice(first, first + chunk_size)
+        legs, local = np.unique(pairs[rows], return_inverse=True)
+        local = local.reshape(-1, 2)
+        leg_tickers = [tickers[k] for k in legs]
+        parts = []
+        for chunk in chunks(leg_tickers):
+            log_prices = np.log(get_close_matrix(chunk, leg_tickers))
+            parts.append(log_prices[:, local[:, 0]]
+                         - (results['alpha'][rows] + beta[rows] * log_prices[:, local[:, 1]]))
+        adf = batch_adfuller(np.concatenate(parts))
+        results['adf_statistic'][rows] = adf['adf_statistic']
+        results['pvalue'][rows] = adf['pvalue']
+    return results
+
+
+@timed('correlation')
+def return_correlation_matrix(log_prices):
+    """
+    Compute the full log-return correlation matrix with a single matrix product.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        
+    Returns:
+        np.ndarray: (N, N) correlation matrix of log returns
+    """
+    returns = np.diff(log_prices, axis=0)
+    returns = returns - returns.mean(axis=0)
+    std = np.sqrt((returns ** 2).sum(axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = returns / std
+    return z.T @ z
+
+
+def cluster_tickers(corr, n_clusters):
+    """
+    Group tickers by average-linkage hierarchical clustering on correlation distance.
+    
+    Undefined correlations (a constant or all-missing column) count as 0.
+    
+    Args:
+        corr (np.ndarray): (N, N) correlation matrix
+        n_clusters (int): Number of clusters to cut the tree into
+        
+    Returns:
+        np.ndarray: (N,) cluster label per ticker
+    """
+    from scipy.cluster.hierarchy import fcluster, linkage
+    from scipy.spatial.distance import squareform
+    corr = np.nan_to_num(corr, nan=0.0)
+    distance = np.sqrt(np.clip(2.0 * (1.0 - corr), 0.0, None))
+    np.fill_diagonal(distance, 0.0)
+    tree = linkage(squareform(distance, checks=False), method='average')
+    return fcluster(tree, t=n_clusters, criterion='maxclust')
+
+
+def prune_candidate_pairs(log_prices, top_k=None, min_correlation=None, n_clusters=None):
+    """
+    Pre-screen pairs by log-return correlation before the Engle-Granger test.
+    
+    Each enabled filter removes pairs; a pair survives only if it passes all
+    of them: it is among the top_k most correlated neighbours of either
+    ticker, its correlation is at least min_correlation, and both tickers
+    fall in the same cluster.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        top_k (int, optional): Neighbours kept per ticker. If None, no top-k filter.
+        min_correlation (float, optional): Correlation floor. If None, no floor.
+        n_clusters (int, optional): Clusters to restrict pairs to. If None, no clustering.
+        
+    Returns:
+        tuple: (pairs, info) - (P, 2) candidate pairs in pair_index order and a
+               dict with 'n_total', 'n_candidates', 'n_pruned' and 'seconds'
+    """
+    start = time.perf_counter()
+    n = log_prices.shape[1]
+    corr = return_correlation_matrix(log_prices)
+    keep = np.ones((n, n), dtype=bool)
+
+    if top_k is not None and top_k < n - 1:
+        ranked = np.where(np.eye(n, dtype=bool), -np.inf, np.nan_to_num(corr, nan=-np.inf))
+        neighbours = np.argpartition(-ranked, top_k - 1, axis=1)[:, :top_k]
+        near = np.zeros((n, n), dtype=bool)
+        near[np.repeat(np.arange(n), top_k), neighbours.ravel()] = True
+        keep &= near | near.T
+    if min_correlation is not None:
+        keep &= corr >= min_correlation
+    if n_clusters is not None:
+        labels = cluster_tickers(corr, n_clusters)
+        keep &= labels[:, None] == labels[None, :]
+
+    pairs = np.argwhere(np.triu(keep, k=1))
+    n_total = n * (n - 1) // 2
+    info = {
+        'n_total': n_total,
+        'n_candidates': len(pairs),
+        'n_pruned': n_total - len(pairs),
+        'seconds': time.perf_counter() - start,
+    }
+    logger.info(f"Pruned {info['n_pruned']}/{n_total} pairs, {len(pairs)} candidates left "
+                f"({info['seconds']:.3f}s)")
+    return pairs, info
+
+
+def pruning_recall(copairs, full_copairs):
+    """
+    Share of exhaustively found cointegrated pairs that survived pruning.
+    
+    Args:
+        copairs (list): Pair dictionaries found after pruning
+        full_copairs (list): Pair dictionaries found by the exhaustive scan
+        
+    Returns:
+        float: Recall in [0, 1] (1.0 if the exhaustive scan found nothing)
+    """
+    if not full_copairs:
+        return 1.0
+    found = {pair['tickers'] for pair in copairs}
+    return sum(pair['tickers'] in found for pair in full_copairs) / len(full_copairs)
+
+
+def split_pairs(pairs, chunk_size):
+    """
+    Split a pair index array into contiguous chunks of near-equal size.
+    
+    Every pair costs the same OLS+ADF work, so equal pair counts give
+    balanced work units.
+    
+    Args:
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        chunk_size (int): Target number of pairs per chunk
+        
+    Returns:
+        list: List of (P_k, 2) arrays, in the original pair order
+    """
+    n_chunks = max(1, -(-len(pairs) // chunk_size))
+    return np.array_split(pairs, n_chunks)
+
+
+# Per-process state for parallel scan workers, set once by _init_scan_worker
+_SCAN_STATE = {}
+
+
+def _share_array(arr):
+    """Copy an array into a new shared memory block; return (block, spec)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _init_scan_worker(specs, tickers, significance, chunk_size):
+    """Attach a worker process to the shared moment arrays."""
+    _SCAN_STATE['blocks'] = []
+    moments = {}
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _SCAN_STATE['blocks'].append(shm)
+        moments[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _SCAN_STATE.update(moments=moments, tickers=tickers,
+                       significance=significance, chunk_size=chunk_size)
+
+
+def _scan_chunk(chunk_no, pairs):
+    """Scan one work unit inside a worker process."""
+    copairs = batch_scan_pairs(None, _SCAN_STATE['tickers'], pairs,
+                               significance=_SCAN_STATE['significance'],
+                               chunk_size=_SCAN_STATE['chunk_size'],
+                               moments=_SCAN_STATE['moments'])
+    return chunk_no, len(pairs), copairs
+
+
+def iter_parallel_scan(log_prices, tickers, pairs, significance=0.05, workers=4,
+                       chunk_size=1000, progress=True):
+    """
+    Run batch_scan_pairs over a process pool and yield results as chunks finish.
+    
+    The log price moments are computed once in the parent and placed in
+    shared memory, so workers read the price matrix without pickling it.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        tickers (list): Ticker symbols matching the columns of log_prices
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        significance (float): Significance level for ADF test (default: 0.05)
+        workers (int): Number of worker processes (default: 4)
+        chunk_size (int): Number of pairs per work unit (default: 1000)
+        progress (bool): Print progress as chunks complete (default: True)
+        
+    Yields:
+        tuple: (chunk_no, copairs) in completion order; chunk_no is the
+               position of the chunk in split_pairs(pairs, chunk_size)
+    """
+    chunks = split_pairs(pairs, chunk_size)
+    moments = log_price_moments(log_prices)
+    blocks, specs = [], {}
+    try:
+        for key, arr in moments.items():
+            shm, specs[key] = _share_array(arr)
+            blocks.append(shm)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker,
+                                 initargs=(specs, list(tickers), significance, chunk_size)) as executor:
+            futures = [executor.submit(_scan_chunk, k, chunk) for k, chunk in enumerate(chunks)]
+            done = 0
+            for future in as_completed(futures):
+                chunk_no, n_tested, copairs = future.result()
+                done += n_tested
+                if progress:
+                    logger.info(f"  Tested {done}/{len(pairs)} pairs...")
+                yield chunk_no, copairs
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def parallel_scan_pairs(log_prices, tickers, pairs, significance=0.05, workers=4,
+                        chunk_size=1000, progress=True):
+    """
+    Test many pairs for cointegration on a process pool.
+    
+    Chunk results are merged back in chunk order, so the output is identical
+    to batch_scan_pairs on the same inputs.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        tickers (list): Ticker symbols matching the columns of log_prices
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        significance (float): Significance level for ADF test (default: 0.05)
+        workers (int): Number of worker processes (default: 4)
+        chunk_size (int): Number of pairs per work unit (default: 1000)
+        progress (bool): Print progress as chunks complete (default: True)
+        
+    Returns:
+        list: Cointegrated pair dictionaries, in the order of pairs
+    """
+    by_chunk = dict(iter_parallel_scan(log_prices, tickers, pairs, significance=significance,
+                                       workers=workers, chunk_size=chunk_size, progress=progress))
+    return [pair for k in sorted(by_chunk) for pair in by_chunk[k]]
+
+
+def shard_pairs(pairs, shard, num_shards):
+    """
+    Return the pairs owned by shard k of n.
+    
+    The pair index is cut into n contiguous, near-equal slices, so the
+    partition depends only on the universe size and concatenating the shards
+    in order restores the full pair order.
+    
+    Args:
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        shard (int): Zero-based shard number
+        num_shards (int): Total number of shards
+        
+    Returns:
+        np.ndarray: (P_k, 2) pairs for this shard
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(f'shard must be in [0, {num_shards}), got {shard}')
+    return np.array_split(pairs, num_shards)[shard]
+
+
+def merge_shards(shard_dir='shards', num_shards=None, save_top_n=10):
+    """
+    Combine per-shard scan results, then sort and save the global top N.
+    
+    Args:
+        shard_dir (str): Directory holding shard files
+        num_shards (int, optional): Expected shard count. If None, taken from the shard files.
+        save_top_n (int): Number of top pairs to save (default: 10)
+        
+    Returns:
+        list: All cointegrated pair dictionaries, sorted by p-value
+        
+    Raises:
+        ValueError: If shards are missing, duplicated, come from different scans or do not
+            add up to the unsharded candidate list
+    """
+    payloads = load_shards(shard_dir)
+    if not payloads:
+        raise ValueError(f'No shard files found in {shard_dir}')
+    if num_shards is None:
+        num_shards = payloads[0]['num_shards']
+
+    seen = {}
+    for payload in payloads:
+        if payload['num_shards'] != num_shards:
+            raise ValueError(f"Shard {payload['shard']} is from a {payload['num_shards']}-shard run, "
+                             f"expected {num_shards}")
+        if payload['tickers'] != payloads[0]['tickers'] or payload['significance'] != payloads[0]['significance'] \
+                or payload.get('n_candidates') != payloads[0].get('n_candidates'):
+            raise ValueError(f"Shard {payload['shard']} was scanned with a different universe or significance")
+        if payload['shard'] in seen:
+            raise ValueError(f"Duplicate shard {payload['shard']} of {num_shards}")
+        seen[payload['shard']] = payload
+
+    missing = sorted(set(range(num_shards)) - set(seen))
+    if missing:
+        raise ValueError(f'Missing shards {missing} of {num_shards}')
+
+    copairs = [pair for k in range(num_shards) for pair in seen[k]['pairs']]
+    n_tested = sum(payload['n_tested'] for payload in payloads)
+    # shards partition the candidate list, so together they test exactly the unsharded set
+    n_candidates = payloads[0].get('n_candidates')
+    if n_candidates is not None and n_tested != n_candidates:
+        raise ValueError(f'Shards tested {n_tested} pairs, expected {n_candidates}')
+    logger.info(f"Merged {num_shards} shards: {n_tested} pairs tested, {len(copairs)} cointegrated")
+    report_and_save_pairs(copairs, save_top_n)
+    return copairs
+
+
+def find_cointegrated_pairs(significance=0.05, save_top_n=10, batch=False, chunk_size=1000, workers=1,
+                            shard=None, num_shards=1, shard_dir='shards', prune=None, check_recall=False,
+                            use_store=False, out_of_core=False, results_file=None, tickers=None,
+                            pairs_file='cointegrated_pairs.pkl'):
     """
     Find cointegrated stock pairs using Engle-Granger method and save top N.
     
     Args:
         significance (float): Significance level for ADF test (default: 0.05)
         save_top_n (int): Number of top pairs to save (default: 5)
+        batch (bool): Fit all pairwise regressions from shared sufficient
+            statistics instead of one statsmodels OLS per pair (default: False)
+        chunk_size (int): Pairs per chunk in batch mode (default: 1000)
+        workers (int): Worker processes for the scan; above 1 runs the batch
+            scan on a process pool (default: 1)
+        shard (int, optional): Run only shard k of num_shards of the pair index
+            and write its results to shard_dir instead of saving the top N.
+            Combine the shard files afterwards with merge_shards.
+        num_shards (int): Total number of shards (default: 1)
+        shard_dir (str): Directory for per-shard result files (default: 'shards')
+        prune (dict or bool, optional): Correlation pre-screening settings passed to
+            prune_candidate_pairs; True uses get_default_pruning(). None tests every pair.
+        check_recall (bool): Also run the exhaustive scan and log the share of
+            its pairs that survived pruning (default: False)
+        use_store (bool): Read prices from the memory-mapped price store
+            (utils.store) instead of parsing the data file (default: False)
+        out_of_core (bool): Fold over chunks of the data file with chunked_test_pairs
+            instead of loading it; tests every pair in-process (default: False)
+        results_file (str, optional): Also save every tested pair, significant or
+            not, with run metadata to this parquet pair store (utils.pairstore)
+        tickers (list, optional): Universe to scan. If None, uses get_default_tickers().
+        pairs_file (str, optional): Pickle file the top N pairs are saved to; None
+            only logs them (default: 'cointegrated_pairs.pkl')
         
     Returns:
         list: List of cointegrated pair dictionaries
     """
     file_path = get_stock_data_path()
-    df = load_data(file_path)
-    df = get_close_cols(df)
+    tickers = tickers or get_default_tickers()
+    if results_file and shard is not None:
+        raise ValueError('results_file needs the full pair universe; run it without shard')
+    # with a results file every tested pair is kept, then filtered at significance
+    test_level = np.inf if results_file else significance
+    parameters = {'significance': significance, 'batch': batch, 'prune': prune,
+                  'out_of_core': out_of_core, 'tickers': list(tickers)}
+    if out_of_core:
+        if workers > 1 or shard is not None or prune or use_store:
+            raise ValueError('out_of_core scans run alone, without workers, shard, prune or use_store')
+        pairs = pair_index(len(tickers))
+        results = chunked_test_pairs(file_path, tickers, pairs, chunk_size=chunk_size)
+        copairs = significant_pairs(tickers, pairs, results, test_level)
+        return _finish_scan(copairs, significance, save_top_n, results_file, file_path, None, parameters,
+                            pairs_file)
+
+    if use_store:
+        store = open_price_store(file_path)
+        df = store_to_frame(store)
+    else:
+        df = load_data(file_path)
+        df = get_close_cols(df)
     # drop na
-    tickers = get_default_tickers()
+
+    if batch or workers > 1 or shard is not None or prune:
+        # log-transform the close matrix once for the whole universe
+        close = store_close_matrix(store, tickers) if use_store else get_close_matrix(df, tickers)
+        # row-major output keeps results bit-identical between store and file reads
+        log_prices = np.log(close, order='C')
+        pairs = pair_index(len(tickers))
+        if prune:
+            settings = get_default_pruning() if prune is True else prune
+            candidates, _ = prune_candidate_pairs(log_prices, **settings)
+        else:
+            candidates = pairs
+        n_candidates = len(candidates)
+        if shard is not None:
+            if check_recall:
+                raise ValueError('check_recall needs the full pair universe; run it without shard')
+            candidates = shard_pairs(candidates, shard, num_shards)
+
+        copairs = _scan(log_prices, tickers, candidates, test_level, chunk_size, workers)
+        if prune and check_recall:
+            full_copairs = _scan(log_prices, tickers, pairs, significance, chunk_size, workers)
+            kept = [pair for pair in copairs if pair['pvalue'] < significance]
+            logger.info(f"Pruning recall vs exhaustive scan: {pruning_recall(kept, full_copairs):.2%}")
+        if shard is not None:
+            save_shard({
+                'shard': shard,
+                'num_shards': num_shards,
+                'tickers': list(tickers),
+                'significance': significance,
+                'n_tested': len(candidates),
+                'n_candidates': n_candidates,
+                'pairs': copairs
+            }, shard_dir=shard_dir)
+            return copairs
+        return _finish_scan(copairs, significance, save_top_n, results_file, file_path, df['Date'],
+                            parameters, pairs_file)
 
     """Engle Granger Test"""
+    from statsmodels.tsa.stattools import adfuller
     copairs = []
     for i in range(len(tickers)):
         for j in range(i + 1, len(tickers)):
@@ -59,9 +693,11 @@ def find_cointegrated_pairs(significance=0.05, save_top_n=10):
             ticker2 = tickers[j]
             results = engle_granger_test(df[f"Close__{ticker1}"], df[f"Close__{ticker2}"])
             # get the residuals from the engle granger test and run the adf test
-            adf_fuller_results = adfuller(results.resid)
+            with stage('adf'):
+                adf_fuller_results = adfuller(results.resid)
+            add_count('pairs_tested')
             # if the signifiance level is less than the pvalue reject the null hypothesis and do not use the pair
-            if adf_fuller_results[1] < significance:
+            if adf_fuller_results[1] < test_level:
                 copairs.append({
                     'pvalue': adf_fuller_results[1],
                     'adf_statistic': adf_fuller_results[0],  # More negative = stronger
@@ -71,17 +707,113 @@ def find_cointegrated_pairs(significance=0.05, save_top_n=10):
                     'r_squared': results.rsquared            # Regression fit quality
                 })
 
+    return _finish_scan(copairs, significance, save_top_n, results_file, file_path, df['Date'],
+                        parameters, pairs_file)
+
+
+def _finish_scan(copairs, significance, save_top_n, results_file, file_path, dates, parameters,
+                 pairs_file):
+    """Save the pair store if requested, then report and save the significant pairs."""
+    if results_file:
+        dates = None if dates is None else pd.to_datetime(dates)
+        save_pair_results(copairs, results_file, metadata={
+            'created': pd.Timestamp.now().isoformat(),
+            'source': os.path.abspath(file_path),
+            'source_fingerprint': source_fingerprint(file_path, 'hash'),
+            'date_range': None if dates is None else [str(dates.min()), str(dates.max())],
+            'n_tested': len(copairs),
+            'parameters': parameters,
+        })
+        copairs = [pair for pair in copairs if pair['pvalue'] < significance]
+    report_and_save_pairs(copairs, save_top_n, pairs_file)
+    return copairs
+
+
+def _scan(log_prices, tickers, pairs, significance, chunk_size, workers):
+    """Run the batch scan in-process or on a process pool depending on workers."""
+    if workers > 1:
+        return parallel_scan_pairs(log_prices, tickers, pairs, significance=significance,
+                                   workers=workers, chunk_size=chunk_size)
+    return batch_scan_pairs(log_prices, tickers, pairs,
+                            significance=significance, chunk_size=chunk_size)
+
+
+def report_and_save_pairs(copairs, save_top_n, pairs_file='cointegrated_pairs.pkl'):
+    """Sort pairs by p-value in place, log the top N and save them to pairs_file unless it is None."""
     copairs.sort(key=lambda x: x['pvalue'])
-    print(f"Top {min(save_top_n, len(copairs))} cointegrated pairs:")
-    print(f"{'Pair':<15} {'P-value':<12} {'ADF Stat':<10} {'Hedge Ratio':<12} {'R²':<8}")
-    print("=" * 70)
+    logger.info(f"Top {min(save_top_n, len(copairs))} cointegrated pairs:")
+    logger.info(f"{'Pair':<15} {'P-value':<12} {'ADF Stat':<10} {'Hedge Ratio':<12} {'R²':<8}")
+    logger.info("=" * 70)
     for i in range(min(save_top_n, len(copairs))):
         pair = copairs[i]
         t1, t2 = pair['tickers']
-        print(f"{t1}-{t2:<12} {pair['pvalue']:<12.6f} {pair['adf_statistic']:<10.4f} "
-              f"{pair['hedge_ratio']:<12.4f} {pair['r_squared']:<8.4f}")
+        logger.info(f"{t1}-{t2:<12} {pair['pvalue']:<12.6f} {pair['adf_statistic']:<10.4f} "
+                    f"{pair['hedge_ratio']:<12.4f} {pair['r_squared']:<8.4f}")
     # save only the top N pairs via utils
-    save_top_pairs(copairs, top_n=save_top_n, filename='cointegrated_pairs.pkl')
-    return copairs
+    if pairs_file:
+        save_top_pairs(copairs, top_n=save_top_n, filename=pairs_file)
+
+
+def main(argv=None):
+    """Command line entry point: scan (optionally one shard), merge shard files or update incrementally."""
+    parser = argparse.ArgumentParser(prog='python -m utils.cointegration',
+                                     description='Cointegrated pair scan')
+    parser.add_argument('--profile', default=None, metavar='REPORT',
+                        help='Time each stage and write a .json or .csv report')
+    parser.add_argument('--quiet', action='store_true', help='Only log warnings and errors')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help='Scan the universe, or one shard of it')
+    scan.add_argument('--significance', type=float, default=0.05)
+    scan.add_argument('--top-n', type=int, default=10)
+    scan.add_argument('--workers', type=int, default=1)
+    scan.add_argument('--chunk-size', type=int, default=1000)
+    scan.add_argument('--shard', type=int, default=None)
+    scan.add_argument('--num-shards', type=int, default=1)
+    scan.add_argument('--shard-dir', default='shards')
+    scan.add_argument('--use-store', action='store_true')
+    scan.add_argument('--out-of-core', action='store_true')
+    scan.add_argument('--results-file', default=None)
+
+    merge = commands.add_parser('merge', help='Merge shard files and save the top N pairs')
+    merge.add_argument('--shard-dir', default='shards')
+    merge.add_argument('--num-shards', type=int, default=None)
+    merge.add_argument('--top-n', type=int, default=10)
+
+    update = commands.add_parser('update', help='Fold new bars into the saved scan state')
+    update.add_argument('--significance', type=float, default=0.05)
+    update.add_argument('--top-n', type=int, default=10)
+    update.add_argument('--state-file', default='cointegration_state.npz')
+    update.add_argument('--tolerance', type=float, default=0.01)
+    update.add_argument('--adf-every', type=int, default=5)
+    update.add_argument('--chunk-size', type=int, default=1000)
+    update.add_argument('--use-store', action='store_true')
+    update.add_argument('--pairs-file', default='cointegrated_pairs.pkl')
+
+    args = parser.parse_args(argv)
+    if args.quiet:
+        set_quiet()
+    if args.profile:
+        enable_profiling()
+        reset_profile()
+    if args.command == 'scan':
+        find_cointegrated_pairs(significance=args.significance, save_top_n=args.top_n, batch=True,
+                                chunk_size=args.chunk_size, workers=args.workers,
+                                shard=args.shard, num_shards=args.num_shards, shard_dir=args.shard_dir,
+                                use_store=args.use_store, out_of_core=args.out_of_core,
+                                results_file=args.results_file)
+    elif args.command == 'update':
+        # utils.incremental builds on this module, so import it only when needed
+        from utils.incremental import update_cointegrated_pairs
+        update_cointegrated_pairs(significance=args.significance, save_top_n=args.top_n,
+                                  state_file=args.state_file, tolerance=args.tolerance,
+                                  adf_every=args.adf_every, chunk_size=args.chunk_size,
+                                  use_store=args.use_store, pairs_file=args.pairs_file)
+    else:
+        merge_shards(shard_dir=args.shard_dir, num_shards=args.num_shards, save_top_n=args.top_n)
+    if args.profile:
+        save_profile_report(args.profile)
 
 
+if __name__ == '__main__':
+    main()
@@ -20,7 +20,7 @@ def get_stock_data_path():
     Return the stock data path from environment variable.
     
     Returns:
-        str: Path to stock data file
+        str: Path to the stock data file or ingested dataset directory (see utils.ingest)
     """
     return os.getenv('stock_data_path')
 
@@ -46,3 +46,39 @@ def get_default_criteria():
     }
 
 
+def get_default_pruning():
+    """
+    Return default settings for candidate-pair pruning before the cointegration test.
+    
+    top_k must be below the universe size minus one to prune anything. 10 is
+    about half of the 19-ticker default universe, which drops about a third
+    of its pairs; for large universes it keeps roughly 10 / N of them.
+    Universes of 11 tickers or fewer keep every pair.
+    
+    Returns:
+        dict: 'top_k' neighbours kept per ticker (None keeps all),
+              'min_correlation' log-return correlation floor (None disables),
+              'n_clusters' hierarchical clusters to restrict pairs to (None disables)
+    """
+    return {
+        'top_k': 10,
+        'min_correlation': None,
+        'n_clusters': None,
+    }
+
+
+def get_cache_settings():
+    """
+    Return settings for the pair statistics cache (utils.cache).
+    
+    The disk tier is opt-in: it lives in the directory named by the
+    pair_cache_dir environment variable, and is off (memory only) if unset.
+    
+    Returns:
+        dict: 'cache_dir', 'max_items' (memory tier entries) and 'max_disk_mb'
+    """
+    return {
+        'cache_dir': os.getenv('pair_cache_dir'),
+        'max_items': 4096,
+        'max_disk_mb': 512,
+    }
@@ -0,0 +1,244 @@
+"""Incremental update of cointegration results as new bars arrive."""
+import numpy as np
+import pandas as pd
+from utils.adf import batch_adfuller
+from utils.cointegration import (batch_test_pairs, pair_index, significant_pairs,
+                                 report_and_save_pairs)
+from utils.config import get_default_tickers, get_stock_data_path
+from utils.io import iter_close_chunks, load_scan_state, save_scan_state
+from utils.preprocess import get_close_matrix
+from utils.profiling import logger
+from utils.store import load_close_frame, open_price_store, source_fingerprint, store_close_matrix
+
+
+def _add_bars(state, log_prices):
+    """Fold new rows of log prices into the running sums and cross-products."""
+    shifted = log_prices - state['shift']
+    state['n'] += len(shifted)
+    state['sum'] = state['sum'] + shifted.sum(axis=0)
+    state['cross'] = state['cross'] + shifted.T @ shifted
+
+
+def pair_ols_from_state(state, pairs):
+    """
+    Recompute alpha, beta and R² of every pair in O(1) from the running sums.
+    
+    Sums are kept around a fixed per-ticker shift, which leaves the slope
+    unchanged and limits cancellation when forming centered moments.
+    
+    Args:
+        state (dict): Scan state
+        pairs (np.ndarray): (P, 2) integer array of (i, j) column indices
+        
+    Returns:
+        dict: (P,) arrays 'alpha', 'beta' and 'r_squared'
+    """
+    i, j = pairs[:, 0], pairs[:, 1]
+    n = state['n']
+    mean = state['sum'] / n
+    cross = state['cross']
+    sxy = cross[i, j] - n * mean[i] * mean[j]
+    sxx = cross[j, j] - n * mean[j] ** 2
+    syy = cross[i, i] - n * mean[i] ** 2
+    beta = sxy / sxx
+    alpha = (mean[i] + state['shift'][i]) - beta * (mean[j] + state['shift'][j])
+    return {'alpha': alpha, 'beta': beta, 'r_squared': sxy ** 2 / (sxx * syy)}
+
+
+def build_scan_state(log_prices, dates, tickers, chunk_size=1000):
+    """
+    Run the full batch scan once and record everything the incremental update needs.
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        dates (np.ndarray): (T,) datetime64 bar dates
+        tickers (list): Ticker symbols matching the columns of log_prices
+        chunk_size (int): Pairs per chunk for the batch test (default: 1000)
+        
+    Returns:
+        dict: Scan state with the running sums, per-pair ADF results and the last bar
+    """
+    pairs = pair_index(len(tickers))
+    results = batch_test_pairs(log_prices, pairs, chunk_size=chunk_size)
+    state = {
+        'tickers': list(tickers),
+        'last_date': np.asarray(dates)[-1],
+        'last_log_close': log_prices[-1],
+        'n': 0,
+        'shift': log_prices.mean(axis=0),
+        'sum': np.zeros(len(tickers)),
+        'cross': np.zeros((len(tickers), len(tickers))),
+        'beta_tested': results['beta'],
+        'adf_statistic': results['adf_statistic'],
+        'pvalue': results['pvalue'],
+        'since_adf': np.zeros(len(pairs), dtype=np.int64),
+    }
+    _add_bars(state, log_prices)
+    return state
+
+
+def update_scan_state(state, read_log_prices, tolerance=0.01, adf_every=5, chunk_size=1000):
+    """
+    Refresh every pair's regression and re-test only the pairs that need it.
+    
+    The regression of every pair comes from the running sums in O(1). The
+    residual ADF test, which needs the full history, is re-run only for pairs
+    whose hedge ratio moved by more than tolerance (relative) since their last
+    test, or that have gone adf_every updates without one. Only the histories
+    of those pairs' legs are read.
+    
+    Args:
+        state (dict): Scan state, already updated with the new bars
+        read_log_prices (callable): Maps a sorted array of ticker column indices to
+            their (T, k) full-history log prices; called once, and only if a pair is re-tested
+        tolerance (float): Relative hedge ratio change that triggers a re-test (default: 0.01)
+        adf_every (int): Re-test every pair after this many updates; 0 disables (default: 5)
+        chunk_size (int): Pairs per chunk for re-tests (default: 1000)
+        
+    Returns:
+        dict: (P,) arrays 'alpha', 'beta', 'r_squared', 'adf_statistic', 'pvalue'
+              and 'retested' (bool)
+    """
+    pairs = pair_index(len(state['tickers']))
+    ols = pair_ols_from_state(state, pairs)
+    moved = np.abs(ols['beta'] - state['beta_tested']) > tolerance * np.abs(state['beta_tested'])
+    retest = moved | ((state['since_adf'] >= adf_every) if adf_every else False)
+    if not retest.any():
+        return {**ols, 'adf_statistic': state['adf_statistic'], 'pvalue': state['pvalue'],
+                'retested': retest}
+
+    columns = np.unique(pairs[retest])
+    log_prices = read_log_prices(columns)
+    # positions of each pair's legs among the columns read
+    legs = np.searchsorted(columns, pairs)
+    for start in range(0, len(pairs), chunk_size):
+        chunk = np.flatnonzero(retest[start:start + chunk_size]) + start
+        if not len(chunk):
+            continue
+        i, j = legs[chunk, 0], legs[chunk, 1]
+        resid = log_prices[:, i] - (ols['alpha'][chunk] + ols['beta'][chunk] * log_prices[:, j])
+        adf = batch_adfuller(resid)
+        state['adf_statistic'][chunk] = adf['adf_statistic']
+        state['pvalue'][chunk] = adf['pvalue']
+        state['beta_tested'][chunk] = ols['beta'][chunk]
+        state['since_adf'][chunk] = 0
+
+    return {**ols, 'adf_statistic': state['adf_statistic'], 'pvalue': state['pvalue'],
+            'retested': retest}
+
+
+def _read_since(file_path, tickers, last_date, use_store):
+    """Dates and log prices of the bars dated on or after last_date, oldest first."""
+    # the saved state holds last_date as a 0-d array
+    last_date = np.asarray(last_date, dtype='datetime64[ns]')[()]
+    if use_store:
+        store = open_price_store(file_path)
+        first = int(np.searchsorted(store['dates'], last_date, side='left'))
+        close = store_close_matrix({**store, 'close': store['close'][first:]}, tickers)
+        return np.asarray(store['dates'][first:]), np.log(close, order='C')
+    dates, blocks = [], []
+    for chunk in iter_close_chunks(file_path, tickers, start=last_date):
+        chunk_dates = pd.to_datetime(chunk['Date']).to_numpy(dtype='datetime64[ns]')
+        rows = chunk_dates >= last_date
+        dates.append(chunk_dates[rows])
+        blocks.append(get_close_matrix(chunk[rows], tickers))
+    if not dates:
+        return np.array([], dtype='datetime64[ns]'), np.empty((0, len(tickers)))
+    return np.concatenate(dates), np.log(np.concatenate(blocks), order='C')
+
+
+def _history_unchanged(state, dates, log_prices):
+    """Whether the source still holds the state's last bar with the same closes."""
+    last_date = np.asarray(state['last_date'], dtype='datetime64[ns]')[()]
+    if not len(dates) or dates[0] != last_date:
+        return False
+    # a re-adjusted history rescales the earlier bars, including the last one
+    # folded in; same tolerance as utils.ingest
+    return bool(np.allclose(log_prices[0], state['last_log_close'], rtol=0.0, atol=1e-6, equal_nan=True))
+
+
+def _read_history(file_path, tickers, use_store):
+    """Full-history log prices of only the given tickers."""
+    if use_store:
+        return np.log(store_close_matrix(open_price_store(file_path), tickers), order='C')
+    chunks = [get_close_matrix(chunk, tickers) for chunk in iter_close_chunks(file_path, tickers)]
+    return np.log(np.concatenate(chunks), order='C')
+
+
+def _full_scan_state(file_path, tickers, chunk_size, use_store):
+    """Build the scan state from the whole file and return it with every pair's results."""
+    df = load_close_frame(file_path, use_store=use_store)
+    log_prices = np.log(get_close_matrix(df, tickers), order='C')
+    dates = pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[ns]')
+    state = build_scan_state(log_prices, dates, tickers, chunk_size=chunk_size)
+    results = {key: state[key] for key in ('adf_statistic', 'pvalue')}
+    results.update(pair_ols_from_state(state, pair_index(len(tickers))))
+    return state, results
+
+
+def update_cointegrated_pairs(significance=0.05, save_top_n=10, state_file='cointegration_state.npz',
+                              tolerance=0.01, adf_every=5, chunk_size=1000, use_store=False,
+                              tickers=None, pairs_file='cointegrated_pairs.pkl'):
+    """
+    Nightly job: fold new bars into the saved scan state and save the top N pairs.
+    
+    The first run, or a run after the ticker universe changed, does a full
+    batch scan and writes state_file. Later runs skip reading when the
+    source fingerprint is unchanged. Otherwise they read the bars from the
+    state's last date on, fold the new ones into the running sums, and read
+    full histories only for the legs of the pairs that need a re-test. If
+    the state's last bar is gone or its closes changed, e.g. after
+    utils.ingest rewrote a re-adjusted history, the state is rebuilt with a
+    full scan.
+    
+    Args:
+        significance (float): Significance level for ADF test (default: 0.05)
+        save_top_n (int): Number of top pairs to save (default: 10)
+        state_file (str): Scan state npz file (default: 'cointegration_state.npz')
+        tolerance (float): Relative hedge ratio change that triggers a re-test (default: 0.01)
+        adf_every (int): Re-test every pair after this many updates; 0 disables (default: 5)
+        chunk_size (int): Pairs per chunk (default: 1000)
+        use_store (bool): Read prices from the memory-mapped price store (default: False)
+        tickers (list, optional): Universe to scan. If None, uses get_default_tickers().
+        pairs_file (str, optional): Pickle file the top N pairs are saved to; None
+            only logs them (default: 'cointegrated_pairs.pkl')
+            
+    Returns:
+        list: List of cointegrated pair dictionaries
+    """
+    file_path = get_stock_data_path()
+    tickers = list(tickers or get_default_tickers())
+    pairs = pair_index(len(tickers))
+    # fingerprint before reading, so a write during the update is seen next time
+    fingerprint = source_fingerprint(file_path)
+
+    state = load_scan_state(state_file)
+    if state is None or state['tickers'] != tickers or 'last_log_close' not in state:
+        logger.info(f"Building scan state for {len(pairs)} pairs")
+        state, results = _full_scan_state(file_path, tickers, chunk_size, use_store)
+    else:
+        changed = any(state[f'source_{key}'] != fingerprint[key] for key in ('mtime_ns', 'size'))
+        dates, log_prices = np.array([], dtype='datetime64[ns]'), None
+        if changed:
+            dates, log_prices = _read_since(file_path, tickers, state['last_date'], use_store)
+        if changed and not _history_unchanged(state, dates, log_prices):
+            logger.warning("Stored history changed since the last update; rebuilding the scan state")
+            state, results = _full_scan_state(file_path, tickers, chunk_size, use_store)
+        else:
+            added = max(len(dates) - 1, 0)
+            if added:
+                _add_bars(state, log_prices[1:])
+                state['last_date'] = dates[-1]
+                state['last_log_close'] = log_prices[-1]
+                state['since_adf'] += 1
+            results = update_scan_state(
+                state, lambda columns: _read_history(file_path, [tickers[k] for k in columns], use_store),
+                tolerance=tolerance, adf_every=adf_every, chunk_size=chunk_size)
+            logger.info(f"Added {added} bars; re-tested {int(results['retested'].sum())}/{len(pairs)} pairs")
+
+    state['source_mtime_ns'] = fingerprint['mtime_ns']
+    state['source_size'] = fingerprint['size']
+    save_scan_state(state, state_file)
+    copairs = significant_pairs(tickers, pairs, results, significance)
+    report_and_save_pairs(copairs, save_top_n, pairs_file)
+    return copairs
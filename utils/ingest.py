@@ -0,0 +1,332 @@
+"""Incremental, parallel market-data ingestion into a date-partitioned parquet dataset."""
+import abc
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.io import dataset_partitions, load_data, read_partition
+from utils.profiling import logger
+
+
+MANIFEST = '_manifest.json'
+
+
+class Fetcher(abc.ABC):
+    """Source of daily bars for one ticker at a time; subclass and implement fetch."""
+
+    @abc.abstractmethod
+    def fetch(self, ticker, start, end):
+        """
+        Fetch the bars of one ticker in [start, end).
+        
+        Args:
+            ticker (str): Ticker symbol
+            start (pd.Timestamp): First date to fetch (inclusive)
+            end (pd.Timestamp): Date to stop at (exclusive)
+            
+        Returns:
+            pd.DataFrame: Bars indexed by Date with one column per field ('Close', 'Open', ...)
+        """
+
+
+class YFinanceFetcher(Fetcher):
+    """Fetch adjusted daily bars from Yahoo Finance via yfinance."""
+
+    def __init__(self, auto_adjust=True):
+        """
+        Args:
+            auto_adjust (bool): Download split/dividend adjusted prices (default: True)
+        """
+        self.auto_adjust = auto_adjust
+
+    def fetch(self, ticker, start, end):
+        """
+        Download the daily bars of one ticker in [start, end) from Yahoo Finance.
+        
+        With auto_adjust, every bar is back-adjusted for splits and dividends
+        up to the download date, so the same bar can change between runs;
+        ingest detects this by re-fetching each ticker's last stored bar.
+        
+        Args:
+            ticker (str): Ticker symbol
+            start (pd.Timestamp): First date to fetch (inclusive)
+            end (pd.Timestamp): Date to stop at (exclusive)
+            
+        Returns:
+            pd.DataFrame: Bars indexed by tz-naive Date with Open, High, Low, Close and Volume columns
+        """
+        import yfinance as yf
+        df = yf.download(ticker, start=start, end=end, auto_adjust=self.auto_adjust,
+                         progress=False, threads=False)
+        if isinstance(df.columns, pd.MultiIndex):
+            # single-ticker downloads still come back as (field, ticker) columns
+            df.columns = df.columns.get_level_values(0)
+        df.index = pd.to_datetime(df.index).tz_localize(None)
+        df.index.name = 'Date'
+        return df
+
+
+class FileFetcher(Fetcher):
+    """Serve bars from an existing {Field}__{TICKER} data file; an offline stand-in for tests."""
+
+    def __init__(self, file_path):
+        """
+        Args:
+            file_path (str): Parquet or CSV file (or dataset directory) to serve bars from
+        """
+        df = load_data(file_path)
+        self.df = df.assign(Date=pd.to_datetime(df['Date'])).set_index('Date').sort_index()
+
+    def fetch(self, ticker, start, end):
+        """Return the file's {Field}__{ticker} columns in [start, end), renamed to the fields."""
+        suffix = f'__{ticker}'
+        cols = [col for col in self.df.columns if col.endswith(suffix)]
+        rows = (self.df.index >= start) & (self.df.index < end)
+        bars = self.df.loc[rows, cols]
+        bars.columns = [col[:-len(suffix)] for col in cols]
+        return bars.dropna(how='all')
+
+
+def load_manifest(root):
+    """
+    Load the ingestion manifest of a dataset.
+    
+    Args:
+        root (str): Dataset directory
+        
+    Returns:
+        dict: 'first_date' and 'last_date' (ticker -> pd.Timestamp) of each ticker's
+              stored bars and 'last_close' (ticker -> Close on its last date);
+              empty maps for a new dataset
+    """
+    manifest = {'first_date': {}, 'last_date': {}, 'last_close': {}}
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return manifest
+    with open(path) as f:
+        saved = json.load(f)
+    for key in ('first_date', 'last_date'):
+        manifest[key] = {ticker: pd.Timestamp(date) for ticker, date in saved.get(key, {}).items()}
+    manifest['last_close'] = saved.get('last_close', {})
+    return manifest
+
+
+def _save_manifest(root, manifest):
+    """Write the manifest under a temporary name and rename it into place."""
+    path = os.path.join(root, MANIFEST)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    saved = {key: {ticker: date.strftime('%Y-%m-%d') for ticker, date in sorted(manifest[key].items())}
+             for key in ('first_date', 'last_date')}
+    saved['last_close'] = {ticker: float(close) for ticker, close in sorted(manifest['last_close'].items())}
+    with open(tmp_path, 'w') as f:
+        json.dump(saved, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _fetch_with_retry(fetcher, ticker, start, end, retries, backoff):
+    """Call fetcher.fetch, retrying with exponential backoff; return (ticker, bars or error)."""
+    for attempt in range(retries + 1):
+        try:
+            return ticker, fetcher.fetch(ticker, start, end)
+        except Exception as error:  # any source failure is retried, then reported
+            if attempt == retries:
+                return ticker, error
+            time.sleep(backoff * 2 ** attempt)
+
+
+def write_partitions(root, bars, run_id):
+    """
+    Append a wide frame of new bars to the dataset, one part file per month.
+    
+    Args:
+        root (str): Dataset directory
+        bars (pd.DataFrame): New bars indexed by Date with {Field}__{TICKER} columns
+        run_id (str): Name shared by the part files of this run
+        
+    Returns:
+        list: Paths of the part files written
+    """
+    from fastparquet import write
+    written = []
+    for month, frame in bars.groupby(bars.index.to_period('M')):
+        directory = os.path.join(root, f'date={month}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'part-{run_id}.parquet')
+        tmp_path = f'{path}.tmp'
+        write(tmp_path, frame.reset_index(), file_scheme='simple', write_index=False)
+        os.replace(tmp_path, path)
+        written.append(path)
+    return written
+
+
+def rewrite_partitions(root, bars, tickers, run_id):
+    """
+    Replace the stored history of some tickers, rewriting each affected month.
+    
+    The month's part files are merged, the tickers' old columns dropped and
+    the new bars joined in; the result is written as one new part file before
+    the old ones are removed, so an interrupted rewrite leaves the old values
+    readable and is redone by the next run.
+    
+    Args:
+        root (str): Dataset directory
+        bars (pd.DataFrame): Replacement bars indexed by Date with {Field}__{TICKER} columns
+        tickers (list): Tickers whose stored columns are replaced
+        run_id (str): Name of the new part files
+        
+    Returns:
+        list: Paths of the part files written
+    """
+    from fastparquet import write
+    suffixes = tuple(f'__{ticker}' for ticker in tickers)
+    months = bars.index.to_period('M')
+    stored = {month: files for month, files in dataset_partitions(root)
+              if months.min() <= month <= months.max()}
+    written = []
+    for month in sorted(set(stored) | set(months)):
+        frame = bars[months == month]
+        old_files = stored.get(month, [])
+        if old_files:
+            merged = read_partition(old_files)
+            merged = merged.assign(Date=pd.to_datetime(merged['Date'])).set_index('Date')
+            kept = merged[[col for col in merged.columns if not col.endswith(suffixes)]]
+            frame = kept.join(frame, how='outer')
+        directory = os.path.join(root, f'date={month}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'part-{run_id}.parquet')
+        tmp_path = f'{path}.tmp'
+        frame = frame[sorted(frame.columns, key=lambda col: col.split('__')[0] != 'Close')]
+        write(tmp_path, frame.rename_axis('Date').reset_index(), file_scheme='simple', write_index=False)
+        os.replace(tmp_path, path)
+        for filename in old_files:
+            os.remove(filename)
+        written.append(path)
+    return written
+
+
+def _run_id():
+    """Part file name unique to this write; later writes sort after earlier ones."""
+    return f'{time.time_ns()}-{os.getpid()}'
+
+
+def _fetch_all(fetcher, jobs, end, max_workers, retries, backoff):
+    """Fetch ticker -> start jobs on a bounded thread pool; return (ticker, bars or error) tuples."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda ticker: _fetch_with_retry(fetcher, ticker, jobs[ticker], end,
+                                                                  retries, backoff), jobs))
+
+
+def _is_readjusted(bars, date, close):
+    """Whether a re-fetched ticker no longer matches its stored Close on its last stored date."""
+    if date not in bars.index or 'Close' not in bars.columns:
+        return True
+    return not np.isclose(bars.at[date, 'Close'], close, rtol=1e-6, atol=0.0)
+
+
+def ingest(tickers, root='stock_data', fetcher=None, start='2023-10-01', end=None, max_workers=8,
+           retries=3, backoff=1.0):
+    """
+    Fetch only the bars each ticker is missing and append them to the dataset.
+    
+    Each ticker is fetched from its last ingested date (or from start if new)
+    up to end, on a bounded thread pool with retry and exponential backoff.
+    The re-fetched last bar is compared with the Close stored in the
+    manifest: adjusted prices (YFinanceFetcher's default) are rewritten after
+    a split or dividend, so on a mismatch the ticker's whole history is
+    re-fetched and the affected partitions are rewritten. Otherwise new bars
+    are written as new part files under root/date=YYYY-MM/ using the
+    {Field}__{TICKER} column convention, and existing files are left alone.
+    The manifest is updated after the data files, so an interrupted run is
+    simply redone. Point stock_data_path at root to read the dataset.
+    
+    Args:
+        tickers (list): Ticker symbols to refresh
+        root (str): Dataset directory (default: 'stock_data')
+        fetcher (Fetcher, optional): Data source. If None, uses YFinanceFetcher().
+        start (str): First date for tickers not yet in the dataset (default: '2023-10-01')
+        end (str, optional): Date to stop at (exclusive). If None, fetches through today.
+        max_workers (int): Concurrent fetches (default: 8)
+        retries (int): Retries per ticker after the first failure (default: 3)
+        backoff (float): Seconds before the first retry, doubling each time (default: 1.0)
+        
+    Returns:
+        dict: 'updated' tickers, 'rows' new dates written, 'readjusted' tickers whose
+              history was rewritten, 'failed' ticker -> error and 'files' part files written
+    """
+    fetcher = fetcher or YFinanceFetcher()
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+    os.makedirs(root, exist_ok=True)
+    manifest = load_manifest(root)
+    last_date = manifest['last_date']
+
+    jobs = {}
+    for ticker in dict.fromkeys(tickers):
+        if ticker not in last_date:
+            if pd.Timestamp(start) < end:
+                jobs[ticker] = pd.Timestamp(start)
+        elif last_date[ticker] + pd.Timedelta(days=1) < end:
+            # re-fetch the last stored bar to detect a re-adjusted history
+            jobs[ticker] = last_date[ticker]
+    logger.info(f"Fetching {len(jobs)} of {len(tickers)} tickers with missing bars")
+    results = _fetch_all(fetcher, jobs, end, max_workers, retries, backoff)
+
+    failed, fetched, readjusted = {}, {}, {}
+    for ticker, bars in results:
+        if isinstance(bars, Exception):
+            failed[ticker] = bars
+        elif ticker in manifest['last_close'] and \
+                _is_readjusted(bars, last_date[ticker], manifest['last_close'][ticker]):
+            readjusted[ticker] = manifest['first_date'].get(ticker, pd.Timestamp(start))
+        else:
+            fetched[ticker] = bars
+    if readjusted:
+        logger.warning(f"Stored history no longer matches the source for {sorted(readjusted)}; re-fetching it")
+        for ticker, bars in _fetch_all(fetcher, readjusted, end, max_workers, retries, backoff):
+            if isinstance(bars, Exception):
+                failed[ticker] = bars
+                del readjusted[ticker]
+            else:
+                fetched[ticker] = bars
+
+    history, columns = [], []
+    for ticker, bars in fetched.items():
+        since = jobs[ticker] if ticker not in last_date else last_date[ticker] + pd.Timedelta(days=1)
+        bars = bars[bars.index >= readjusted.get(ticker, since)].dropna(how='all')
+        bars.columns = [f'{field}__{ticker}' for field in bars.columns]
+        if ticker in readjusted:
+            history.append(bars[bars.index <= last_date[ticker]])
+            bars = bars[bars.index > last_date[ticker]]
+        if len(bars):
+            columns.append(bars)
+
+    files, rows = [], 0
+    if history:
+        wide = pd.concat(history, axis=1).sort_index()
+        files += rewrite_partitions(root, wide, list(readjusted), _run_id())
+    if columns:
+        wide = pd.concat(columns, axis=1).sort_index()
+        wide.index.name = 'Date'
+        # Close columns first, as in the downloaded files
+        wide = wide[sorted(wide.columns, key=lambda col: col.split('__')[0] != 'Close')]
+        files += write_partitions(root, wide, _run_id())
+        rows = len(wide)
+    for bars in history + columns:
+        ticker = bars.columns[0].split('__', 1)[1]
+        close = bars[f'Close__{ticker}'].dropna()
+        if len(close):
+            if ticker not in last_date:
+                manifest['first_date'][ticker] = close.index.min()
+            if close.index.max() >= last_date.get(ticker, close.index.max()):
+                last_date[ticker] = close.index.max()
+                manifest['last_close'][ticker] = close.iloc[-1]
+    if history or columns:
+        _save_manifest(root, manifest)
+
+    for ticker, error in failed.items():
+        logger.error(f"FAILED {ticker}: {error}")
+    updated = [bars.columns[0].split('__', 1)[1] for bars in columns]
+    logger.info(f"Ingested {rows} new dates for {len(updated)} tickers into {len(files)} part files")
+    return {'updated': updated, 'rows': rows, 'readjusted': list(readjusted), 'failed': failed,
+            'files': files}
@@ -1,14 +1,62 @@
 """I/O utilities for loading and saving data."""
+import glob
+import os
 import pickle
+import numpy as np
 import pandas as pd
+from utils.profiling import add_count, logger, peak_memory_mb, stage, timed
 
 
+def dataset_partitions(root):
+    """
+    List the monthly partitions of a date-partitioned dataset written by utils.ingest.
+    
+    Args:
+        root (str): Dataset directory holding date=YYYY-MM/part-*.parquet files
+        
+    Returns:
+        list: (pd.Period month, list of part files) tuples, oldest month first
+    """
+    partitions = []
+    for path in sorted(glob.glob(os.path.join(root, 'date=*'))):
+        files = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+        if files:
+            partitions.append((pd.Period(os.path.basename(path)[len('date='):], freq='M'), files))
+    return partitions
+
+
+def read_partition(files, columns=None):
+    """
+    Read and merge the part files of one partition into a single frame.
+    
+    Part files written by different ingestion runs hold different tickers
+    (or later bars of the same tickers); they are aligned on Date, taking
+    each column's first non-null value.
+    
+    Args:
+        files (list): Part file paths, oldest run first
+        columns (list, optional): Columns to read, including 'Date'. If None, reads all.
+        
+    Returns:
+        pd.DataFrame: One row per Date, sorted by Date
+    """
+    from fastparquet import ParquetFile
+    frames = []
+    for filename in files:
+        parquet = ParquetFile(filename)
+        present = None if columns is None else [col for col in columns if col in parquet.columns]
+        frames.append(parquet.to_pandas(columns=present))
+    merged = pd.concat(frames, ignore_index=True).groupby('Date', sort=True).first().reset_index()
+    return merged if columns is None else merged.reindex(columns=columns)
+
+
+@timed('data_load')
 def load_data(file_path):
     """
-    Load stock data from parquet or CSV file.
+    Load stock data from parquet or CSV file, or from an ingested dataset directory.
     
     Args:
-        file_path (str): Path to data file
+        file_path (str): Path to data file or dataset directory (see utils.ingest)
         
     Returns:
         pd.DataFrame: Loaded stock data
@@ -16,6 +64,9 @@ def load_data(file_path):
     Raises:
         ValueError: If file type is not supported
     """
+    if os.path.isdir(file_path):
+        frames = [read_partition(files) for _, files in dataset_partitions(file_path)]
+        return pd.concat(frames, ignore_index=True)
     if file_path.endswith('.parquet'):
         return pd.read_parquet(file_path, engine='fastparquet')
     if file_path.endswith('.csv'):
@@ -23,18 +74,119 @@ def load_data(file_path):
     raise ValueError(f'Unsupported file type: {file_path}')
 
 
-def load_pairs(filename='cointegrated_pairs.pkl'):
+def _row_filter(chunk, start, end):
+    """Keep the rows of a chunk whose Date lies in [start, end]."""
+    dates = pd.to_datetime(chunk['Date'])
+    keep = np.ones(len(chunk), dtype=bool)
+    if start is not None:
+        keep &= (dates >= start).to_numpy()
+    if end is not None:
+        keep &= (dates <= end).to_numpy()
+    return chunk if keep.all() else chunk[keep].reset_index(drop=True)
+
+
+def iter_close_chunks(file_path, tickers=None, start=None, end=None, chunk_rows=100_000):
+    """
+    Read Date and Close columns chunk by chunk without loading the whole file.
+    
+    Only the Date and Close__{TICKER} columns are read. For parquet, chunks
+    are the file's row groups and the date range is also used to skip row
+    groups whose Date statistics fall outside it; for an ingested dataset
+    directory, chunks are its monthly partitions; CSV files are read in
+    chunk_rows blocks. Rows outside [start, end] are dropped from each chunk.
+    When the iteration finishes, the largest chunk and the process's peak
+    memory are logged.
+    
+    Args:
+        file_path (str): Path to the parquet or CSV data file, or a dataset directory
+        tickers (list, optional): Tickers to read, in column order. If None, reads every Close column.
+        start (str or pd.Timestamp, optional): First date to keep (inclusive)
+        end (str or pd.Timestamp, optional): Last date to keep (inclusive)
+        chunk_rows (int): Rows per chunk for CSV files (default: 100000)
+        
+    Yields:
+        pd.DataFrame: Date and Close price columns for one chunk
+        
+    Raises:
+        ValueError: If file type is not supported
     """
-    Load cointegrated pairs from pickle file.
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    if os.path.isdir(file_path):
+        from fastparquet import ParquetFile
+        partitions = [(month, files) for month, files in dataset_partitions(file_path)
+                      if (start is None or month.end_time >= start)
+                      and (end is None or month.start_time <= end)]
+        available = list(dict.fromkeys(col for _, files in partitions for filename in files
+                                       for col in ParquetFile(filename).columns))
+    elif file_path.endswith('.parquet'):
+        from fastparquet import ParquetFile
+        parquet = ParquetFile(file_path)
+        available = parquet.columns
+        filters = ([('Date', '>=', start)] if start is not None else []) + \
+                  ([('Date', '<=', end)] if end is not None else [])
+    elif file_path.endswith('.csv'):
+        available = pd.read_csv(file_path, nrows=0).columns.tolist()
+    else:
+        raise ValueError(f'Unsupported file type: {file_path}')
+
+    if tickers is None:
+        columns = ['Date'] + [col for col in available if 'Close' in col]
+    else:
+        columns = ['Date'] + [f"Close__{ticker}" for ticker in tickers]
+
+    if os.path.isdir(file_path):
+        chunks = (read_partition(files, columns) for _, files in partitions)
+    elif file_path.endswith('.parquet'):
+        chunks = parquet.iter_row_groups(columns=columns, filters=filters or None)
+    else:
+        chunks = pd.read_csv(file_path, usecols=columns, chunksize=chunk_rows)
+
+    rows, largest = 0, 0
+    chunks = iter(chunks)
+    while True:
+        # chunks are read lazily: time only the read, not the caller's work on each chunk
+        with stage('data_load'):
+            chunk = next(chunks, None)
+            if chunk is not None:
+                chunk = _row_filter(chunk[columns], start, end)
+        if chunk is None:
+            break
+        if not len(chunk):
+            continue
+        rows += len(chunk)
+        add_count('rows_read', len(chunk))
+        largest = max(largest, int(chunk.memory_usage(index=False).sum()))
+        yield chunk
+    logger.info(f'Read {rows} rows x {len(columns) - 1} close columns from {file_path}; '
+                f'largest chunk {largest / 2 ** 20:.1f} MiB, peak RSS {peak_memory_mb():.1f} MiB')
+
+
+def load_pairs(filename='cointegrated_pairs.pkl', max_pvalue=None, top_n=None):
+    """
+    Load cointegrated pairs from a pickle file or a parquet pair store.
+    
+    A pair store (utils.pairstore) is queried directly, so only matching
+    rows are read.
     
     Args:
-        filename (str): Path to pickle file
+        filename (str): Path to pickle file or '.parquet' pair store
+        max_pvalue (float, optional): Keep pairs with p-value below this
+        top_n (int, optional): Keep the top_n lowest p-values
         
     Returns:
         list: List of cointegrated pair dictionaries
     """
+    if filename.endswith('.parquet'):
+        from utils.pairstore import frame_to_pairs, read_pair_results
+        return frame_to_pairs(read_pair_results(filename, max_pvalue=max_pvalue, top_n=top_n))
     with open(filename, 'rb') as f:
-        return pickle.load(f)
+        pairs = pickle.load(f)
+    if max_pvalue is not None:
+        pairs = [pair for pair in pairs if pair['pvalue'] < max_pvalue]
+    if top_n is not None:
+        pairs = sorted(pairs, key=lambda x: x['pvalue'])[:top_n]
+    return pairs
 
 
 def save_top_pairs(pairs, top_n=10, filename='cointegrated_pairs.pkl'):
@@ -47,12 +199,103 @@ def save_top_pairs(pairs, top_n=10, filename='cointegrated_pairs.pkl'):
         filename (str): Output pickle file path
     """
     if not pairs:
-        print('No pairs to save.')
+        logger.warning('No pairs to save.')
         return
     pairs_sorted = sorted(pairs, key=lambda x: x['pvalue'])
     top_pairs = pairs_sorted[:top_n]
     with open(filename, 'wb') as f:
         pickle.dump(top_pairs, f)
-    print(f'Saved top {len(top_pairs)} pairs to {filename}')
+    logger.info(f'Saved top {len(top_pairs)} pairs to {filename}')
 
 
+def shard_filename(shard, num_shards, shard_dir='shards'):
+    """
+    Return the path of the result file for shard k of n.
+    
+    Args:
+        shard (int): Zero-based shard number
+        num_shards (int): Total number of shards
+        shard_dir (str): Directory holding shard files
+        
+    Returns:
+        str: Path to the shard file
+    """
+    return os.path.join(shard_dir, f'shard_{shard:05d}_of_{num_shards:05d}.pkl')
+
+
+def save_shard(payload, shard_dir='shards'):
+    """
+    Write one shard's scan results to its per-shard pickle file.
+    
+    The file is written under a temporary name and renamed into place, so a
+    merge never sees a half-written shard.
+    
+    Args:
+        payload (dict): Shard results with at least 'shard' and 'num_shards' keys
+        shard_dir (str): Directory holding shard files
+        
+    Returns:
+        str: Path of the written shard file
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    filename = shard_filename(payload['shard'], payload['num_shards'], shard_dir)
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'wb') as f:
+        pickle.dump(payload, f)
+    os.replace(tmp_filename, filename)
+    logger.info(f"Saved shard {payload['shard']}/{payload['num_shards']} to {filename}")
+    return filename
+
+
+def load_shards(shard_dir='shards'):
+    """
+    Load every shard result file found in a directory.
+    
+    Args:
+        shard_dir (str): Directory holding shard files
+        
+    Returns:
+        list: Shard payload dictionaries, sorted by file name
+    """
+    payloads = []
+    for filename in sorted(glob.glob(os.path.join(shard_dir, 'shard_*_of_*.pkl'))):
+        with open(filename, 'rb') as f:
+            payloads.append(pickle.load(f))
+    return payloads
+
+
+def save_scan_state(state, filename='cointegration_state.npz'):
+    """
+    Save incremental scan state (sufficient statistics and last ADF results) to an npz file.
+    
+    Args:
+        state (dict): Scan state as built by utils.incremental
+        filename (str): Output npz file path
+    """
+    arrays = {key: np.asarray(value) for key, value in state.items()}
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_filename, filename)
+
+
+def load_scan_state(filename='cointegration_state.npz'):
+    """
+    Load incremental scan state saved by save_scan_state.
+    
+    Args:
+        filename (str): Path to npz file
+        
+    Returns:
+        dict: Scan state, or None if the file does not exist
+    """
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename, allow_pickle=False) as data:
+        state = {key: data[key] for key in data.files}
+    state['tickers'] = state['tickers'].tolist()
+    state['n'] = int(state['n'])
+    for key in ('source_mtime_ns', 'source_size'):
+        if key in state:
+            state[key] = int(state[key])
+    return state
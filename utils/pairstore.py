@@ -0,0 +1,144 @@
+"""Columnar, schema-versioned store of pair test results."""
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils.profiling import logger
+
+
+PAIR_STORE_VERSION = 1
+PAIR_COLUMNS = ['t1', 't2', 'pvalue', 'adf_statistic', 'hedge_ratio', 'intercept', 'r_squared']
+
+
+def pairs_to_frame(copairs):
+    """
+    Convert pair dictionaries into the pair store's columnar layout.
+    
+    Args:
+        copairs (list): Pair dictionaries as built by find_cointegrated_pairs
+        
+    Returns:
+        pd.DataFrame: One row per pair with the PAIR_COLUMNS columns
+    """
+    frame = pd.DataFrame({
+        't1': [pair['tickers'][0] for pair in copairs],
+        't2': [pair['tickers'][1] for pair in copairs],
+    })
+    for key in PAIR_COLUMNS[2:]:
+        frame[key] = np.array([pair[key] for pair in copairs], dtype=np.float64)
+    return frame
+
+
+def frame_to_pairs(frame):
+    """
+    Convert pair store rows back into pair dictionaries.
+    
+    Args:
+        frame (pd.DataFrame): Rows read with read_pair_results
+        
+    Returns:
+        list: Pair dictionaries with the keys used by find_cointegrated_pairs
+    """
+    columns = {key: frame[key].to_numpy() for key in PAIR_COLUMNS[2:] if key in frame}
+    pairs = []
+    for k, tickers in enumerate(zip(frame['t1'], frame['t2'])):
+        pair = {key: float(values[k]) for key, values in columns.items()}
+        pair['tickers'] = tickers
+        pairs.append(pair)
+    return pairs
+
+
+def save_pair_results(copairs, filename='cointegration_results.parquet', metadata=None,
+                      row_group_size=50_000):
+    """
+    Save every tested pair to a parquet pair store, sorted by p-value.
+    
+    Rows are sorted by p-value, so top-N reads stop after the first row
+    groups and p-value filters skip row groups by their statistics. The
+    schema version and run metadata are stored in the file footer.
+    
+    Args:
+        copairs (list or pd.DataFrame): Pair dictionaries, or a frame with PAIR_COLUMNS
+        filename (str): Output parquet file (default: 'cointegration_results.parquet')
+        metadata (dict, optional): Run metadata (data fingerprint, date range, parameters)
+        row_group_size (int): Rows per row group (default: 50000)
+    """
+    from fastparquet import write
+    frame = copairs if isinstance(copairs, pd.DataFrame) else pairs_to_frame(copairs)
+    frame = frame[PAIR_COLUMNS].sort_values('pvalue', kind='stable').reset_index(drop=True)
+    footer = {'pair_store_version': str(PAIR_STORE_VERSION),
+              'run_metadata': json.dumps(metadata or {}, default=str)}
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    write(tmp_filename, frame, row_group_offsets=row_group_size, write_index=False,
+          custom_metadata=footer)
+    os.replace(tmp_filename, filename)
+    logger.info(f'Saved {len(frame)} tested pairs to {filename}')
+
+
+def _open_pair_store(filename):
+    """Open a pair store and check its schema version."""
+    from fastparquet import ParquetFile
+    parquet = ParquetFile(filename)
+    version = parquet.key_value_metadata.get('pair_store_version')
+    if version != str(PAIR_STORE_VERSION):
+        raise ValueError(f'{filename} has pair store version {version}, expected {PAIR_STORE_VERSION}')
+    return parquet
+
+
+def read_pair_metadata(filename='cointegration_results.parquet'):
+    """
+    Read the run metadata of a pair store without reading any rows.
+    
+    Args:
+        filename (str): Pair store file
+        
+    Returns:
+        dict: Run metadata as saved by save_pair_results
+        
+    Raises:
+        ValueError: If the file's schema version is not PAIR_STORE_VERSION
+    """
+    return json.loads(_open_pair_store(filename).key_value_metadata['run_metadata'])
+
+
+def read_pair_results(filename='cointegration_results.parquet', max_pvalue=None, tickers=None,
+                      top_n=None, columns=None):
+    """
+    Read pairs from a pair store, filtered and/or limited to the best top_n.
+    
+    Args:
+        filename (str): Pair store file
+        max_pvalue (float, optional): Keep pairs with p-value below this
+        tickers (list, optional): Keep pairs with at least one leg in these tickers
+        top_n (int, optional): Keep the top_n lowest p-values after filtering
+        columns (list, optional): Columns to read besides t1 and t2. If None, reads all.
+        
+    Returns:
+        pd.DataFrame: Matching rows in ascending p-value order
+        
+    Raises:
+        ValueError: If the file's schema version is not PAIR_STORE_VERSION
+    """
+    parquet = _open_pair_store(filename)
+    read = PAIR_COLUMNS if columns is None else \
+        list(dict.fromkeys(['t1', 't2', 'pvalue'] + list(columns)))
+    filters = [('pvalue', '<', max_pvalue)] if max_pvalue is not None else None
+    wanted = None if tickers is None else set(tickers)
+
+    frames, rows = [], 0
+    for chunk in parquet.iter_row_groups(columns=read, filters=filters):
+        keep = np.ones(len(chunk), dtype=bool)
+        if max_pvalue is not None:
+            keep &= (chunk['pvalue'] < max_pvalue).to_numpy()
+        if wanted is not None:
+            keep &= (chunk['t1'].isin(wanted) | chunk['t2'].isin(wanted)).to_numpy()
+        chunk = chunk[keep]
+        frames.append(chunk)
+        rows += len(chunk)
+        # rows are sorted by p-value, so later row groups cannot rank higher
+        if top_n is not None and rows >= top_n:
+            break
+    if not frames:
+        return pd.DataFrame(columns=read)
+    frame = pd.concat(frames, ignore_index=True)
+    return frame if top_n is None else frame.head(top_n)
@@ -0,0 +1,211 @@
+"""Headless scan -> select -> backtest pipeline with lazily imported, on-disk cached stages."""
+import argparse
+import importlib
+import json
+import os
+import pickle
+import time
+from utils.cache import make_key
+from utils.config import get_default_criteria, get_default_tickers, get_stock_data_path
+from utils.profiling import enable_profiling, logger, reset_profile, save_profile_report, set_quiet
+
+
+# Bump when a stage's output format or logic changes, so old cached outputs are not reused
+PIPELINE_VERSION = 2
+
+
+def _run_scan(params, inputs):
+    """Scan the universe; the output doubles as the pairs file of the select stage."""
+    from utils.cointegration import find_cointegrated_pairs
+    # the cached output is the pairs file, so the scan itself writes nothing
+    copairs = find_cointegrated_pairs(params['significance'], save_top_n=params['top_n'], batch=True,
+                                      chunk_size=params['chunk_size'], workers=params['workers'],
+                                      tickers=params['tickers'], pairs_file=None)
+    return sorted(copairs, key=lambda pair: pair['pvalue'])[:params['top_n']]
+
+
+def _run_select(params, inputs):
+    """Apply the trading criteria to the scanned pairs."""
+    from utils.analysis import select_good_pairs
+    with open(inputs['scan'], 'rb') as f:
+        copairs = pickle.load(f)
+    if not copairs:
+        return {'good_pairs': [], 'pair_results': [], 'pairs': []}
+    good_pairs, pair_results = select_good_pairs(params['criteria'], pairs_file=inputs['scan'])
+    # keep the scanned pair dicts of the selection, since tickers may contain '-'
+    by_name = {'-'.join(pair['tickers']): pair for pair in copairs}
+    return {'good_pairs': good_pairs, 'pair_results': pair_results,
+            'pairs': [by_name[result['Pair']] for result in good_pairs]}
+
+
+def _run_backtest(params, inputs):
+    """Backtest the selected pairs with rolling z-score hysteresis signals."""
+    import numpy as np
+    import pandas as pd
+    from utils.backtest import batch_backtest
+    from utils.preprocess import get_close_matrix
+    from utils.signals import batch_generate_positions, batch_rolling_zscore
+    from utils.spread import batch_calculate_spread
+    from utils.store import load_close_frame
+    with open(inputs['select'], 'rb') as f:
+        pairs = pickle.load(f)['pairs']
+    if not pairs:
+        return pd.DataFrame()
+    tickers = sorted({ticker for pair in pairs for ticker in pair['tickers']})
+    df = load_close_frame(get_stock_data_path())
+    close = get_close_matrix(df, tickers)
+    leg1 = np.array([tickers.index(pair['tickers'][0]) for pair in pairs])
+    leg2 = np.array([tickers.index(pair['tickers'][1]) for pair in pairs])
+    spread = batch_calculate_spread(np.log(close), leg1, leg2,
+                                    np.array([pair['hedge_ratio'] for pair in pairs]),
+                                    np.array([pair['intercept'] for pair in pairs]))
+    z = batch_rolling_zscore(spread, params['window'])
+    positions = batch_generate_positions(z, params['entry'], params['exit'])
+    bt = batch_backtest(close, tickers, pairs, positions, cost=params['cost'], dates=df['Date'])
+    summary = bt.trade_summary()
+    summary.insert(2, 'PValue', [pair['pvalue'] for pair in pairs])
+    return summary.sort_values('Sharpe', ascending=False, ignore_index=True)
+
+
+# name -> (upstream stages, heavy modules imported only when the stage runs, function)
+STAGES = {
+    'scan': ((), ('utils.cointegration',), _run_scan),
+    'select': (('scan',), ('utils.analysis',), _run_select),
+    'backtest': (('select',), ('utils.backtest', 'utils.signals', 'utils.spread', 'utils.store'),
+                 _run_backtest),
+}
+
+
+def default_pipeline_params():
+    """
+    Return the default parameters of every pipeline stage.
+    
+    Returns:
+        dict: Stage name -> parameter dict
+    """
+    return {
+        'scan': {'significance': 0.05, 'top_n': 10, 'chunk_size': 1000, 'workers': 1,
+                 'tickers': get_default_tickers()},
+        'select': {'criteria': None},
+        'backtest': {'window': 60, 'entry': 1.5, 'exit': 0.0, 'cost': 0.0005},
+    }
+
+
+def _data_fingerprint(validate):
+    """Fingerprint of the configured data file, imported lazily since utils.store needs pandas."""
+    from utils.store import source_fingerprint
+    return json.dumps(source_fingerprint(get_stock_data_path(), validate), sort_keys=True)
+
+
+def run_pipeline(until='backtest', params=None, cache_dir='.pipeline_cache', force=(), validate='mtime'):
+    """
+    Run the pipeline stages up to until, skipping stages whose inputs are unchanged.
+    
+    Each stage's output is pickled to cache_dir under a key made from the
+    data file fingerprint, the stage's parameters, PIPELINE_VERSION and the
+    keys of its upstream stages, so changing a parameter reruns that stage
+    and everything downstream of it. A stage's heavy modules (statsmodels
+    via utils.cointegration, ...) are imported only if the stage runs, and
+    their import time is reported separately.
+    
+    Args:
+        until (str): Last stage to run: 'scan', 'select' or 'backtest' (default: 'backtest')
+        params (dict, optional): Stage name -> parameter overrides on top of default_pipeline_params()
+        cache_dir (str): Directory of cached stage outputs (default: '.pipeline_cache')
+        force (tuple): Stages to rerun even if cached
+        validate (str): Data fingerprint, 'mtime' or 'hash', see utils.store.source_fingerprint
+        
+    Returns:
+        dict: 'outputs' stage name -> output, 'paths' stage name -> cached file
+              and 'timings' stage name -> {'cached', 'import_seconds', 'run_seconds'}
+    """
+    settings = default_pipeline_params()
+    for name, overrides in (params or {}).items():
+        settings[name].update(overrides)
+    # key the select stage on the criteria actually applied, so changed defaults invalidate it
+    if settings['select']['criteria'] is None:
+        settings['select']['criteria'] = get_default_criteria()
+    os.makedirs(cache_dir, exist_ok=True)
+    fingerprint = _data_fingerprint(validate)
+    keys, paths, outputs, timings = {}, {}, {}, {}
+
+    def resolve(name):
+        if name in keys:
+            return
+        deps, modules, run = STAGES[name]
+        for dep in deps:
+            resolve(dep)
+        keys[name] = make_key(name, [], version=PIPELINE_VERSION, data=fingerprint,
+                              params=json.dumps(settings[name], sort_keys=True, default=str),
+                              upstream=[keys[dep] for dep in deps])
+        paths[name] = os.path.join(cache_dir, f'{name}-{keys[name]}.pkl')
+        if os.path.exists(paths[name]) and name not in force:
+            with open(paths[name], 'rb') as f:
+                outputs[name] = pickle.load(f)
+            timings[name] = {'cached': True, 'import_seconds': 0.0, 'run_seconds': 0.0}
+            logger.info(f'{name}: cached ({keys[name][:12]})')
+            return
+
+        start = time.perf_counter()
+        for module in modules:
+            importlib.import_module(module)
+        imported = time.perf_counter()
+        outputs[name] = run(settings[name], {dep: paths[dep] for dep in deps})
+        finished = time.perf_counter()
+        tmp_path = f'{paths[name]}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(outputs[name], f)
+        os.replace(tmp_path, paths[name])
+        timings[name] = {'cached': False, 'import_seconds': imported - start,
+                         'run_seconds': finished - imported}
+        logger.info(f'{name}: ran in {finished - imported:.2f} s (imports {imported - start:.2f} s)')
+
+    resolve(until)
+    return {'outputs': outputs, 'paths': paths, 'timings': timings}
+
+
+def main(argv=None):
+    """Command line entry point: run the pipeline and save the backtest summary."""
+    parser = argparse.ArgumentParser(prog='python -m utils.pipeline',
+                                     description='Scan, select and backtest cointegrated pairs')
+    parser.add_argument('--until', choices=list(STAGES), default='backtest')
+    parser.add_argument('--force', nargs='*', choices=list(STAGES), default=[])
+    parser.add_argument('--cache-dir', default='.pipeline_cache')
+    parser.add_argument('--validate', choices=['mtime', 'hash'], default='mtime')
+    parser.add_argument('--tickers', nargs='+', default=None)
+    parser.add_argument('--significance', type=float, default=0.05)
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--window', type=int, default=60)
+    parser.add_argument('--entry', type=float, default=1.5)
+    parser.add_argument('--exit', type=float, default=0.0)
+    parser.add_argument('--cost', type=float, default=0.0005)
+    parser.add_argument('--output', default='backtest_summary.csv')
+    parser.add_argument('--profile', default=None, metavar='REPORT',
+                        help='Time each stage and write a .json or .csv report')
+    parser.add_argument('--quiet', action='store_true', help='Only log warnings and errors')
+    args = parser.parse_args(argv)
+    if args.quiet:
+        set_quiet()
+    if args.profile:
+        enable_profiling()
+        reset_profile()
+
+    params = {
+        'scan': {'significance': args.significance, 'top_n': args.top_n, 'workers': args.workers},
+        'backtest': {'window': args.window, 'entry': args.entry, 'exit': args.exit, 'cost': args.cost},
+    }
+    if args.tickers:
+        params['scan']['tickers'] = args.tickers
+    result = run_pipeline(args.until, params, cache_dir=args.cache_dir, force=tuple(args.force),
+                          validate=args.validate)
+    if args.until == 'backtest':
+        summary = result['outputs']['backtest']
+        summary.to_csv(args.output, index=False)
+        logger.info(f'Saved backtest summary of {len(summary)} pairs to {args.output}')
+    if args.profile:
+        save_profile_report(args.profile)
+
+
+if __name__ == '__main__':
+    main()
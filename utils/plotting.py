@@ -1,21 +1,89 @@
-"""Plotting utilities for visualization."""
+"""Plotting utilities for visualization; matplotlib and seaborn are imported on first plot."""
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import seaborn as sns
+import pandas as pd
+from utils.analysis import pair_statistics
+from utils.cache import get_default_cache
 from utils.io import load_pairs
-from utils.spread import calculate_spread
-from utils.stats import calculate_rolling_correlation
+from utils.pairstore import pairs_to_frame, read_pair_results
+from utils.profiling import logger
 
 
-def plot_pair_analysis(df, pair_results):
+def downsample_indices(y, max_points=2000, method='minmax'):
+    """
+    Choose which points of a long series to draw.
+    
+    'minmax' keeps the first minimum and maximum of each of max_points // 2
+    equal buckets, so spikes survive; 'lttb' (largest triangle three buckets)
+    keeps one point per bucket that best preserves the visual shape. NaN
+    points are never selected by 'lttb' and only stand in for all-NaN
+    buckets with 'minmax', so gaps still show.
+    
+    Args:
+        y (np.ndarray): (T,) series values
+        max_points (int): Most points to keep (default: 2000)
+        method (str): 'minmax' or 'lttb' (default: 'minmax')
+        
+    Returns:
+        np.ndarray: Sorted indices into y; all of them if T <= max_points
+        
+    Raises:
+        ValueError: If method is not 'minmax' or 'lttb'
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    if method == 'minmax':
+        n_buckets = max(max_points // 2, 1)
+        size = -(-n // n_buckets)
+        padded = np.full(n_buckets * size, np.nan)
+        padded[:n] = y
+        buckets = padded.reshape(n_buckets, size)
+        offset = np.arange(n_buckets) * size
+        lows = offset + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+        highs = offset + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+        return np.unique(np.concatenate([lows, highs, [n - 1]]).clip(max=n - 1))
+    if method == 'lttb':
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid) <= max_points:
+            return valid
+        x, v = valid.astype(np.float64), y[valid]
+        # first and last points are kept; the rest are split into max_points - 2 buckets
+        edges = np.linspace(1, len(v) - 1, max_points - 1).astype(np.intp)
+        keep = np.empty(max_points, dtype=np.intp)
+        keep[0], keep[-1] = 0, len(v) - 1
+        for b in range(max_points - 2):
+            lo, hi = edges[b], edges[b + 1]
+            nxt = slice(hi, edges[b + 2]) if b + 2 < len(edges) else slice(len(v) - 1, len(v))
+            ax, ay = x[keep[b]], v[keep[b]]
+            cx, cy = x[nxt].mean(), v[nxt].mean()
+            area = np.abs((ax - cx) * (v[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+            keep[b + 1] = lo + np.argmax(area)
+        return valid[keep]
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+def plot_pair_analysis(df, pair_results, max_points=2000, method='minmax', filename=None, dpi=100,
+                       source=None):
     """
     Create a 4-panel plot for cointegration analysis of a trading pair.
     
+    Series longer than max_points bars are downsampled with
+    downsample_indices before drawing; the histogram uses every bar.
+    
     Args:
         df (pd.DataFrame): DataFrame containing stock data with Date column
         pair_results (dict): Dictionary containing pair analysis results
+        max_points (int): Most points drawn per line (default: 2000)
+        method (str): Downsampling method, 'minmax' or 'lttb' (default: 'minmax')
+        filename (str, optional): Save the figure here and close it instead of showing it
+        dpi (int): Resolution of saved figures (default: 100)
+        source (dict, optional): utils.store.source_fingerprint of the data df came from;
+            source_fingerprint(get_stock_data_path()) reuses run_analysis's cache entries
     """
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
     ticker1, ticker2 = pair_results['Pair'].split('-')
     close_col1 = f"Close__{ticker1}"
     close_col2 = f"Close__{ticker2}"
@@ -23,102 +91,194 @@ def plot_pair_analysis(df, pair_results):
     hedge_ratio = pair_results['Hedge Ratio']
     half_life = pair_results['Half Life']
     intercept = pair_results.get('Intercept', 0)
-    spread, _, _ = calculate_spread(df[close_col1], df[close_col2], hedge_ratio, intercept)
-    rolling_correlation = calculate_rolling_correlation(df[close_col1], df[close_col2])
+    # same cache entry as run_analysis for the same source, so the statistics are not recomputed
+    close = df[[close_col1, close_col2]].to_numpy(dtype=np.float64)
+    stats = pair_statistics(close, [ticker1, ticker2],
+                            [{'tickers': (ticker1, ticker2), 'hedge_ratio': hedge_ratio, 'intercept': intercept}],
+                            cache=get_default_cache(), source=source)
+    spread = stats['spread'][:, 0]
+    rolling_correlation = stats['rolling_correlation'][:, 0]
+    dates = df['Date'].to_numpy()
+
+    def line(ax, values, **kwargs):
+        rows = downsample_indices(values, max_points, method)
+        ax.plot(dates[rows], values[rows], **kwargs)
 
     fig, axes = plt.subplots(2, 2, figsize=(12, 8))
     fig.suptitle(f'{ticker1} vs {ticker2} Cointegration Analysis')
 
     # Plot 1: Price comparison
     # normalize the prices to the first day
-    axes[0,0].plot(df['Date'], df[close_col1]/df[close_col1].iloc[0], label=ticker1, alpha=0.7)
-    axes[0,0].plot(df['Date'], df[close_col2]/df[close_col2].iloc[0], label=ticker2, alpha=0.7)
+    line(axes[0,0], close[:, 0] / close[0, 0], label=ticker1, alpha=0.7)
+    line(axes[0,0], close[:, 1] / close[0, 1], label=ticker2, alpha=0.7)
     axes[0,0].set_title('Price Comparison')
     axes[0,0].legend()
     axes[0,0].grid(True)
 
     # Plot 2: Spread
-    axes[0,1].plot(df['Date'], spread, color='red', alpha=0.7)
-    axes[0,1].axhline(y=spread.mean(), color='black', linestyle='--', alpha=0.5)
+    line(axes[0,1], spread, color='red', alpha=0.7)
+    axes[0,1].axhline(y=np.nanmean(spread), color='black', linestyle='--', alpha=0.5)
     axes[0,1].set_title(f'Spread (Half-life: {half_life:.1f} days)')
     axes[0,1].grid(True)
 
     # Plot 3: Rolling correlation
-    axes[1,0].plot(df['Date'], rolling_correlation, color='green', alpha=0.7)
+    line(axes[1,0], rolling_correlation, color='green', alpha=0.7)
     axes[1,0].axhline(y=0.5, color='black', linestyle='--', alpha=0.5)
     axes[1,0].set_title('Rolling Correlation (30-day)')
     axes[1,0].grid(True)
 
     # Plot 4: Spread histogram
-    axes[1,1].hist(spread.dropna(), bins=30, alpha=0.7, color='purple')
+    axes[1,1].hist(spread[~np.isnan(spread)], bins=30, alpha=0.7, color='purple')
     axes[1,1].set_title('Spread Distribution')
     axes[1,1].grid(True)
 
-    for ax in axes.flat:
+    # the histogram's x axis holds spread values, not dates
+    for ax in axes.flat[:3]:
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
         ax.tick_params(axis='x', rotation=45)
 
-    plt.tight_layout()
-    plt.show()
+    if filename:
+        # fixed margins: tight_layout measures every tick label and dominates batch export time
+        fig.subplots_adjust(left=0.06, right=0.98, bottom=0.12, top=0.9, hspace=0.45, wspace=0.2)
+        fig.savefig(filename, dpi=dpi)
+        plt.close(fig)
+    else:
+        plt.tight_layout()
+        plt.show()
+
+
+# Per-process state for chart export workers, set once by _init_chart_worker
+_CHART_STATE = {}
+
+
+def _init_chart_worker(df, options):
+    """Switch a worker to the non-interactive Agg backend and store the shared price frame."""
+    import matplotlib
+    matplotlib.use('Agg')
+    _CHART_STATE.update(df=df, options=options)
 
 
-def create_pvalue_heatmap(pairs_file='cointegrated_pairs.pkl'):
+def _export_chart(pair_result, filename):
+    """Render one pair's chart to a file in a worker."""
+    plot_pair_analysis(_CHART_STATE['df'], pair_result, filename=filename, **_CHART_STATE['options'])
+    return filename
+
+
+def export_pair_charts(df, pair_results, out_dir='charts', workers=4, fmt='png', max_points=2000,
+                       method='minmax', dpi=100):
+    """
+    Render plot_pair_analysis charts of many pairs to files in parallel.
+    
+    Each worker process uses matplotlib's Agg backend and receives the price
+    frame, reduced to the Date and Close columns of the charted pairs, once.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing stock data with Date column
+        pair_results (list): Pair analysis dictionaries, e.g. from select_good_pairs
+        out_dir (str): Output directory (default: 'charts')
+        workers (int): Worker processes (default: 4)
+        fmt (str): Image format and file extension (default: 'png')
+        max_points (int): Most points drawn per line (default: 2000)
+        method (str): Downsampling method, 'minmax' or 'lttb' (default: 'minmax')
+        dpi (int): Resolution (default: 100)
+        
+    Returns:
+        list: Paths of the files written, in the order of pair_results
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    os.makedirs(out_dir, exist_ok=True)
+    tickers = dict.fromkeys(ticker for result in pair_results for ticker in result['Pair'].split('-'))
+    df = df[['Date'] + [f'Close__{ticker}' for ticker in tickers]]
+    options = {'max_points': max_points, 'method': method, 'dpi': dpi}
+    filenames = [os.path.join(out_dir, f"{result['Pair']}.{fmt}") for result in pair_results]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_worker,
+                             initargs=(df, options)) as executor:
+        written = list(executor.map(_export_chart, pair_results, filenames))
+    logger.info(f'Saved {len(written)} pair charts to {out_dir}')
+    return written
+
+
+def _cluster_order(pvalue_matrix):
+    """Leaf order of an average-linkage clustering on p-value distance, so related tickers sit together."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+    distance = np.nan_to_num(pvalue_matrix, nan=0.0)
+    np.fill_diagonal(distance, 0.0)
+    return leaves_list(linkage(squareform(distance, checks=False), method='average'))
+
+
+def create_pvalue_heatmap(pairs_file='cointegrated_pairs.pkl', max_pvalue=None, top_n=None, order='sorted',
+                          annot=None, annot_limit=30, filename=None):
     """
     Create and show a heatmap of cointegration p-values for all pairs.
     
     Args:
-        pairs_file (str): Path to pickle file containing cointegrated pairs
+        pairs_file (str): Path to pickle file or '.parquet' pair store of cointegrated pairs
+        max_pvalue (float, optional): Only show pairs with p-value below this
+        top_n (int, optional): Only show the top_n lowest p-values
+        order (str): Ticker order, 'sorted' (alphabetical) or 'cluster' (hierarchical
+            clustering on p-values, so cointegrated groups form blocks) (default: 'sorted')
+        annot (bool, optional): Print p-values in the cells. If None, only with at
+            most annot_limit tickers; cell borders and every tick label follow the same rule.
+        annot_limit (int): Largest ticker count drawn in full detail (default: 30)
+        filename (str, optional): Save the figure here and close it
         
     Returns:
         tuple: (pvalue_matrix, tickers) - p-value matrix and ticker list
     """
-    copairs = load_pairs(pairs_file)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    if pairs_file.endswith('.parquet'):
+        # query the pair store directly instead of building pair dictionaries
+        frame = read_pair_results(pairs_file, max_pvalue=max_pvalue, top_n=top_n, columns=['pvalue'])
+    else:
+        frame = pairs_to_frame(load_pairs(pairs_file, max_pvalue=max_pvalue, top_n=top_n))
 
-    tickers = set()
-    for pair in copairs:
-        ticker1, ticker2 = pair['tickers']
-        tickers.add(ticker1)
-        tickers.add(ticker2)
-
-    tickers = sorted(list(tickers))
+    tickers = sorted(set(frame['t1']) | set(frame['t2']))
     
     # Create a matrix for p-values
     n = len(tickers)
     pvalue_matrix = np.ones((n, n))  # Initialize with 1.0 (no cointegration)
     
-    # Fill the matrix with p-values
-    for pair in copairs:
-        pvalue = pair['pvalue']
-        ticker1, ticker2 = pair['tickers']
-        idx1 = tickers.index(ticker1)
-        idx2 = tickers.index(ticker2)
-        # Matrix is symmetric
-        pvalue_matrix[idx1, idx2] = pvalue
-        pvalue_matrix[idx2, idx1] = pvalue
+    # Fill the matrix with p-values; matrix is symmetric
+    index = {ticker: k for k, ticker in enumerate(tickers)}
+    idx1 = frame['t1'].map(index).to_numpy(dtype=np.intp)
+    idx2 = frame['t2'].map(index).to_numpy(dtype=np.intp)
+    pvalue = frame['pvalue'].to_numpy(dtype=np.float64)
+    pvalue_matrix[idx1, idx2] = pvalue
+    pvalue_matrix[idx2, idx1] = pvalue
     
+    if order == 'cluster' and n > 2:
+        rows = _cluster_order(pvalue_matrix)
+        pvalue_matrix = pvalue_matrix[np.ix_(rows, rows)]
+        tickers = [tickers[k] for k in rows]
+
     # Set diagonal to NaN (a ticker with itself)
     np.fill_diagonal(pvalue_matrix, np.nan)
+    detailed = n <= annot_limit
+    annot = detailed if annot is None else annot
     
     # Create the heatmap
-    plt.figure(figsize=(14, 12))
+    fig = plt.figure(figsize=(14, 12))
     
     # Use a diverging colormap where lower p-values are darker
     # Mask values that are 1.0 (pairs not tested)
     mask = pvalue_matrix == 1.0
     
     sns.heatmap(
-        pvalue_matrix,
-        annot=True,
+        pd.DataFrame(pvalue_matrix, index=tickers, columns=tickers),
+        annot=annot,
         fmt='.4f',
         cmap='RdYlGn_r',  # Red (low p-value) to Green (high p-value)
-        xticklabels=tickers,
-        yticklabels=tickers,
+        xticklabels=True if detailed else 'auto',
+        yticklabels=True if detailed else 'auto',
         cbar_kws={'label': 'P-value'},
         vmin=0,
         vmax=0.1,  # Focus on significant range
-        linewidths=0.5,
+        linewidths=0.5 if detailed else 0.0,
         linecolor='gray',
-        mask=mask
+        mask=mask,
+        rasterized=not detailed
     )
     
     plt.title('Cointegration P-value Heatmap\n(Lower p-values = Stronger cointegration)', 
@@ -127,17 +287,20 @@ def create_pvalue_heatmap(pairs_file='cointegrated_pairs.pkl'):
     plt.ylabel('Ticker', fontsize=12)
     
     plt.tight_layout()
+    if filename:
+        fig.savefig(filename)
+        plt.close(fig)
     
     # Print summary statistics
     valid_pvalues = pvalue_matrix[~np.isnan(pvalue_matrix) & (pvalue_matrix < 1.0)]
-    print(f"\nP-value Statistics:")
-    print(f"Total pairs tested: {len(copairs)}")
-    print(f"Significant pairs (p < 0.05): {np.sum(valid_pvalues < 0.05)}")
-    print(f"Highly significant pairs (p < 0.01): {np.sum(valid_pvalues < 0.01)}")
-    print(f"Very highly significant pairs (p < 0.001): {np.sum(valid_pvalues < 0.001)}")
-    print(f"\nMin p-value: {np.min(valid_pvalues):.6f}")
-    print(f"Max p-value: {np.max(valid_pvalues):.6f}")
-    print(f"Median p-value: {np.median(valid_pvalues):.6f}")
+    logger.info(f"\nP-value Statistics:")
+    logger.info(f"Total pairs tested: {len(frame)}")
+    logger.info(f"Significant pairs (p < 0.05): {np.sum(valid_pvalues < 0.05)}")
+    logger.info(f"Highly significant pairs (p < 0.01): {np.sum(valid_pvalues < 0.01)}")
+    logger.info(f"Very highly significant pairs (p < 0.001): {np.sum(valid_pvalues < 0.001)}")
+    logger.info(f"\nMin p-value: {np.min(valid_pvalues):.6f}")
+    logger.info(f"Max p-value: {np.max(valid_pvalues):.6f}")
+    logger.info(f"Median p-value: {np.median(valid_pvalues):.6f}")
 
     return pvalue_matrix, tickers
 
@@ -1,6 +1,9 @@
 """Data preprocessing utilities."""
+import numpy as np
+from utils.profiling import timed
 
 
+@timed('close_extraction')
 def get_close_cols(df):
     """
     Extract Date and all Close price columns from DataFrame.
@@ -16,3 +19,17 @@ def get_close_cols(df):
     return df_close
 
 
+@timed('close_extraction')
+def get_close_matrix(df, tickers):
+    """
+    Extract the close prices of the given tickers as a contiguous matrix.
+    
+    Args:
+        df (pd.DataFrame): Dataframe with Close__{TICKER} columns
+        tickers (list): Ticker symbols, in the desired column order
+        
+    Returns:
+        np.ndarray: (T, N) float64 matrix of close prices
+    """
+    close_cols = [f"Close__{ticker}" for ticker in tickers]
+    return np.ascontiguousarray(df[close_cols].to_numpy(dtype=np.float64))
@@ -0,0 +1,196 @@
+"""Stage timers, counters and run reports for the pipeline, plus the shared logger."""
+import contextlib
+import csv
+import functools
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def get_logger():
+    """
+    Return the 'statarb' logger used for all pipeline summaries.
+    
+    By default it writes bare messages to stdout at INFO, so output looks like
+    the former print calls. Set the statarb_quiet environment variable or
+    call set_quiet() to keep headless runs quiet, or attach your own handlers.
+    
+    Returns:
+        logging.Logger: The shared logger
+    """
+    log = logging.getLogger('statarb')
+    if not log.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+        log.propagate = False
+        log.setLevel(logging.WARNING if os.getenv('statarb_quiet') else logging.INFO)
+    return log
+
+
+logger = get_logger()
+
+
+def set_quiet(quiet=True):
+    """
+    Silence (or restore) the INFO summaries of the pipeline.
+    
+    Args:
+        quiet (bool): Only log warnings and errors if True (default: True)
+    """
+    logger.setLevel(logging.WARNING if quiet else logging.INFO)
+
+
+def peak_memory_mb():
+    """
+    Return the peak resident memory of this process.
+    
+    Returns:
+        float: Peak RSS in MiB, or NaN where the platform does not report it
+    """
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+# Profiling state for this process; stages run in worker processes are not included
+_PROFILE = {'enabled': bool(os.getenv('statarb_profile')), 'stages': {}, 'counters': {},
+            'started': time.perf_counter()}
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def enable_profiling(enabled=True):
+    """
+    Turn stage timers and counters on or off.
+    
+    Disabled (the default unless statarb_profile is set), stage() and timed()
+    cost one flag check.
+    
+    Args:
+        enabled (bool): Record timings if True (default: True)
+    """
+    _PROFILE['enabled'] = enabled
+
+
+def reset_profile():
+    """Clear all recorded timings and counters and restart the wall clock."""
+    _PROFILE['stages'].clear()
+    _PROFILE['counters'].clear()
+    _PROFILE['started'] = time.perf_counter()
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = _PROFILE['stages'].setdefault(name, {'calls': 0, 'seconds': 0.0})
+        entry['calls'] += 1
+        entry['seconds'] += time.perf_counter() - start
+
+
+def stage(name):
+    """
+    Time a block of code under a stage name.
+    
+    Usage: ``with stage('backtest'): ...``. Time is inclusive, so a stage
+    that runs inside another is counted in both.
+    
+    Args:
+        name (str): Stage name, e.g. 'data_load', 'ols', 'adf'
+        
+    Returns:
+        contextmanager: Timer (a no-op when profiling is disabled)
+    """
+    return _timed_stage(name) if _PROFILE['enabled'] else _NULL_STAGE
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function under a stage name.
+    
+    Args:
+        name (str): Stage name
+        
+    Returns:
+        callable: Decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _PROFILE['enabled']:
+                return func(*args, **kwargs)
+            with _timed_stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_count(name, n=1):
+    """
+    Add n to a named counter, e.g. pairs tested or bars processed.
+    
+    Args:
+        name (str): Counter name
+        n (int): Amount to add (default: 1)
+    """
+    if _PROFILE['enabled']:
+        _PROFILE['counters'][name] = _PROFILE['counters'].get(name, 0) + n
+
+
+def profile_report():
+    """
+    Return the timings and counters recorded since the last reset.
+    
+    Returns:
+        dict: 'stages' name -> {'calls', 'seconds'}, 'counters' name -> value,
+              'wall_seconds' and 'peak_rss_mb'
+    """
+    return {
+        'stages': {name: dict(entry) for name, entry in _PROFILE['stages'].items()},
+        'counters': dict(_PROFILE['counters']),
+        'wall_seconds': time.perf_counter() - _PROFILE['started'],
+        'peak_rss_mb': peak_memory_mb(),
+    }
+
+
+def save_profile_report(filename='profile_report.json'):
+    """
+    Write profile_report() as JSON, or as CSV rows if filename ends with .csv.
+    
+    The CSV has columns kind, name, calls, value: one 'stage' row per stage
+    (value in seconds), one 'counter' row per counter and 'run' rows for
+    wall_seconds and peak_rss_mb.
+    
+    Args:
+        filename (str): Output path (default: 'profile_report.json')
+        
+    Returns:
+        dict: The report that was written
+    """
+    report = profile_report()
+    if filename.endswith('.csv'):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'calls', 'value'])
+            for name, entry in report['stages'].items():
+                writer.writerow(['stage', name, entry['calls'], entry['seconds']])
+            for name, value in report['counters'].items():
+                writer.writerow(['counter', name, '', value])
+            writer.writerow(['run', 'wall_seconds', '', report['wall_seconds']])
+            writer.writerow(['run', 'peak_rss_mb', '', report['peak_rss_mb']])
+    else:
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+    logger.info(f'Saved profile report to {filename}')
+    return report
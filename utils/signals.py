@@ -0,0 +1,155 @@
+"""Signal generation utilities for pairs trading."""
+import numpy as np
+import pandas as pd
+from utils.profiling import timed
+
+
+def calculate_zscore(spread: pd.Series, window: int = 60) -> pd.Series:
+    """
+    Calculate rolling z-score with a default window that avoids lookahead changes.
+    
+    Args:
+        spread (pd.Series): Spread time series
+        window (int): Rolling window size in bars (default: 60)
+        
+    Returns:
+        pd.Series: Rolling z-score of the spread
+    """
+    rolling_mean = spread.rolling(window).mean()
+    rolling_std = spread.rolling(window).std()
+    return (spread - rolling_mean) / rolling_std
+
+
+def first_valid(x: np.ndarray) -> np.ndarray:
+    """
+    Return the first non-NaN value of every column (0 for all-NaN columns).
+    
+    Args:
+        x (np.ndarray): (T, P) matrix
+        
+    Returns:
+        np.ndarray: (P,) first valid values
+    """
+    valid = ~np.isnan(x)
+    first = x[np.argmax(valid, axis=0), np.arange(x.shape[1])]
+    return np.where(valid.any(axis=0), first, 0.0)
+
+
+def rolling_sums(spread) -> dict:
+    """
+    Precompute cumulative sums from which any rolling window's moments follow in O(1).
+    
+    Each column is shifted by its first valid value to limit cancellation in
+    the sum-of-squares differences; this does not change any z-score, and
+    since the shift is known from the first bar on, the streaming engine in
+    utils.streaming reproduces these sums bit for bit.
+    
+    Args:
+        spread (np.ndarray): (T, P) spread matrix (1-D is treated as one pair)
+        
+    Returns:
+        dict: 'x' (T, P) shifted spread and (T+1, P) cumulative 'sum', 'sumsq' and 'nan' counts
+    """
+    x = np.asarray(spread, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[:, None]
+    is_nan = np.isnan(x)
+    x = x - first_valid(x)
+    filled = np.where(is_nan, 0.0, x)
+    zero = np.zeros((1, x.shape[1]))
+    return {
+        'x': x,
+        'sum': np.concatenate([zero, np.cumsum(filled, axis=0)]),
+        'sumsq': np.concatenate([zero, np.cumsum(filled ** 2, axis=0)]),
+        'nan': np.concatenate([zero, np.cumsum(is_nan, axis=0)]),
+    }
+
+
+def batch_rolling_zscore(spread, window: int = 60, sums=None) -> np.ndarray:
+    """
+    Rolling z-score for many spreads from cumulative sums, O(1) per bar for any window.
+    
+    Matches calculate_zscore column by column: the first window - 1 bars and
+    any window containing a NaN give NaN, and the std uses ddof=1.
+    
+    Args:
+        spread (np.ndarray): (T, P) spread matrix (ignored if sums is given)
+        window (int): Rolling window size in bars (default: 60)
+        sums (dict, optional): Output of rolling_sums, shared across windows. If None, will be calculated.
+        
+    Returns:
+        np.ndarray: (T, P) z-scores
+    """
+    if sums is None:
+        sums = rolling_sums(spread)
+    x = sums['x']
+    z = np.full(x.shape, np.nan)
+    if window > x.shape[0]:
+        return z
+    total = sums['sum'][window:] - sums['sum'][:-window]
+    total_sq = sums['sumsq'][window:] - sums['sumsq'][:-window]
+    has_nan = (sums['nan'][window:] - sums['nan'][:-window]) > 0
+    mean = total / window
+    std = np.sqrt(np.maximum(total_sq - total * mean, 0.0) / (window - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z[window - 1:] = np.where(has_nan, np.nan, (x[window - 1:] - mean) / std)
+    return z
+
+
+@timed('positions')
+def batch_generate_positions(z, entry=2.0, exit=0.5) -> np.ndarray:
+    """
+    Generate hysteresis positions for many pairs at once (1 long spread, -1 short spread).
+    
+    Same rules as generate_positions, applied column-wise without a Python
+    loop over bars: z > entry goes short, z < -entry goes long, |z| < exit
+    goes flat, anything else holds the previous state. A NaN z-score reports
+    a flat position for that bar but leaves the held state untouched.
+    
+    Args:
+        z (np.ndarray): (T, P) z-scores, one pair per column (1-D is treated as one pair)
+        entry (float or np.ndarray): Entry threshold, scalar or per-pair (P,)
+        exit (float or np.ndarray): Exit threshold, scalar or per-pair (P,)
+        
+    Returns:
+        np.ndarray: (T, P) float positions (same shape as z)
+    """
+    z = np.asarray(z, dtype=np.float64)
+    squeeze = z.ndim == 1
+    if squeeze:
+        z = z[:, None]
+    entry = np.asarray(entry, dtype=np.float64)
+    exit = np.asarray(exit, dtype=np.float64)
+
+    # the state each bar would switch to, NaN where the state is held
+    target = np.full(z.shape, np.nan)
+    with np.errstate(invalid='ignore'):
+        flat = np.abs(z) < exit
+        long_ = z < -entry
+        short = z > entry
+    target[flat] = 0.0
+    target[long_] = 1.0
+    target[short] = -1.0
+
+    # forward-fill the last switch along bars; before any switch the state is flat
+    rows = np.arange(z.shape[0])[:, None]
+    last = np.maximum.accumulate(np.where(np.isnan(target), -1, rows), axis=0)
+    held = np.take_along_axis(target, np.maximum(last, 0), axis=0)
+    pos = np.where((last < 0) | np.isnan(z), 0.0, held)
+    return pos[:, 0] if squeeze else pos
+
+
+@timed('positions')
+def generate_positions(z: pd.Series, entry: float = 2.0, exit: float = 0.5) -> pd.Series:
+    """
+    Generate position signals from z-scores (1 long spread, -1 short spread).
+    
+    Args:
+        z (pd.Series): Z-score of the spread
+        entry (float): Enter when |z| exceeds this level (default: 2.0)
+        exit (float): Close when |z| falls below this level (default: 0.5)
+        
+    Returns:
+        pd.Series: Positions aligned to z's index
+    """
+    return pd.Series(batch_generate_positions(z.to_numpy(dtype=np.float64), entry, exit), index=z.index)
@@ -1,6 +1,6 @@
 """Spread calculation utilities."""
 import numpy as np
-import statsmodels.api as sm
+import pandas as pd
 
 
 def get_hedge_ratio(price_1, price_2):
@@ -19,6 +19,7 @@ def get_hedge_ratio(price_1, price_2):
     # where e is the error term
     # log(price_1) = beta*log(price_2) + alpha + e
     # solve for beta, use OLS (least squares)
+    import statsmodels.api as sm
     log_price_1 = np.log(price_1)
     log_price_2 = np.log(price_2)
     X = sm.add_constant(log_price_2)
@@ -31,22 +32,158 @@ def get_hedge_ratio(price_1, price_2):
     return beta, alpha  # Return BOTH
 
 
-def calculate_spread(price_1, price_2, hedge_ratio=None, intercept=None):
+def _recursive_hedge_ratio(log_y, log_x, update):
+    """
+    Run a two-parameter (alpha, beta) recursive filter over bars, vectorized across pairs.
+    
+    update(theta, cov, x, y, valid) performs one bar's filter step: it updates
+    theta in place where valid and returns the new covariance (None on the
+    first call means "initialize"). The returned estimate for bar t uses bars up to t - 1
+    only, so spreads built from it carry no lookahead; bar 0 is NaN.
+    
+    Returns:
+        tuple: (beta, alpha) as (T, P) arrays
+    """
+    log_y = np.asarray(log_y, dtype=np.float64)
+    log_x = np.asarray(log_x, dtype=np.float64)
+    n_bars, n_pairs = log_y.shape
+    theta = np.zeros((2, n_pairs))
+    cov = None
+    alpha = np.full((n_bars, n_pairs), np.nan)
+    beta = np.full((n_bars, n_pairs), np.nan)
+    seen = np.zeros(n_pairs, dtype=bool)
+    for t in range(n_bars):
+        # publish the estimate available before this bar
+        alpha[t] = np.where(seen, theta[0], np.nan)
+        beta[t] = np.where(seen, theta[1], np.nan)
+        valid = ~(np.isnan(log_y[t]) | np.isnan(log_x[t]))
+        if not valid.any():
+            continue
+        cov = update(theta, cov, log_x[t], log_y[t], valid)
+        seen |= valid
+    return beta, alpha
+
+
+def batch_rls_hedge_ratio(log_y, log_x, forgetting=0.995, init_var=1e3):
+    """
+    Walk-forward hedge ratio by recursive least squares with exponential forgetting.
+    
+    Tracks log_y = alpha + beta * log_x + e per pair with O(1) work per bar;
+    past bars are down-weighted by forgetting**age (effective window about
+    1 / (1 - forgetting) bars). With forgetting=1 it approaches expanding-window
+    OLS as init_var grows; the init_var prior shrinks the earliest estimates toward 0.
+    
+    Args:
+        log_y (np.ndarray): (T, P) log prices of the first legs
+        log_x (np.ndarray): (T, P) log prices of the second legs
+        forgetting (float): Forgetting factor in (0, 1] (default: 0.995)
+        init_var (float): Initial parameter variance; larger trusts early bars more (default: 1e3)
+        
+    Returns:
+        tuple: (beta, alpha) as (T, P) arrays; row t uses bars before t only
+    """
+    def update(theta, cov, x, y, valid):
+        if cov is None:
+            cov = np.zeros((3, len(x)))
+            cov[0] = cov[2] = init_var
+        p00, p01, p11 = cov
+        err = y - (theta[0] + theta[1] * x)
+        ph0 = p00 + p01 * x
+        ph1 = p01 + p11 * x
+        denom = forgetting + ph0 + ph1 * x
+        k0, k1 = ph0 / denom, ph1 / denom
+        theta[0] = np.where(valid, theta[0] + k0 * err, theta[0])
+        theta[1] = np.where(valid, theta[1] + k1 * err, theta[1])
+        updated = np.array([p00 - k0 * ph0, p01 - k0 * ph1, p11 - k1 * ph1]) / forgetting
+        return np.where(valid, updated, cov)
+
+    return _recursive_hedge_ratio(log_y, log_x, update)
+
+
+def batch_kalman_hedge_ratio(log_y, log_x, delta=1e-4, obs_var=1e-3, init_var=1e3):
+    """
+    Walk-forward hedge ratio from a Kalman filter with random-walk alpha and beta.
+    
+    State noise covariance is delta / (1 - delta) * I and observation noise
+    variance is obs_var; each bar costs O(1) per pair.
+    
+    Args:
+        log_y (np.ndarray): (T, P) log prices of the first legs
+        log_x (np.ndarray): (T, P) log prices of the second legs
+        delta (float): State drift rate; larger adapts faster (default: 1e-4)
+        obs_var (float): Observation noise variance (default: 1e-3)
+        init_var (float): Initial state variance (default: 1e3)
+        
+    Returns:
+        tuple: (beta, alpha) as (T, P) arrays; row t uses bars before t only
+    """
+    state_var = delta / (1.0 - delta)
+
+    def update(theta, cov, x, y, valid):
+        if cov is None:
+            cov = np.zeros((3, len(x)))
+            cov[0] = cov[2] = init_var
+        p00, p01, p11 = cov[0] + state_var, cov[1], cov[2] + state_var
+        err = y - (theta[0] + theta[1] * x)
+        ph0 = p00 + p01 * x
+        ph1 = p01 + p11 * x
+        denom = obs_var + ph0 + ph1 * x
+        k0, k1 = ph0 / denom, ph1 / denom
+        theta[0] = np.where(valid, theta[0] + k0 * err, theta[0])
+        theta[1] = np.where(valid, theta[1] + k1 * err, theta[1])
+        updated = np.array([p00 - k0 * ph0, p01 - k0 * ph1, p11 - k1 * ph1])
+        return np.where(valid, updated, cov)
+
+    return _recursive_hedge_ratio(log_y, log_x, update)
+
+
+def get_dynamic_hedge_ratio(price_1, price_2, method='rls', **params):
+    """
+    Calculate a walk-forward hedge ratio and intercept on log prices.
+    
+    Args:
+        price_1 (pd.Series): First price series
+        price_2 (pd.Series): Second price series
+        method (str): 'rls' (recursive least squares) or 'kalman' (default: 'rls')
+        **params: Filter settings passed to batch_rls_hedge_ratio or batch_kalman_hedge_ratio
+        
+    Returns:
+        tuple: (hedge_ratio, intercept) as Series aligned to price_1; each bar
+               uses only earlier bars
+    """
+    filters = {'rls': batch_rls_hedge_ratio, 'kalman': batch_kalman_hedge_ratio}
+    if method not in filters:
+        raise ValueError(f'Unsupported hedge ratio method: {method}')
+    log_y = np.log(price_1.to_numpy(dtype=np.float64))[:, None]
+    log_x = np.log(price_2.to_numpy(dtype=np.float64))[:, None]
+    beta, alpha = filters[method](log_y, log_x, **params)
+    return pd.Series(beta[:, 0], index=price_1.index), pd.Series(alpha[:, 0], index=price_1.index)
+
+
+def calculate_spread(price_1, price_2, hedge_ratio=None, intercept=None, method='ols', **params):
     """
     Calculate spread: log(price_1) - (intercept + hedge_ratio * log(price_2)).
     
+    Hedge ratio and intercept may be floats (static) or Series (walk-forward).
+    
     Args:
         price_1 (pd.Series): First price series
         price_2 (pd.Series): Second price series
-        hedge_ratio (float, optional): Hedge ratio (beta). If None, will be calculated.
-        intercept (float, optional): Intercept (alpha). If None, will be calculated.
+        hedge_ratio (float or pd.Series, optional): Hedge ratio (beta). If None, will be calculated.
+        intercept (float or pd.Series, optional): Intercept (alpha). If None, will be calculated.
+        method (str): How to calculate missing parameters: 'ols' for one static fit,
+            'rls' or 'kalman' for a walk-forward estimate (default: 'ols')
+        **params: Filter settings for the 'rls' and 'kalman' methods
         
     Returns:
         tuple: (spread, hedge_ratio, intercept)
     """
     # equation: log(price_1) - (hedge_ratio * log(price_2))
     if hedge_ratio is None or intercept is None:
-        hedge_ratio, intercept = get_hedge_ratio(price_1, price_2)
+        if method == 'ols':
+            hedge_ratio, intercept = get_hedge_ratio(price_1, price_2)
+        else:
+            hedge_ratio, intercept = get_dynamic_hedge_ratio(price_1, price_2, method=method, **params)
         
     log_price_1 = np.log(price_1)
     log_price_2 = np.log(price_2)
@@ -56,3 +193,20 @@ def calculate_spread(price_1, price_2, hedge_ratio=None, intercept=None):
     return spread, hedge_ratio, intercept
 
 
+def batch_calculate_spread(log_prices, leg1, leg2, hedge_ratio, intercept):
+    """
+    Calculate log spreads for many pairs from one log price matrix.
+    
+    Spread per pair k: log_prices[:, leg1[k]] - (intercept[k] + hedge_ratio[k] * log_prices[:, leg2[k]]).
+    
+    Args:
+        log_prices (np.ndarray): (T, N) matrix of log close prices
+        leg1 (np.ndarray): (P,) column index of the first leg of each pair
+        leg2 (np.ndarray): (P,) column index of the second leg of each pair
+        hedge_ratio (np.ndarray): (P,) hedge ratios (beta)
+        intercept (np.ndarray): (P,) intercepts (alpha)
+        
+    Returns:
+        np.ndarray: (T, P) spread matrix
+    """
+    return log_prices[:, leg1] - (intercept + hedge_ratio * log_prices[:, leg2])
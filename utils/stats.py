@@ -1,8 +1,10 @@
 """Statistical calculation utilities."""
 import numpy as np
-import statsmodels.api as sm
+from utils.adf import mackinnonp
+from utils.profiling import timed
 
 
+@timed('half_life')
 def calculate_half_life(spread):
     """
     Calculate half-life of mean reversion using Ornstein-Uhlenbeck process.
@@ -13,6 +15,7 @@ def calculate_half_life(spread):
     Returns:
         float: Half-life in days (inf if no mean reversion detected)
     """
+    import statsmodels.api as sm
     spread_clean = spread.dropna()
     # half life is the time it takes for the spread to return to the mean
     # Use Ornstein-Uhlenbeck process
@@ -35,6 +38,7 @@ def calculate_half_life(spread):
     return -np.log(2) / beta
 
 
+@timed('correlation')
 def calculate_rolling_correlation(price_1, price_2, window=30):
     """
     Calculate rolling correlation of log returns between two price series.
@@ -54,3 +58,221 @@ def calculate_rolling_correlation(price_1, price_2, window=30):
     return log_returns_1.rolling(window=window).corr(log_returns_2)
 
 
+@timed('half_life')
+def batch_half_life(spread):
+    """
+    Half-life of mean reversion for many spreads from the closed-form AR(1) slope.
+    
+    Matches calculate_half_life column by column: NaNs are dropped (joining
+    the bars around a gap), the first difference is skipped as in the
+    original, and the slope of d(s) on s(t-1) with an intercept is
+    cov / var over the remaining bars.
+    
+    Args:
+        spread (np.ndarray): (T, P) spread matrix (1-D is treated as one pair)
+        
+    Returns:
+        np.ndarray: (P,) half-lives in days (inf if no mean reversion, NaN if too short)
+    """
+    s = np.asarray(spread, dtype=np.float64)
+    if s.ndim == 1:
+        s = s[:, None]
+    valid = ~np.isnan(s)
+    rows = np.arange(s.shape[0])[:, None]
+    # previous valid bar of every bar, -1 if none
+    last_valid = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    prev = np.vstack([np.full((1, s.shape[1]), -1), last_valid[:-1]])
+    lagged = np.take_along_axis(s, np.maximum(prev, 0), axis=0)
+    # the k-th valid bar (k = 0, 1, ...) enters the regression from k = 2 on
+    used = valid & (np.cumsum(valid, axis=0) >= 3)
+
+    count = used.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        level = np.where(used, lagged, 0.0)
+        diff = np.where(used, s - lagged, 0.0)
+        level_dev = np.where(used, level - level.sum(axis=0) / count, 0.0)
+        diff_dev = np.where(used, diff - diff.sum(axis=0) / count, 0.0)
+        beta = (level_dev * diff_dev).sum(axis=0) / (level_dev ** 2).sum(axis=0)
+        half_life = np.where(beta >= 0, np.inf, -np.log(2) / beta)
+    return np.where(count >= 2, half_life, np.nan)
+
+
+@timed('correlation')
+def batch_rolling_correlation(close, leg1, leg2, window=30):
+    """
+    Rolling correlation of log returns for many pairs from cumulative-sum moments.
+    
+    Log returns are computed once per ticker and gathered into pair legs;
+    each window's correlation follows from differences of cumulative sums in
+    O(1) per bar. Matches calculate_rolling_correlation column by column: the
+    first window bars and any window containing a NaN give NaN.
+    
+    Args:
+        close (np.ndarray): (T, N) close price matrix
+        leg1 (np.ndarray): (P,) column index of the first leg of each pair
+        leg2 (np.ndarray): (P,) column index of the second leg of each pair
+        window (int): Rolling window size in days (default: 30)
+        
+    Returns:
+        np.ndarray: (T, P) rolling correlations
+    """
+    close = np.asarray(close, dtype=np.float64)
+    returns = np.full(close.shape, np.nan)
+    returns[1:] = np.log(close[1:] / close[:-1])
+    # demeaning does not change any correlation and limits cancellation
+    returns = returns - np.nanmean(returns, axis=0)
+    r1, r2 = returns[:, leg1], returns[:, leg2]
+    bad = np.isnan(r1) | np.isnan(r2)
+    r1, r2 = np.where(bad, 0.0, r1), np.where(bad, 0.0, r2)
+
+    corr = np.full(r1.shape, np.nan)
+    if window > r1.shape[0]:
+        return corr
+    zero = np.zeros((1, r1.shape[1]))
+    first, stop = np.arange(r1.shape[0] - window + 1), np.arange(window, r1.shape[0] + 1)
+    sums = {name: _window_sums(np.concatenate([zero, np.cumsum(arr, axis=0)]), first, stop)
+            for name, arr in (('x', r1), ('y', r2), ('xx', r1 * r1), ('yy', r2 * r2),
+                              ('xy', r1 * r2), ('bad', bad))}
+    sxy = sums['xy'] - sums['x'] * sums['y'] / window
+    sxx = sums['xx'] - sums['x'] ** 2 / window
+    syy = sums['yy'] - sums['y'] ** 2 / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr[window - 1:] = np.where(sums['bad'] > 0, np.nan, sxy / np.sqrt(sxx * syy))
+    return corr
+
+
+def _window_sums(cums, starts, stops):
+    """Return sums over rows [start, stop) from a cumulative sum with a leading zero row."""
+    return cums[stops] - cums[starts]
+
+
+def _rolling_cointegration_chunk(y, x, end, window, lag):
+    """Evaluate rolling_cointegration for one chunk of pairs."""
+    # demeaning leaves beta and the residuals unchanged and limits cancellation
+    shift_y, shift_x = np.nanmean(y, axis=0), np.nanmean(x, axis=0)
+    bad = np.isnan(y) | np.isnan(x)
+    y = np.where(bad, 0.0, y - shift_y)
+    x = np.where(bad, 0.0, x - shift_x)
+    n_bars, n_pairs = y.shape
+    zero = np.zeros((1, n_pairs))
+
+    # Engle-Granger sums over the window's bars [end - window + 1, end]
+    first, stop = end - window + 1, end + 1
+    levels = {name: np.concatenate([zero, np.cumsum(arr, axis=0)])
+              for name, arr in (('y', y), ('x', x), ('xx', x * x), ('xy', x * y))}
+    eg = {name: _window_sums(cums, first, stop) for name, cums in levels.items()}
+    nan_count = _window_sums(np.concatenate([zero, np.cumsum(bad, axis=0)]), first, stop)
+    mean_y, mean_x = eg['y'] / window, eg['x'] / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (eg['xy'] - window * mean_x * mean_y) / (eg['xx'] - window * mean_x ** 2)
+    alpha = mean_y - beta * mean_x
+
+    # terms u(s) = [1, y(s-1), x(s-1), dy(s), dx(s), dy(s-1), dx(s-1), ..., dy(s-lag), dx(s-lag)]
+    # for s >= lag + 1; row r of `terms` holds s = r + lag + 1
+    dy, dx = np.diff(y, axis=0), np.diff(x, axis=0)
+    rows = n_bars - 1 - lag
+    terms = [np.ones((rows, n_pairs)), y[lag:-1], x[lag:-1]]
+    for j in range(lag + 1):
+        terms += [dy[lag - j:lag - j + rows], dx[lag - j:lag - j + rows]]
+    terms = np.stack(terms, axis=2)
+    cross = np.cumsum(terms[:, :, :, None] * terms[:, :, None, :], axis=0)
+    cross = np.concatenate([np.zeros((1,) + cross.shape[1:]), cross])
+    # ADF rows of a window are s in [first + lag + 1, end]
+    sums = _window_sums(cross, first, stop - lag - 1)
+
+    # map u onto [d_resid(s), 1, resid(s-1), d_resid(s-1), ..., d_resid(s-lag)]
+    n_terms = terms.shape[2]
+    A = np.zeros(beta.shape + (lag + 3, n_terms))
+    A[..., 0, 3], A[..., 0, 4] = 1.0, -beta
+    A[..., 1, 0] = 1.0
+    A[..., 2, 0], A[..., 2, 1], A[..., 2, 2] = -alpha, 1.0, -beta
+    for j in range(1, lag + 1):
+        A[..., 2 + j, 3 + 2 * j], A[..., 2 + j, 4 + 2 * j] = 1.0, -beta
+    gram = np.einsum('kpam,kpmn,kpbn->kpab', A, sums, A)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xtx, xty, yty = gram[..., 1:, 1:], gram[..., 1:, 0], gram[..., 0, 0]
+        xtx_inv = np.linalg.pinv(xtx, hermitian=True)
+        coef = np.einsum('kpab,kpb->kpa', xtx_inv, xty)
+        ssr = yty - np.einsum('kpa,kpa->kp', xty, coef)
+        sigma2 = ssr / (window - 1 - lag - (lag + 2))
+        tstat = coef[..., 1] / np.sqrt(sigma2 * xtx_inv[..., 1, 1])
+
+    missing = nan_count > 0
+    return {
+        'alpha': np.where(missing, np.nan, alpha + shift_y - beta * shift_x),
+        'beta': np.where(missing, np.nan, beta),
+        'adf_statistic': np.where(missing, np.nan, tstat),
+    }
+
+
+def rolling_cointegration(log_y, log_x, window=252, step=21, lag=1, chunk_size=100):
+    """
+    Rolling Engle-Granger fit and residual ADF test over trailing windows, for many pairs.
+    
+    Every window refits log_y = alpha + beta * log_x on its own bars and runs
+    a fixed-lag ADF test (constant only) on the window's residuals, matching
+    adfuller(resid, maxlag=lag, autolag=None) per window. Instead of one
+    regression per window, cumulative sums of the cross-products of
+    [1, y(t-1), x(t-1), dy(t), dx(t), dy(t-1), dx(t-1), ...] are built once;
+    since the residual and its differences are linear in those terms, each
+    window's ADF normal equations follow from a difference of two cumulative
+    sums, whatever the window length.
+    
+    Args:
+        log_y (np.ndarray): (T, P) log prices of the first legs (1-D is treated as one pair)
+        log_x (np.ndarray): (T, P) log prices of the second legs
+        window (int): Trailing window length in bars (default: 252)
+        step (int): Bars between evaluated windows (default: 21)
+        lag (int): Number of lagged differences in the ADF regression (default: 1)
+        chunk_size (int): Pairs processed together, bounds memory (default: 100)
+        
+    Returns:
+        dict: 'end' (K,) index of each window's last bar and (K, P) arrays 'alpha',
+              'beta', 'adf_statistic' and 'pvalue' (NaN for windows containing a NaN)
+              
+    Raises:
+        ValueError: If the window is too short for the ADF regression
+    """
+    log_y = np.asarray(log_y, dtype=np.float64)
+    log_x = np.asarray(log_x, dtype=np.float64)
+    if log_y.ndim == 1:
+        log_y, log_x = log_y[:, None], log_x[:, None]
+    n_params = lag + 2
+    n_adf = window - 1 - lag
+    if n_adf <= n_params:
+        raise ValueError('window is too short for the ADF regression at this lag')
+
+    n_bars, n_pairs = log_y.shape
+    end = np.arange(window - 1, n_bars, step)
+    keys = ('alpha', 'beta', 'adf_statistic')
+    out = {key: np.full((len(end), n_pairs), np.nan) for key in keys}
+    for start in range(0, n_pairs, chunk_size):
+        cols = slice(start, start + chunk_size)
+        chunk = _rolling_cointegration_chunk(log_y[:, cols], log_x[:, cols], end, window, lag)
+        for key in keys:
+            out[key][:, cols] = chunk[key]
+    out['pvalue'] = mackinnonp(out['adf_statistic'])
+    return {'end': end, **out}
+
+
+def cointegration_gate(rolling, n_bars, significance=0.05):
+    """
+    Expand rolling_cointegration output into a per-bar trading gate.
+    
+    Each window's verdict applies from its last bar until the next evaluated
+    window; bars before the first window are closed. Since a window only uses
+    bars up to its end, the gate carries no lookahead.
+    
+    Args:
+        rolling (dict): Output of rolling_cointegration
+        n_bars (int): Number of bars T in the price history
+        significance (float): Open the gate while the rolling p-value is below this (default: 0.05)
+        
+    Returns:
+        np.ndarray: (T, P) bool, True where the pair may trade
+    """
+    current = np.searchsorted(rolling['end'], np.arange(n_bars), side='right') - 1
+    with np.errstate(invalid='ignore'):
+        passed = rolling['pvalue'] < significance
+    return np.where(current[:, None] >= 0, passed[np.maximum(current, 0)], False)
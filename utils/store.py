@@ -0,0 +1,206 @@
+"""Memory-mapped columnar price store built once from the source data file."""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils.io import load_data
+from utils.preprocess import get_close_cols
+from utils.profiling import logger, timed
+
+
+STORE_VERSION = 1
+
+
+def _default_store_dir(file_path):
+    """Return the store directory that sits next to the source file."""
+    return f'{file_path}.store'
+
+
+def _file_sha256(file_path):
+    """Return the SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(file_path, validate='mtime'):
+    """
+    Return the fields that identify one version of a source data file.
+    
+    Args:
+        file_path (str): Path to the parquet or CSV source file, or a dataset directory
+        validate (str): 'mtime' for mtime and size, or 'hash' to add the SHA-256 (default: 'mtime')
+        
+    Returns:
+        dict: 'mtime_ns', 'size' and, with validate='hash', 'sha256'
+    """
+    if os.path.isdir(file_path):
+        # an ingested dataset changes exactly when its manifest is rewritten
+        file_path = os.path.join(file_path, '_manifest.json')
+    stat = os.stat(file_path)
+    fingerprint = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if validate == 'hash':
+        fingerprint['sha256'] = _file_sha256(file_path)
+    return fingerprint
+
+
+def _write_npy(path, arr):
+    """Save an array under a temporary name and rename it into place."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp_path, path)
+
+
+def build_price_store(file_path, store_dir=None, dtype='float64', validate='mtime'):
+    """
+    Parse the source data file once and write the memory-mappable price store.
+    
+    The store holds the close prices as a column-major (T, N) matrix in
+    close.npy, so each ticker's series is contiguous, the dates in dates.npy
+    and the tickers plus source fingerprint in meta.json. meta.json is
+    written last, so a store without it is treated as missing.
+    
+    Args:
+        file_path (str): Path to the parquet or CSV source file
+        store_dir (str, optional): Output directory. If None, uses '<file_path>.store'.
+        dtype (str): 'float64' or 'float32' for the close matrix (default: 'float64')
+        validate (str): 'mtime' to fingerprint by mtime and size, or 'hash' to
+            also record the SHA-256 of the source (default: 'mtime')
+            
+    Returns:
+        str: Path to the store directory
+    """
+    store_dir = store_dir or _default_store_dir(file_path)
+    os.makedirs(store_dir, exist_ok=True)
+    meta_path = os.path.join(store_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    fingerprint = source_fingerprint(file_path, validate)
+    df = get_close_cols(load_data(file_path))
+    close_cols = [col for col in df.columns if col.startswith('Close__')]
+    close = np.asfortranarray(df[close_cols].to_numpy(dtype=dtype))
+    dates = pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[ns]')
+
+    _write_npy(os.path.join(store_dir, 'close.npy'), close)
+    _write_npy(os.path.join(store_dir, 'dates.npy'), dates)
+    meta = {
+        'version': STORE_VERSION,
+        'source': os.path.abspath(file_path),
+        'source_fingerprint': fingerprint,
+        'dtype': np.dtype(dtype).name,
+        'tickers': [col[len('Close__'):] for col in close_cols],
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    logger.info(f'Built price store for {len(close_cols)} tickers x {len(dates)} rows in {store_dir}')
+    return store_dir
+
+
+def _store_is_fresh(meta, file_path, dtype, validate):
+    """Check a store's metadata against the current source file."""
+    if meta.get('version') != STORE_VERSION or meta.get('dtype') != np.dtype(dtype).name:
+        return False
+    saved = meta['source_fingerprint']
+    if validate == 'hash':
+        return saved.get('sha256') == source_fingerprint(file_path, 'hash')['sha256']
+    current = source_fingerprint(file_path, 'mtime')
+    return saved['mtime_ns'] == current['mtime_ns'] and saved['size'] == current['size']
+
+
+@timed('data_load')
+def open_price_store(file_path, store_dir=None, dtype='float64', validate='mtime'):
+    """
+    Open the price store for a source file, (re)building it if missing or stale.
+    
+    Arrays are memory-mapped read-only, so opening costs no parsing and no
+    copies, and every process that opens the store shares the page cache.
+    
+    Args:
+        file_path (str): Path to the parquet or CSV source file
+        store_dir (str, optional): Store directory. If None, uses '<file_path>.store'.
+        dtype (str): 'float64' or 'float32' for the close matrix (default: 'float64')
+        validate (str): 'mtime' (mtime and size) or 'hash' (SHA-256 of the source)
+            to decide whether the store is stale (default: 'mtime')
+            
+    Returns:
+        dict: 'close' (T, N) memory-mapped matrix, 'dates' (T,) datetime64 array,
+              'tickers' list and 'index' mapping ticker -> column
+    """
+    store_dir = store_dir or _default_store_dir(file_path)
+    meta_path = os.path.join(store_dir, 'meta.json')
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is None or not _store_is_fresh(meta, file_path, dtype, validate):
+        build_price_store(file_path, store_dir, dtype=dtype, validate=validate)
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    tickers = meta['tickers']
+    return {
+        'close': np.load(os.path.join(store_dir, 'close.npy'), mmap_mode='r'),
+        'dates': np.load(os.path.join(store_dir, 'dates.npy'), mmap_mode='r'),
+        'tickers': tickers,
+        'index': {ticker: col for col, ticker in enumerate(tickers)},
+    }
+
+
+@timed('close_extraction')
+def store_close_matrix(store, tickers):
+    """
+    Return the close matrix for the given tickers from an open store.
+    
+    A contiguous run of store columns is returned as a view of the memory
+    map; any other selection is gathered into a new array.
+    
+    Args:
+        store (dict): Output of open_price_store
+        tickers (list): Ticker symbols, in the desired column order
+        
+    Returns:
+        np.ndarray: (T, len(tickers)) close price matrix
+    """
+    cols = [store['index'][ticker] for ticker in tickers]
+    if cols == list(range(cols[0], cols[0] + len(cols))):
+        return store['close'][:, cols[0]:cols[0] + len(cols)]
+    return store['close'][:, cols]
+
+
+def store_to_frame(store):
+    """
+    Wrap an open store as the Date + Close__{TICKER} DataFrame used by utils.
+    
+    The close columns are backed by the memory map rather than copied.
+    
+    Args:
+        store (dict): Output of open_price_store
+        
+    Returns:
+        pd.DataFrame: DataFrame with Date and Close price columns
+    """
+    close = pd.DataFrame(store['close'], columns=[f'Close__{ticker}' for ticker in store['tickers']],
+                         copy=False)
+    close.insert(0, 'Date', pd.DatetimeIndex(store['dates']))
+    return close
+
+
+def load_close_frame(file_path, use_store=False):
+    """
+    Load the Date and Close columns, either by parsing the file or from the price store.
+    
+    Args:
+        file_path (str): Path to the parquet or CSV source file
+        use_store (bool): Open the memory-mapped price store instead of parsing (default: False)
+        
+    Returns:
+        pd.DataFrame: DataFrame with Date and Close price columns
+    """
+    if use_store:
+        return store_to_frame(open_price_store(file_path))
+    return get_close_cols(load_data(file_path))
@@ -0,0 +1,254 @@
+"""Streaming signal engine: one bar in, z-scores, target weights and PnL out for every pair."""
+import asyncio
+import inspect
+import numpy as np
+from utils.backtest import TRADING_DAYS, pair_table
+from utils.config import get_default_tickers, get_stock_data_path
+from utils.io import iter_close_chunks
+from utils.preprocess import get_close_matrix
+from utils.store import load_close_frame
+
+
+class SignalEngine:
+    """
+    Per-pair streaming state kept as a struct of arrays, updated in O(1) per pair per bar.
+    
+    Each pair holds running totals of its shifted spread, squared spread and
+    NaN count plus a ring buffer of those totals over the last window bars,
+    so a window's sums are the current total minus the total window bars ago.
+    These are the same cumulative sums utils.signals.rolling_sums builds
+    offline (the shift is the pair's first valid spread), so z-scores,
+    positions and weights match batch_rolling_zscore, batch_generate_positions
+    and batch_backtest bit for bit.
+    
+    The engine also runs the batch_backtest accounting forward: the previous
+    bar's weights earn this bar's leg returns, the previous bar's turnover is
+    charged now, and equity compounds the daily returns. Daily returns and
+    equity match batch_backtest bit for bit; metrics() keeps running moments,
+    so its Sharpe ratios match to rounding.
+    """
+
+    __slots__ = ('tickers', 'names', 'leg1', 'leg2', 'hedge_ratio', 'intercept', 'window',
+                 'entry', 'exit', 'cost', 'center', 'has_center', 'total', 'total_sq', 'total_nan',
+                 'ring', 'ring_sq', 'ring_nan', 'head', 'bars', 'state', 'w1', 'w2', 'position',
+                 'last_prices', 'turnover_due', 'equity', 'peak', 'max_drawdown', 'moments',
+                 'active_moments', 'turnover', 'num_trades')
+
+    def __init__(self, tickers, pairs, window=60, entry=2.0, exit=0.5, cost=0.0005):
+        """
+        Args:
+            tickers (list): Ticker symbols, in the order of each bar's prices
+            pairs (list or pd.DataFrame): Pair table, see utils.backtest.pair_table
+            window (int): Rolling z-score window in bars (default: 60)
+            entry (float or np.ndarray): Entry threshold, scalar or per-pair (P,) (default: 2.0)
+            exit (float or np.ndarray): Exit threshold, scalar or per-pair (P,) (default: 0.5)
+            cost (float): Cost per unit of weight turnover, as in batch_backtest (default: 0.0005)
+        """
+        legs = pair_table(pairs, tickers)
+        n_pairs = len(legs['names'])
+        self.tickers = list(tickers)
+        self.names = legs['names']
+        self.leg1 = legs['leg1']
+        self.leg2 = legs['leg2']
+        self.hedge_ratio = legs['hedge_ratio']
+        self.intercept = legs['intercept']
+        self.window = window
+        self.entry = np.asarray(entry, dtype=np.float64)
+        self.exit = np.asarray(exit, dtype=np.float64)
+        self.cost = cost
+        self.center = np.zeros(n_pairs)
+        self.has_center = np.zeros(n_pairs, dtype=bool)
+        self.total = np.zeros(n_pairs)
+        self.total_sq = np.zeros(n_pairs)
+        self.total_nan = np.zeros(n_pairs)
+        self.ring = np.zeros((window, n_pairs))
+        self.ring_sq = np.zeros((window, n_pairs))
+        self.ring_nan = np.zeros((window, n_pairs))
+        self.head = 0
+        self.bars = 0
+        self.state = np.zeros(n_pairs)
+        self.w1 = np.zeros(n_pairs)
+        self.w2 = np.zeros(n_pairs)
+        self.position = np.zeros(n_pairs)
+        self.last_prices = np.full(len(self.tickers), np.nan)
+        self.turnover_due = np.zeros(n_pairs)
+        self.equity = np.ones(n_pairs)
+        self.peak = np.full(n_pairs, -np.inf)
+        self.max_drawdown = np.zeros(n_pairs)
+        # (count, mean, M2) of daily returns over valid bars and over valid bars with a position on
+        self.moments = np.zeros((3, n_pairs))
+        self.active_moments = np.zeros((3, n_pairs))
+        self.turnover = np.zeros(n_pairs)
+        self.num_trades = np.zeros(n_pairs, dtype=np.int64)
+
+    def on_bar(self, prices):
+        """
+        Fold one bar into every pair's state and return the new signals.
+        
+        Args:
+            prices (np.ndarray): (N,) close prices in the order of self.tickers (NaN if missing)
+            
+        Returns:
+            dict: (P,) arrays 'zscore', 'position', 'w1', 'w2', 'changed' (indices
+                  of pairs whose target weights differ from the previous bar),
+                  'daily' (this bar's strategy return, 0 where a leg has no return)
+                  and 'equity' (compounded daily returns)
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        log_prices = np.log(prices)
+        spread = log_prices[self.leg1] - (self.intercept + self.hedge_ratio * log_prices[self.leg2])
+        is_nan = np.isnan(spread)
+
+        # the first valid spread of each pair becomes its shift, as in rolling_sums
+        start = ~self.has_center & ~is_nan
+        self.center[start] = spread[start]
+        self.has_center |= start
+        x = spread - self.center
+        filled = np.where(is_nan, 0.0, x)
+        self.total = self.total + filled
+        self.total_sq = self.total_sq + filled ** 2
+        self.total_nan = self.total_nan + is_nan
+
+        # totals from window bars ago leave the window as the new totals enter the ring
+        old, old_sq, old_nan = self.ring[self.head], self.ring_sq[self.head], self.ring_nan[self.head]
+        total = self.total - old
+        total_sq = self.total_sq - old_sq
+        has_nan = (self.total_nan - old_nan) > 0
+        self.ring[self.head] = self.total
+        self.ring_sq[self.head] = self.total_sq
+        self.ring_nan[self.head] = self.total_nan
+        self.head = (self.head + 1) % self.window
+        self.bars += 1
+
+        z = np.full(x.shape, np.nan)
+        if self.bars >= self.window:
+            mean = total / self.window
+            std = np.sqrt(np.maximum(total_sq - total * mean, 0.0) / (self.window - 1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z = np.where(has_nan, np.nan, (x - mean) / std)
+
+        # same hysteresis as batch_generate_positions; a NaN z-score reports flat
+        with np.errstate(invalid='ignore'):
+            self.state = np.where(np.abs(z) < self.exit, 0.0, self.state)
+            self.state = np.where(z < -self.entry, 1.0, self.state)
+            self.state = np.where(z > self.entry, -1.0, self.state)
+        position = np.where(np.isnan(z), 0.0, self.state)
+
+        denom = 1.0 + np.abs(self.hedge_ratio)
+        w1 = position / denom
+        w2 = -self.hedge_ratio * position / denom
+        changed = np.flatnonzero((w1 != self.w1) | (w2 != self.w2))
+        daily = self._book(prices, position, w1, w2)
+        self.w1, self.w2 = w1, w2
+        return {'zscore': z, 'position': position, 'w1': w1, 'w2': w2, 'changed': changed,
+                'daily': daily, 'equity': self.equity}
+
+    def _book(self, prices, position, w1, w2):
+        """Earn this bar's returns on the previous bar's weights and update the PnL state."""
+        returns = prices / self.last_prices - 1.0
+        r1, r2 = returns[self.leg1], returns[self.leg2]
+        # weights set on the previous bar execute now, as do their turnover costs
+        daily = np.nan_to_num(self.w1 * r1 + self.w2 * r2 - self.cost * self.turnover_due, nan=0.0)
+        valid = ~np.isnan(r1) & ~np.isnan(r2)
+        active = valid & ((np.abs(self.w1) + np.abs(self.w2)) > 0.0)
+
+        self.equity = self.equity * (1.0 + daily)
+        self.peak = np.where(valid, np.maximum(self.peak, self.equity), self.peak)
+        with np.errstate(invalid='ignore'):
+            drawdown = (self.equity - self.peak) / self.peak
+        self.max_drawdown = np.where(valid, np.minimum(self.max_drawdown, drawdown), self.max_drawdown)
+        _update_moments(self.moments, daily, valid)
+        _update_moments(self.active_moments, daily, active)
+        self.turnover = self.turnover + np.where(valid, self.turnover_due, 0.0)
+        if self.bars > 1:
+            self.num_trades += position != self.position
+            self.turnover_due = np.abs(w1 - self.w1) + np.abs(w2 - self.w2)
+        self.position = position
+        self.last_prices = prices
+        return daily
+
+    def metrics(self):
+        """
+        Return the headline metrics of batch_backtest over the bars seen so far.
+        
+        Returns:
+            dict: (P,) arrays 'Capital', 'Sharpe', 'SharpeActive', 'TotalReturn',
+                  'MaxDrawdown', 'NumTrades' and 'Turnover'
+        """
+        return {
+            'Capital': 1.0 + np.abs(self.hedge_ratio),
+            'Sharpe': _moments_sharpe(self.moments),
+            'SharpeActive': _moments_sharpe(self.active_moments),
+            'TotalReturn': np.where(self.moments[0] > 0, self.equity - 1.0, 0.0),
+            'MaxDrawdown': self.max_drawdown,
+            'NumTrades': self.num_trades.copy(),
+            'Turnover': self.turnover.copy(),
+        }
+
+
+def _update_moments(moments, values, mask):
+    """Welford update of (count, mean, M2) rows with the values where mask is True."""
+    count = moments[0] + mask
+    delta = np.where(mask, values - moments[1], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = moments[1] + np.where(mask, delta / count, 0.0)
+    moments[2] += np.where(mask, delta * (values - mean), 0.0)
+    moments[0], moments[1] = count, mean
+
+
+def _moments_sharpe(moments):
+    """Annualized Sharpe ratio from (count, mean, M2); 0 where the std is 0 or undefined."""
+    count, mean, m2 = moments
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(m2 / (count - 1))
+        sharpe = mean / std * np.sqrt(TRADING_DAYS)
+    return np.where(std > 0, sharpe, 0.0)
+
+
+async def replay_bars(file_path=None, tickers=None, delay=0.0, use_store=False):
+    """
+    Replay the price file as a local bar feed.
+    
+    Args:
+        file_path (str, optional): Parquet or CSV source. If None, uses the configured path.
+        tickers (list, optional): Tickers in bar order. If None, uses the defaults.
+        delay (float): Seconds to sleep between bars (default: 0.0)
+        use_store (bool): Read prices from the memory-mapped price store (default: False)
+        
+    Yields:
+        tuple: (date, (N,) close prices)
+    """
+    file_path = file_path or get_stock_data_path()
+    tickers = tickers or get_default_tickers()
+    # the file is read chunk by chunk so replays of large files stay in bounded memory
+    chunks = [load_close_frame(file_path, use_store=True)] if use_store else \
+        iter_close_chunks(file_path, tickers)
+    for chunk in chunks:
+        close = get_close_matrix(chunk, tickers)
+        for date, prices in zip(chunk['Date'], close):
+            yield date, prices
+            await asyncio.sleep(delay)
+
+
+async def run_signal_engine(engine, feed, on_signal=None):
+    """
+    Drive an engine from an async bar feed.
+    
+    Args:
+        engine (SignalEngine): Engine to update
+        feed (async iterator): Yields (date, prices) tuples, e.g. replay_bars()
+        on_signal (callable, optional): Called as on_signal(date, signals) after every
+            bar, where signals is the output of SignalEngine.on_bar; may be a coroutine function
+            
+    Returns:
+        int: Number of bars processed
+    """
+    bars = 0
+    async for date, prices in feed:
+        signals = engine.on_bar(prices)
+        bars += 1
+        if on_signal is not None:
+            result = on_signal(date, signals)
+            if inspect.isawaitable(result):
+                await result
+    return bars
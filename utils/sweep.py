@@ -0,0 +1,95 @@
+"""Parameter sweep over z-score window and entry/exit thresholds."""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.backtest import batch_backtest, pair_table
+from utils.signals import rolling_sums, batch_rolling_zscore, batch_generate_positions
+from utils.spread import batch_calculate_spread
+
+
+# Per-process state for sweep workers, set once by _init_sweep_worker
+_SWEEP_STATE = {}
+
+
+def _init_sweep_worker(state):
+    """Store the shared sweep inputs in a worker process."""
+    _SWEEP_STATE.update(state)
+
+
+def _sweep_window(window):
+    """
+    Backtest every entry/exit combination for one z-score window.
+    
+    The z-scores are derived once from the shared cumulative sums and reused
+    for the whole entry/exit grid.
+    """
+    s = _SWEEP_STATE
+    z = batch_rolling_zscore(None, window, sums=s['sums'])
+    in_sample, out_sample = slice(0, s['cut']), slice(s['cut'], None)
+    frames = []
+    for entry in s['entries']:
+        for exit in s['exits']:
+            positions = batch_generate_positions(z, entry, exit)
+            bt = batch_backtest(s['close'], s['tickers'], s['pairs'], positions, cost=s['cost'])
+            for sample, rows in (('IS', in_sample), ('OOS', out_sample)):
+                frame = pd.DataFrame(bt.segment_metrics(rows))
+                frame.insert(0, 'Sample', sample)
+                frame.insert(0, 'Exit', exit)
+                frame.insert(0, 'Entry', entry)
+                frame.insert(0, 'Window', window)
+                frame.insert(0, 'Pair', bt.names)
+                frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parameter_sweep(close, tickers, pairs, windows, entries, exits, cost=0.0005, split=0.7, workers=1):
+    """
+    Backtest every pair over a window x entry x exit grid.
+    
+    Spreads and their cumulative sums and sums of squares are computed once;
+    each window's rolling z-scores follow from them in O(1) per bar and are
+    shared by all entry/exit thresholds. Positions are generated over the
+    full history (z-scores only look back), and metrics are reported
+    separately for the in-sample and out-of-sample bars.
+    
+    Args:
+        close (np.ndarray): (T, N) close price matrix
+        tickers (list): Ticker symbols matching the columns of close
+        pairs (list or pd.DataFrame): Pair table, see utils.backtest.pair_table
+        windows (list): Z-score windows to test
+        entries (list): Entry thresholds to test
+        exits (list): Exit thresholds to test
+        cost (float): Cost per unit of weight turnover (default: 0.0005)
+        split (float): Fraction of bars in the in-sample period (default: 0.7)
+        workers (int): Worker processes; windows are spread over the pool (default: 1)
+        
+    Returns:
+        pd.DataFrame: One row per (Pair, Window, Entry, Exit, Sample) with the
+                      backtest metrics; Sample is 'IS' or 'OOS'
+    """
+    close = np.asarray(close, dtype=np.float64)
+    legs = pair_table(pairs, tickers)
+    spread = batch_calculate_spread(np.log(close), legs['leg1'], legs['leg2'],
+                                    legs['hedge_ratio'], legs['intercept'])
+    state = {
+        'close': close,
+        'tickers': list(tickers),
+        'pairs': pairs,
+        'sums': rolling_sums(spread),
+        'entries': list(entries),
+        'exits': list(exits),
+        'cost': cost,
+        'cut': int(round(close.shape[0] * split)),
+    }
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker,
+                                 initargs=(state,)) as executor:
+            frames = list(executor.map(_sweep_window, windows))
+    else:
+        _init_sweep_worker(state)
+        try:
+            frames = [_sweep_window(window) for window in windows]
+        finally:
+            _SWEEP_STATE.clear()
+    return pd.concat(frames, ignore_index=True)
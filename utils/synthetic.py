@@ -0,0 +1,121 @@
+"""Deterministic synthetic price universes with planted cointegrated pairs."""
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+
+def make_synthetic_universe(n_tickers=20, n_bars=1260, n_pairs=2, freq='B', half_lives=(5.0, 30.0),
+                            spread_std=None, seed=0, start='2020-01-02'):
+    """
+    Generate a random-walk universe in which n_pairs pairs are cointegrated by construction.
+    
+    Every ticker's log price is a Gaussian random walk. For each planted pair
+    (t1, t2), log(t1) = intercept + hedge_ratio * log(t2) + s, where s is an
+    AR(1) (discrete Ornstein-Uhlenbeck) spread with the given half-life in
+    bars and stationary standard deviation spread_std. t1 always precedes
+    t2 in column order, so the scan regresses t1 on t2 as planted. The same
+    arguments always give the same universe.
+    
+    Args:
+        n_tickers (int): Number of tickers (default: 20)
+        n_bars (int): Number of bars (default: 1260)
+        n_pairs (int): Number of planted pairs; needs 2 * n_pairs <= n_tickers (default: 2)
+        freq (str): Bar frequency for the Date column, e.g. 'B' for daily or 'min' (default: 'B')
+        half_lives (tuple): (low, high) range of planted half-lives in bars (default: (5, 30))
+        spread_std (float, optional): Stationary standard deviation of planted spreads.
+            If None, uses 2.5 times the per-bar volatility (0.05 for daily bars).
+        seed (int): Random seed (default: 0)
+        start (str): First date (default: '2020-01-02')
+        
+    Returns:
+        tuple: (df, planted) where df has Date and Close__{TICKER} columns and
+               planted is a DataFrame with columns t1, t2, hedge_ratio,
+               intercept and half_life
+               
+    Raises:
+        ValueError: If 2 * n_pairs exceeds n_tickers
+    """
+    if 2 * n_pairs > n_tickers:
+        raise ValueError(f'{n_pairs} planted pairs need at least {2 * n_pairs} tickers')
+    rng = np.random.default_rng(seed)
+    tickers = [f'S{k:04d}' for k in range(n_tickers)]
+    # about 2% daily volatility, scaled down for intraday bars
+    sigma = 0.02 if freq in ('B', 'D') else 0.02 / np.sqrt(390)
+    log_prices = np.log(rng.uniform(20.0, 200.0, n_tickers)) + \
+        np.cumsum(rng.normal(0.0, sigma, (n_bars, n_tickers)), axis=0)
+    spread_std = 2.5 * sigma if spread_std is None else spread_std
+
+    legs = np.sort(rng.permutation(n_tickers)[:2 * n_pairs].reshape(n_pairs, 2), axis=1)
+    hedge_ratio = rng.uniform(0.5, 1.5, n_pairs)
+    intercept = rng.uniform(-0.5, 0.5, n_pairs)
+    half_life = rng.uniform(half_lives[0], half_lives[1], n_pairs)
+    phi = 0.5 ** (1.0 / half_life)
+    for k, (i, j) in enumerate(legs):
+        shocks = rng.normal(0.0, spread_std * np.sqrt(1.0 - phi[k] ** 2), n_bars)
+        # start from the stationary distribution rather than from zero
+        shocks[0] = rng.normal(0.0, spread_std)
+        spread = lfilter([1.0], [1.0, -phi[k]], shocks)
+        log_prices[:, i] = intercept[k] + hedge_ratio[k] * log_prices[:, j] + spread
+
+    df = pd.DataFrame(np.exp(log_prices), columns=[f'Close__{ticker}' for ticker in tickers])
+    df.insert(0, 'Date', pd.date_range(start, periods=n_bars, freq=freq))
+    planted = pd.DataFrame({
+        't1': [tickers[i] for i in legs[:, 0]],
+        't2': [tickers[j] for j in legs[:, 1]],
+        'hedge_ratio': hedge_ratio,
+        'intercept': intercept,
+        'half_life': half_life,
+    })
+    return df, planted
+
+
+def write_synthetic_universe(file_path, **kwargs):
+    """
+    Generate a synthetic universe and write it as a parquet or CSV data file.
+    
+    Args:
+        file_path (str): Output path ending in .parquet or .csv
+        **kwargs: Arguments of make_synthetic_universe
+        
+    Returns:
+        tuple: (tickers, planted) ticker list in column order and the planted pair table
+        
+    Raises:
+        ValueError: If file type is not supported
+    """
+    df, planted = make_synthetic_universe(**kwargs)
+    if file_path.endswith('.parquet'):
+        df.to_parquet(file_path, engine='fastparquet', index=False)
+    elif file_path.endswith('.csv'):
+        df.to_csv(file_path, index=False)
+    else:
+        raise ValueError(f'Unsupported file type: {file_path}')
+    return [col.split('__', 1)[1] for col in df.columns[1:]], planted
+
+
+def planted_pair_recall(copairs, planted, max_hedge_error=0.1):
+    """
+    Check a scan's pairs against the planted ones.
+    
+    A planted pair counts as recovered if it is among copairs with an
+    estimated hedge ratio within max_hedge_error of the planted one.
+    
+    Args:
+        copairs (list): Pair dictionaries as returned by find_cointegrated_pairs
+        planted (pd.DataFrame): Planted pair table from make_synthetic_universe
+        max_hedge_error (float): Largest accepted absolute hedge ratio error (default: 0.1)
+        
+    Returns:
+        dict: 'recall' share of planted pairs recovered, 'found' count and
+              'hedge_ratio_error' median absolute error over the planted pairs found
+    """
+    estimated = {tuple(pair['tickers']): pair['hedge_ratio'] for pair in copairs}
+    errors = np.array([abs(estimated[(t1, t2)] - beta)
+                       for t1, t2, beta in zip(planted['t1'], planted['t2'], planted['hedge_ratio'])
+                       if (t1, t2) in estimated])
+    found = int(np.sum(errors <= max_hedge_error))
+    return {
+        'recall': found / len(planted) if len(planted) else 1.0,
+        'found': found,
+        'hedge_ratio_error': float(np.median(errors)) if len(errors) else float('nan'),
+    }